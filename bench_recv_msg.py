@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# This code compares the message throughput of recv_msg against the original
+# brace-counting implementation on fragmented and coalesced input
+
+import time
+import json
+from solstis_functions import *
+
+#User parameters
+NUM_MESSAGES = 20000
+FRAGMENT_SIZE = 16 #Bytes per read for the fragmented case
+COALESCED_SIZE = 1024 #Bytes per read for the coalesced case
+REPEATS = 3 #Best of this many runs is reported
+
+class FakeSocket:
+  """Socket stand-in that returns a prepared byte stream in fixed-size reads"""
+  def __init__(self,data,chunk_size):
+    self.chunks = [data[i:i+chunk_size] for i in range(0,len(data),chunk_size)]
+    self.index = 0
+
+  def recv(self,bufsize):
+    chunk = self.chunks[self.index]
+    self.index += 1
+    return chunk
+
+  def recv_into(self,buf):
+    chunk = self.chunks[self.index]
+    self.index += 1
+    n = len(chunk)
+    buf[:n] = chunk
+    return n
+
+#Original implementation of recv_msg kept for comparison
+legacy_next_data = ''
+def legacy_recv_msg(s,timeout=10.):
+  global legacy_next_data
+  i = 0 #Index
+  open_brc_count = 1 #Open Brace Count
+  close_brc_count = 0 #Closing brace count
+  data = legacy_next_data
+  if len(data) > 0:
+    if data[0] != "{":
+      raise SolstisError("Stored data from previous TCP/IP is invalid.")
+    for i in range(1,len(data)):
+      if data[i] == "{":
+        open_brc_count += 1
+      elif data[i] == "}":
+        close_brc_count += 1
+        if close_brc_count == open_brc_count:
+          legacy_next_data = data[i+1:len(data)]
+          data = data[0:i+1]
+          return json.loads(data)
+  init_time = time.perf_counter()
+  while len(data) == 0:
+    data += s.recv(1024).decode('utf8')
+    if time.perf_counter() - init_time > timeout:
+      raise TimeoutError()
+  if i == 0:
+    if data[0] != "{":
+      raise SolstisError("Received data from TCP/IP is invalid.")
+  while True:
+    if len(data) > i+1:
+      for i in range(i+1,len(data)):
+        if data[i] == "{":
+          open_brc_count += 1
+        elif data[i] == "}":
+          close_brc_count += 1
+          if close_brc_count == open_brc_count:
+            legacy_next_data = data[i+1:len(data)]
+            data = data[0:i+1]
+            return json.loads(data)
+    data += s.recv(1024).decode('utf8')
+    if time.perf_counter() - init_time > timeout:
+      raise TimeoutError()
+
+def make_stream(num_messages):
+  """Builds a stream alternating automatic_output and get_status replies"""
+  auto = {"message": {"transmission_id": [1], "op": "automatic_output",
+                      "parameters": {"wavelength": [778.123456],
+                                     "status": "scan"}}}
+  status = {"message": {"transmission_id": [1], "op": "get_status_reply",
+            "parameters": {"status": [0], "wavelength": [778.123456],
+                           "temperature": [22.5], "temperature_status": "on",
+                           "etalon_lock": "on", "etalon_voltage": [101.3],
+                           "cavity_lock": "on", "resonator_voltage": [45.2],
+                           "ecd_lock": "not_fitted",
+                           "ecd_voltage": "not_fitted",
+                           "output_monitor": [2.31], "etalon_pd_dc": [0.87],
+                           "dither": "off"}}}
+  frames = [json.dumps(auto).encode('utf8'),json.dumps(status).encode('utf8')]
+  return b''.join(frames[i % 2] for i in range(num_messages))
+
+def run(recv,data,chunk_size,num_messages):
+  s = FakeSocket(data,chunk_size)
+  init_time = time.perf_counter()
+  for i in range(num_messages):
+    recv(s)
+  return num_messages/(time.perf_counter() - init_time)
+
+if __name__ == "__main__":
+  data = make_stream(NUM_MESSAGES)
+  for name, chunk_size in (("fragmented",FRAGMENT_SIZE),
+                           ("coalesced",COALESCED_SIZE)):
+    legacy = 0
+    current = 0
+    for i in range(REPEATS):
+      legacy_next_data = ''
+      legacy = max(legacy,run(legacy_recv_msg,data,chunk_size,NUM_MESSAGES))
+      current = max(current,run(recv_msg,data,chunk_size,NUM_MESSAGES))
+    print("%-10s  legacy: %9.0f msg/s  recv_msg: %9.0f msg/s  (x%.1f)"
+          % (name,legacy,current,current/legacy))
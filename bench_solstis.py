@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+# Benchmark suite for the command and streaming paths, run against the local
+# controller simulator. Results are written as JSON so that runs on different
+# commits can be compared:
+#   python3 bench_solstis.py --output bench_output.json
+
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import numpy as np
+import solstis_functions
+from solstis_functions import *
+from solstis_sim import SolstisSimulator
+from bench_recv_msg import FakeSocket
+
+#Every command function with the arguments used to benchmark it
+COMMANDS = [
+  ("start_link", ()),
+  ("set_wave_m", (780.,)),
+  ("poll_wave_m", ()),
+  ("move_wave_t", (780.,)),
+  ("poll_move_wave_t", ()),
+  ("scan_stitch_initialize", (TeraScan.SCAN_TYPE_FINE,780.,781.,
+                              TeraScan.SCAN_RATE_FINE_LINE_1_GHZ)),
+  ("scan_stitch_status", (TeraScan.SCAN_TYPE_FINE,)),
+  ("terascan_output", (None,False)),
+  ("get_status", ()),
+  ("tune_etalon", (50.,)),
+  ("tune_resonator", (50.,)),
+  ("fine_tune_resonator", (50.,)),
+  ("etalon_lock", (True,)),
+  ("fast_scan_start", ("etalon_continuous",0.01,0.01)),
+  ("fast_scan_poll", ()),
+  ("fast_scan_stop", ()),
+  ("fast_scan_stop_nr", ()),
+  ("set_wave_tolerance_m", (0.01,)),
+]
+
+def percentiles(samples):
+  samples = np.asarray(samples)*1e6
+  return {"n": len(samples),
+          "mean_us": float(samples.mean()),
+          "p50_us": float(np.percentile(samples,50)),
+          "p90_us": float(np.percentile(samples,90)),
+          "p99_us": float(np.percentile(samples,99)),
+          "max_us": float(samples.max())}
+
+def bench_latency(sock,iterations):
+  """Round-trip latency percentiles of every command function"""
+  results = {}
+  for name, args in COMMANDS:
+    func = globals()[name]
+    samples = []
+    for i in range(iterations):
+      t0 = time.perf_counter()
+      func(sock,*args)
+      samples.append(time.perf_counter() - t0)
+    results[name] = percentiles(samples)
+  return results
+
+def bench_get_status_rate(sock,duration):
+  """Sustained sequential get_status polls per second"""
+  n = 0
+  t0 = time.perf_counter()
+  while time.perf_counter() - t0 < duration:
+    get_status(sock)
+    n += 1
+  return {"polls_per_s": n/(time.perf_counter() - t0)}
+
+def bench_auto_output(num_messages):
+  """recv_auto_output messages per second on a burst written at once"""
+  a, b = socket.socketpair()
+  msg = json.dumps({"message": {"transmission_id": [0],
+                                "op": "automatic_output",
+                                "parameters": {"wavelength": [780.123456],
+                                               "status": "scan"}}})
+  burst = msg.encode('utf8')*num_messages
+  writer = threading.Thread(target=b.sendall,args=(burst,),daemon=True)
+  t0 = time.perf_counter()
+  writer.start()
+  for i in range(num_messages):
+    recv_auto_output(a)
+  elapsed = time.perf_counter() - t0
+  writer.join()
+  a.close()
+  b.close()
+  return {"messages": num_messages, "messages_per_s": num_messages/elapsed}
+
+def bench_parse(num_messages):
+  """recv_msg parse throughput versus message size and read size"""
+  results = []
+  for size in (128,512,2048,8192):
+    pad = "x"*max(size - 90,0)
+    frame = json.dumps({"message": {"transmission_id": [1],
+                                    "op": "get_status_reply",
+                                    "parameters": {"status": [0],
+                                                   "pad": pad}}})
+    data = frame.encode('utf8')*num_messages
+    for chunk_size in (16,256,4096):
+      s = FakeSocket(data,chunk_size)
+      t0 = time.perf_counter()
+      for i in range(num_messages):
+        recv_msg(s)
+      elapsed = time.perf_counter() - t0
+      results.append({"message_bytes": len(frame),
+                      "read_bytes": chunk_size,
+                      "messages_per_s": num_messages/elapsed,
+                      "mb_per_s": len(data)/elapsed/1e6})
+  return results
+
+def bench_sweep(sock,num_steps=51,start=775.5,stop=780.5):
+  """Time to complete the standard sweep of test_sweep.py"""
+  wavelengths = np.linspace(start,stop,num=num_steps)
+  t0 = time.perf_counter()
+  set_wave_m(sock,start)
+  while not poll_wave_m(sock)[1]:
+    pass
+  for i in range(1,num_steps):
+    set_wave_m_f_r(sock,wavelengths[i])
+    while not poll_wave_m(sock)[1]:
+      pass
+  return {"steps": num_steps, "seconds": time.perf_counter() - t0}
+
+class _Capture(SolstisCommands):
+  """Returns the op and parameters of each command instead of sending it"""
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    return op, params, result
+
+class _ReplyCapture:
+  """Stands in for a simulator connection, keeping the frames sent to it"""
+  def __init__(self):
+    self.frames = []
+
+  def send(self,op,transmission_id,params):
+    self.frames.append(json.dumps({"message": {"transmission_id":
+                                               [transmission_id],
+                                               "op": op,
+                                               "parameters": params}}
+                                  ).encode('utf8'))
+
+def legacy_encode(op,params,transmission_id):
+  """Request encoding before the message templates"""
+  message = {"transmission_id": [transmission_id], "op": op}
+  if params is not None:
+    message["parameters"] = params
+  return json.dumps({"message": message}).encode('utf8')
+
+def per_call(func,args,iterations):
+  t0 = time.perf_counter()
+  for i in range(iterations):
+    func(*args)
+  return (time.perf_counter() - t0)/iterations*1e6
+
+def bench_codec(iterations):
+  """Encode and decode cost of every command in microseconds"""
+  backends = ["json"] + ([] if solstis_functions.orjson is None
+                         else ["orjson"])
+  default = solstis_functions.JSON_BACKEND
+  sim = SolstisSimulator(settle_time=0.)
+  conn = _ReplyCapture()
+  capture = _Capture()
+  results = {}
+  for name, args in COMMANDS:
+    op, params, result = getattr(capture,name)(*args)
+    request = encode_message(op,params,1)
+    sim.handle_message(conn,request)
+    reply = conn.frames[-1]
+    val = {"request_bytes": len(request),
+           "reply_bytes": len(reply),
+           "legacy_encode_us": per_call(legacy_encode,(op,params,1),
+                                        iterations),
+           #Scalar parameters are spliced in without the JSON backend
+           "encode_us": per_call(encode_message,(op,params,1),iterations)}
+    for backend in backends:
+      set_json_backend(backend)
+      decode = lambda: result(decode_message(reply)["message"]["parameters"])
+      try:
+        decode()
+      except SolstisError:
+        pass
+      else:
+        val["decode_us_"+backend] = per_call(decode,(),iterations)
+    results[name] = val
+  set_json_backend(default)
+  return results
+
+def bench_backend_encode(iterations):
+  """Encode cost in microseconds of parameters encoded by the JSON backend
+  (lists and dicts)
+  """
+  default = solstis_functions.JSON_BACKEND
+  backends = ["json"] + ([] if solstis_functions.orjson is None
+                         else ["orjson"])
+  params = {"wavelengths": [780. + 0.001*i for i in range(64)],
+            "settings": {"etalon": 50., "resonator": 50., "lock": "on"}}
+  results = {}
+  for backend in backends:
+    set_json_backend(backend)
+    results["encode_us_"+backend] = per_call(encode_message,
+                                             ("sweep",params,1),iterations)
+  set_json_backend(default)
+  return results
+
+def bench_reconnect(port,drops):
+  """Stall seen by get_status when the link drops just before it"""
+  #Imported here so the other benchmarks do not depend on the supervisor
+  from solstis_supervisor import SupervisedClient
+  client = SupervisedClient('127.0.0.1',port,backoff_min=0.01)
+  client.connect()
+  client.start_link()
+  client.set_wave_tolerance_m(0.01)
+  stalls = []
+  for i in range(drops):
+    client.sock.shutdown(socket.SHUT_RDWR)
+    t0 = time.perf_counter()
+    client.get_status()
+    stalls.append(time.perf_counter() - t0)
+  client.close()
+  results = percentiles(stalls)
+  results["recovery"] = percentiles([val[1] for val in client.recoveries])
+  return results
+
+def git_commit():
+  try:
+    return subprocess.check_output(["git","rev-parse","HEAD"],
+                                   stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError,subprocess.CalledProcessError):
+    return None
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Solstis benchmark suite")
+  parser.add_argument("--output",default=None,help="JSON file to write")
+  parser.add_argument("--iterations",type=int,default=200,
+                      help="Round trips per command for latency")
+  parser.add_argument("--duration",type=float,default=2.,
+                      help="Seconds of get_status polling")
+  parser.add_argument("--messages",type=int,default=20000,
+                      help="Messages for the streaming and parse benchmarks")
+  parser.add_argument("--latency",type=float,default=0.,
+                      help="Simulated controller reply delay in seconds")
+  parser.add_argument("--tune-rate",type=float,default=50.,
+                      help="Simulated tuning speed in nm/s")
+  args = parser.parse_args()
+
+  results = {"commit": git_commit(),
+             "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "python": sys.version.split()[0],
+             "platform": platform.platform(),
+             "simulator": {"latency": args.latency,
+                           "tune_rate": args.tune_rate}}
+  with SolstisSimulator(latency=args.latency,
+                        tune_rate=args.tune_rate,
+                        settle_time=0.) as sim:
+    sock = init_socket('127.0.0.1',sim.port)
+    start_link(sock)
+    results["latency"] = bench_latency(sock,args.iterations)
+    results["get_status"] = bench_get_status_rate(sock,args.duration)
+    results["sweep"] = bench_sweep(sock)
+    results["reconnect"] = bench_reconnect(sim.port,50)
+    sock.close()
+  results["auto_output"] = bench_auto_output(args.messages)
+  results["parse"] = bench_parse(args.messages//10)
+  results["codec"] = bench_codec(args.messages)
+  results["backend_encode"] = bench_backend_encode(args.messages)
+
+  text = json.dumps(results,indent=2)
+  if args.output is None:
+    print(text)
+  else:
+    with open(args.output,'w') as f:
+      f.write(text)
+    print("Results written to",args.output)
@@ -2,14 +2,14 @@
 # This code logs the Photodiode output data from the Solstis periodically
 
 #User parameters
-PERIOD = 1 #Seconds
+MIN_PERIOD = 0.05 #Seconds between samples while the output is changing
+MAX_PERIOD = 1 #Seconds between samples while the output is flat
 SAVE_EVERY_N_SAMPLES = 10
 DATAFILE = 'PD_output'
 
 from solstis_functions import *
+from solstis_telemetry import AdaptivePoller, TelemetryRecorder
 import time
-import numpy as np
-import matplotlib.pyplot as plt
 
 #Initialize socket
 sock = init_socket()
@@ -17,25 +17,23 @@ sock = init_socket()
 #Start Link
 start_link(sock,ip_address='192.168.1.100')
 
-#Initialize variables
-i = 0
-data = np.array([])
-data_t = np.array([])
+#Poll faster while the output or lock states change
+poller = AdaptivePoller(client_for(sock),min_period=MIN_PERIOD,
+                        max_period=MAX_PERIOD)
+
+#Samples are appended to the log file, which keeps growing across runs and
+#can be read with solstis_telemetry.TelemetryReader while logging
+recorder = TelemetryRecorder(DATAFILE+'.tlm',flush_every=SAVE_EVERY_N_SAMPLES)
+
+#Sample times are perf_counter times, logged as time.time()
+offset = time.time() - time.perf_counter()
 
 #Start Loop
 try:
-  init_time = time.perf_counter()
-  while True:
-    val = get_status(sock)
-    data = np.append(data,val["output_monitor"])
-    data_t = np.append(data_t,time.perf_counter()-init_time)
+  for t, val in poller:
+    recorder.append(t + offset,val)
     print(val["output_monitor"], ", Press ctrl+C to terminate the program.")
-    i += 1
-    if i % SAVE_EVERY_N_SAMPLES == 0:
-      np.savetxt(DATAFILE+'.npy',data)
-      np.savetxt(DATAFILE+"_t.npy",data_t)
-    time.sleep(PERIOD)
 except KeyboardInterrupt:
-  np.savetxt(DATAFILE,data)
-  np.savetxt(DATAFILE+"_t",data_t)
-  
+  pass
+finally:
+  recorder.close()
@@ -0,0 +1,226 @@
+# asyncio client for the Solstis allowing several commands to be in flight on
+# one link and several lasers to share a single event loop
+
+import time
+import asyncio
+from solstis_functions import (FrameDecoder, SolstisCommands, SolstisError,
+                               MAX_ABANDONED_REPORTS, verify_msg,
+                               decode_message, _auto_output_result)
+
+class AsyncSolstisClient(SolstisCommands):
+  """asyncio connection to a single Solstis controller
+
+  Every command of SolstisCommands is available as a coroutine, e.g.
+  "await client.get_status()". A background task reads the stream and
+  resolves the pending command whose transmission ID matches each reply, so
+  status polls, fast scan polls and TeraScan control may be awaited
+  concurrently on the same link. Automatic output messages are queued for
+  recv_auto_output. If the link fails, every pending command and
+  recv_auto_output raise the error.
+
+  Attributes:
+    address ~ (str) IP address of the Solstis
+    port ~ (int) TCP port of the Solstis
+    ip_address ~ (str) IP address of this computer sent with start_link
+    timeout ~ (float) Seconds to wait for each reply
+    debug ~ (Boolean) True to print every outgoing message
+    metrics ~ solstis_metrics.ClientMetrics recording the traffic and
+              latencies of this client, None to not record them
+    trace ~ solstis_trace.WireTrace recording every frame sent and received,
+            None to not trace
+  """
+  def __init__(self,
+               address='192.168.1.222',
+               port=39933,
+               ip_address='192.168.1.107',
+               timeout=10.,
+               debug=False,
+               metrics=None,
+               trace=None):
+    self.address = address
+    self.port = port
+    self.ip_address = ip_address
+    self.timeout = timeout
+    self.debug = debug
+    self.metrics = metrics
+    self.trace = trace
+    self.decoder = FrameDecoder()
+    self._reader = None
+    self._writer = None
+    self._read_task = None
+    self._pending = {} #transmission_id -> future of the reply
+    self._reports = {} #transmission_id -> future of the final report
+    #IDs of commands that stopped waiting for their final report, oldest
+    #first; their late reports are dropped
+    self._abandoned = {}
+    #Automatic output messages, or the exception that failed the link
+    self._auto_output = asyncio.Queue()
+
+  async def connect(self):
+    """Opens the TCP connection to the Solstis
+
+    Returns:
+      The client itself
+    """
+    self.decoder.clear()
+    self._auto_output = asyncio.Queue()
+    self._reader, self._writer = await asyncio.open_connection(self.address,
+                                                               self.port)
+    self._read_task = asyncio.ensure_future(self._read_loop())
+    return self
+
+  async def close(self):
+    """Closes the TCP connection to the Solstis"""
+    if self._read_task is not None:
+      self._read_task.cancel()
+      self._read_task = None
+    if self._writer is not None:
+      self._writer.close()
+      try:
+        await self._writer.wait_closed()
+      except ConnectionError:
+        pass
+      self._writer = None
+    self._fail_pending(ConnectionError("Connection to the Solstis closed."))
+
+  async def __aenter__(self):
+    if self._writer is None:
+      await self.connect()
+    return self
+
+  async def __aexit__(self,exc_type,exc_value,traceback):
+    await self.close()
+
+  def _fail_pending(self,exc):
+    for futures in (self._pending,self._reports):
+      for future in futures.values():
+        if not future.done():
+          future.set_exception(exc)
+      futures.clear()
+    #Wakes up recv_auto_output, which passes it on to any other waiter
+    self._auto_output.put_nowait(exc)
+
+  async def _read_loop(self):
+    try:
+      while True:
+        data = await self._reader.read(4096)
+        if not data:
+          raise ConnectionError("Connection closed by the Solstis.")
+        self.decoder.feed(data)
+        for frame in self.decoder:
+          if self.metrics is None:
+            msg = decode_message(frame)
+          else:
+            t0 = time.perf_counter()
+            msg = decode_message(frame)
+            self.metrics.received(len(frame),time.perf_counter() - t0)
+          if self.trace is not None:
+            self.trace.received(msg["message"]["op"],frame)
+          self._dispatch(msg)
+    except asyncio.CancelledError:
+      raise
+    except Exception as exc:
+      self._fail_pending(exc)
+
+  def _dispatch(self,msg):
+    """Routes a received message to the coroutine waiting for it"""
+    op = msg["message"]["op"]
+    if op == "automatic_output":
+      self._auto_output.put_nowait(msg)
+      if self.metrics is not None:
+        self.metrics.auto_output(None)
+      return
+    transmission_id = msg["message"]["transmission_id"][0]
+    if op.endswith("_f_r"):
+      futures = self._reports
+      if transmission_id in self._abandoned and transmission_id not in futures:
+        del self._abandoned[transmission_id]
+        return
+      if transmission_id not in futures and len(futures) > 0:
+        #Route a report with an ID this client never issued to the oldest
+        #waiting command
+        transmission_id = next(iter(futures))
+    else:
+      futures = self._pending
+    future = futures.pop(transmission_id,None)
+    if future is not None and not future.done():
+      future.set_result(msg)
+
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    return self._request(op,params,result,transmission_id,report)
+
+  async def _request(self,op,params,result,transmission_id,report):
+    if self._read_task is None or self._read_task.done():
+      raise ConnectionError("Not connected to the Solstis.")
+    if transmission_id is None:
+      transmission_id = self.next_transmission_id()
+      while (transmission_id in self._pending or
+             transmission_id in self._reports or
+             transmission_id in self._abandoned):
+        transmission_id = self.next_transmission_id()
+    elif transmission_id in self._pending or transmission_id in self._reports:
+      raise SolstisError("Transmission ID "+str(transmission_id)+
+                         " is already in use.")
+    self._abandoned.pop(transmission_id,None)
+    loop = asyncio.get_running_loop()
+    reply = self._pending[transmission_id] = loop.create_future()
+    if report is not None:
+      final = self._reports[transmission_id] = loop.create_future()
+    try:
+      data = self._encode(op,params,transmission_id)
+      sent = time.perf_counter()
+      self._writer.write(data)
+      await self._writer.drain()
+      if self.metrics is not None:
+        self.metrics.sent(len(data))
+      if self.trace is not None:
+        self.trace.sent(op,data)
+      val = await self._wait_reply(op,reply,sent)
+      verify_msg(val,transmission_id=transmission_id,op=op+"_reply")
+      val = result(val["message"]["parameters"])
+      if report is None:
+        return val
+      val = await self._wait_reply(op+"_f_r",final,sent)
+      verify_msg(val,op=op+"_f_r")
+      return report(val["message"]["parameters"])
+    finally:
+      self._pending.pop(transmission_id,None)
+      if (self._reports.pop(transmission_id,None) is not None and
+          (final.cancelled() or not final.done())):
+        #Timed out or cancelled, the report may still come
+        self._abandoned[transmission_id] = None
+        if len(self._abandoned) > MAX_ABANDONED_REPORTS:
+          del self._abandoned[next(iter(self._abandoned))]
+
+  async def _wait_reply(self,op,future,sent):
+    try:
+      val = await asyncio.wait_for(future,self.timeout)
+    except asyncio.TimeoutError:
+      if self.metrics is not None:
+        self.metrics.timeout(op)
+      raise
+    if self.metrics is not None:
+      self.metrics.reply(op,time.perf_counter() - sent)
+    return val
+
+  async def recv_auto_output(self,timeout=None):
+    """Receives an automatic message from the Solstis during a TeraScan
+
+    Parameters:
+      timeout ~ (float) Seconds to wait, defaults to self.timeout
+    Returns:
+      Dictionary with "wavelength" and "status", see
+      SolstisClient.recv_auto_output
+    Raises:
+      SolstisError on bad transmission
+      TimeoutError when no message arrived within timeout
+      The error that failed the link, e.g. ConnectionError
+    """
+    if timeout is None:
+      timeout = self.timeout
+    val = await asyncio.wait_for(self._auto_output.get(),timeout)
+    if isinstance(val,Exception):
+      self._auto_output.put_nowait(val)
+      raise val
+    verify_msg(val,op="automatic_output")
+    return _auto_output_result(val["message"]["parameters"])
@@ -0,0 +1,161 @@
+# Cache of the read-only Solstis status commands shared by several consumers
+
+import time
+import threading
+from concurrent.futures import Future
+from solstis_functions import COMMANDS
+
+#Read-only commands answered from the cache
+CACHED_COMMANDS = ("get_status", "poll_wave_m", "scan_stitch_status")
+
+#Client methods besides COMMANDS that clear the cache
+_MOVES = ("start_set_wave_m", "start_move_wave_t")
+
+class CachedClient:
+  """Front for a SolstisClient answering status commands from a cache
+
+  get_status, poll_wave_m and scan_stitch_status return the last reply if it
+  is younger than the command's TTL. When it is older, the first caller sends
+  the command and any other thread asking for the same command meanwhile
+  waits for that reply instead of sending its own, so the controller sees at
+  most one request per command and TTL however many threads poll.
+
+  fetch() returns the age of the value with it. All other commands are
+  passed on to the client and clear the cache, since they may change what
+  the status commands report. With serve_stale True a failed refresh
+  returns the last value, whose age then shows how stale it is.
+
+  Example:
+    cache = CachedClient(client,ttl=0.1)
+    status = cache.get_status() #From any number of threads
+    (wavelength, done), age = cache.fetch("poll_wave_m")
+
+  Attributes:
+    client ~ SolstisClient sending the commands
+    ttl ~ (float) Seconds a reply is served from the cache
+    ttls ~ (dict) Command name -> TTL overriding ttl for that command
+    serve_stale ~ (Boolean) True to return the last value when a refresh
+                  fails with a connection error or timeout
+    hits ~ (int) Calls answered from the cache
+    misses ~ (int) Calls that sent the command
+    coalesced ~ (int) Calls that waited for another thread's request
+  """
+  def __init__(self,client,ttl=0.05,ttls=None,serve_stale=False):
+    self.client = client
+    self.ttl = ttl
+    self.ttls = {} if ttls is None else dict(ttls)
+    self.serve_stale = serve_stale
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self._values = {} #(command, args) -> (value, perf_counter time received)
+    self._pending = {} #(command, args) -> Future of (value, time received)
+    self._generation = 0 #Incremented by invalidate()
+    self._lock = threading.Lock()
+
+  def fetch(self,command,*args,max_age=None):
+    """Returns the value of a cached command together with its age
+
+    Parameters:
+      command ~ (str) One of CACHED_COMMANDS
+      args ~ Arguments of the command, e.g. the scan type of
+             scan_stitch_status
+      max_age ~ (float) Oldest value in seconds accepted, defaults to the TTL
+                of the command; 0 always sends the command (coalesced with
+                requests already in flight)
+    Returns:
+      Tuple of (result of the command, seconds since its reply was received)
+    Raises:
+      Whatever the command raised, to every caller waiting for it
+    """
+    if command not in CACHED_COMMANDS:
+      raise ValueError(command+" is not a cached command")
+    if max_age is None:
+      max_age = self.ttls.get(command,self.ttl)
+    key = (command,args)
+    with self._lock:
+      now = time.perf_counter()
+      entry = self._values.get(key)
+      if entry is not None and now - entry[1] <= max_age:
+        self.hits += 1
+        return entry[0], now - entry[1]
+      future = self._pending.get(key)
+      leader = future is None
+      if leader:
+        future = self._pending[key] = Future()
+        generation = self._generation
+        self.misses += 1
+      else:
+        self.coalesced += 1
+    if leader:
+      try:
+        value = getattr(self.client,command)(*args)
+      except BaseException as exc:
+        with self._lock:
+          del self._pending[key]
+        future.set_exception(exc)
+        return self._stale(key,exc)
+      received = time.perf_counter()
+      with self._lock:
+        #A reply to a request sent before an invalidate() is not cached
+        if generation == self._generation:
+          self._values[key] = (value,received)
+        del self._pending[key]
+      future.set_result((value,received))
+      return value, 0.
+    try:
+      value, received = future.result()
+    except BaseException as exc:
+      return self._stale(key,exc)
+    return value, time.perf_counter() - received
+
+  def _stale(self,key,exc):
+    """Returns the last value of key after a failed refresh, or raises exc"""
+    if self.serve_stale and isinstance(exc,OSError):
+      with self._lock:
+        entry = self._values.get(key)
+      if entry is not None:
+        return entry[0], time.perf_counter() - entry[1]
+    raise exc
+
+  def age(self,command,*args):
+    """Returns the age in seconds of the cached value, None if there is none
+    """
+    with self._lock:
+      entry = self._values.get((command,args))
+    if entry is None:
+      return None
+    return time.perf_counter() - entry[1]
+
+  def invalidate(self,command=None):
+    """Drops the cached values of a command, or of all commands if None"""
+    with self._lock:
+      self._generation += 1
+      if command is None:
+        self._values.clear()
+      else:
+        for key in [key for key in self._values if key[0] == command]:
+          del self._values[key]
+
+  def get_status(self):
+    """Cached SolstisCommands.get_status"""
+    return self.fetch("get_status")[0]
+
+  def poll_wave_m(self):
+    """Cached SolstisCommands.poll_wave_m"""
+    return self.fetch("poll_wave_m")[0]
+
+  def scan_stitch_status(self,scan_type):
+    """Cached SolstisCommands.scan_stitch_status"""
+    return self.fetch("scan_stitch_status",scan_type)[0]
+
+  def __getattr__(self,name):
+    attr = getattr(self.client,name)
+    if name not in COMMANDS and name not in _MOVES:
+      return attr
+    def command(*args,**kwargs):
+      try:
+        return attr(*args,**kwargs)
+      finally:
+        self.invalidate()
+    return command
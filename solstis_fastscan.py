@@ -0,0 +1,193 @@
+# Tiling of wide wavelength ranges with Solstis fast scans
+
+import math
+import time
+import numpy as np
+
+#Speed of light in nm*GHz
+C_NM_GHZ = 299792458.
+
+TILE_DTYPE = np.dtype([("centre", "f8"), #Wavelength tuned to in nm
+                       ("centre_ghz", "f8"),
+                       ("low_ghz", "f8"), #Lowest frequency covered
+                       ("high_ghz", "f8")]) #Highest frequency covered
+
+class FastScanPlan:
+  """Fast scan windows covering a wavelength range
+
+  Attributes:
+    scan_type ~ Fast scan type, see SolstisCommands.fast_scan_start
+    width ~ (float) Width of each scan in GHz
+    duration ~ (float) Duration of each scan in seconds
+    tiles ~ NumPy structured array of TILE_DTYPE in order of increasing
+            frequency
+  """
+  def __init__(self,scan_type,width,duration,tiles):
+    self.scan_type = scan_type
+    self.width = width
+    self.duration = duration
+    self.tiles = tiles
+
+  def __len__(self):
+    return len(self.tiles)
+
+  @property
+  def overlap(self):
+    """Overlap between neighbouring tiles in GHz"""
+    if len(self.tiles) < 2:
+      return 0.
+    return float(self.tiles["high_ghz"][0] - self.tiles["low_ghz"][1])
+
+def plan_tiles(start,
+               stop,
+               width,
+               scan_type="etalon_continuous",
+               overlap=0.1,
+               duration=0.01):
+  """Computes the fewest fast scan windows covering a wavelength range
+
+  Neighbouring windows overlap by at least overlap times the width. The
+  windows are then spread evenly over the range, so any slack goes into extra
+  overlap instead of scanning past the ends.
+
+  Parameters:
+    start ~ (float) One end of the range in nm
+    stop ~ (float) Other end of the range in nm
+    width ~ (float) Largest scan width in GHz accepted for scan_type at these
+            wavelengths
+    scan_type ~ Fast scan type, see SolstisCommands.fast_scan_start
+    overlap ~ (float) Smallest overlap as a fraction of width, below 1
+    duration ~ (float) Duration of each scan in seconds
+  Returns:
+    FastScanPlan of the windows
+  """
+  if width <= 0:
+    raise ValueError("width must be positive")
+  if not 0 <= overlap < 1:
+    raise ValueError("overlap must be in [0, 1)")
+  low = C_NM_GHZ/max(start,stop)
+  high = C_NM_GHZ/min(start,stop)
+  span = high - low
+  if span <= width:
+    centres = np.array([(low + high)/2.])
+  else:
+    step = width*(1. - overlap)
+    num = int(math.ceil((span - width)/step - 1e-9)) + 1
+    centres = np.linspace(low + width/2.,high - width/2.,num)
+  tiles = np.zeros(len(centres),dtype=TILE_DTYPE)
+  tiles["centre_ghz"] = centres
+  tiles["centre"] = C_NM_GHZ/centres
+  tiles["low_ghz"] = centres - width/2.
+  tiles["high_ghz"] = centres + width/2.
+  return FastScanPlan(scan_type,width,duration,tiles)
+
+class TileTrace:
+  """Tuner readings of one executed fast scan tile
+
+  Attributes:
+    index ~ (int) Index of the tile in the plan
+    tile ~ Row of the plan's tiles array
+    measured ~ (float) Wavelength measured once tuned to the centre in nm
+    time ~ NumPy array of perf_counter times of the tuner readings
+    tuner ~ NumPy array of the raw tuner values returned by fast_scan_poll,
+            in the controller's units; the scan covers tile["low_ghz"] to
+            tile["high_ghz"] between t_start and t_end
+    t_tune ~ (float) perf_counter time the tune to the centre was sent
+    t_start ~ (float) perf_counter time of the first poll seeing the scan
+              running
+    t_end ~ (float) perf_counter time the scan was seen to have finished
+  """
+  def __init__(self,index,tile,measured,time,tuner,t_tune,t_start,t_end):
+    self.index = index
+    self.tile = tile
+    self.measured = measured
+    self.time = time
+    self.tuner = tuner
+    self.t_tune = t_tune
+    self.t_start = t_start
+    self.t_end = t_end
+
+def run_tiles(client,
+              plan,
+              poll_interval=0.001,
+              timeout=10.,
+              start_timeout=1.,
+              tune_poll_interval=0.002,
+              tune_max_interval=0.05):
+  """Executes a FastScanPlan, yielding the trace of each tile as it finishes
+
+  The tune to the next tile's centre is sent as soon as the current scan is
+  seen to have finished, and runs while the caller processes the yielded
+  trace. Each fast_scan_start is batched with the first fast_scan_poll so
+  the start and first reading share one round trip. If that poll does not
+  yet see the scan running, polling continues until it does, and only then
+  does the recording of the tile start.
+
+  Parameters:
+    client ~ SolstisClient driving the laser
+    plan ~ FastScanPlan from plan_tiles
+    poll_interval ~ (float) Seconds between fast_scan_poll readings
+    timeout ~ (float) Seconds past the scan duration after which the scan is
+              stopped and TimeoutError raised
+    start_timeout ~ (float) Seconds after fast_scan_start within which the
+                    scan must be seen running, else it is stopped and
+                    TimeoutError raised
+    tune_poll_interval ~ (float) First poll interval of the tunes
+    tune_max_interval ~ (float) Longest poll interval of the tunes
+  Yields:
+    TileTrace of every tile in plan order
+  Raises:
+    SolstisError if a tune or scan fails
+  """
+  tiles = plan.tiles
+  if len(tiles) == 0:
+    return
+  scan_type = plan.scan_type
+  t_tune = time.perf_counter()
+  move = client.start_set_wave_m(float(tiles["centre"][0]),
+                                 poll_interval=tune_poll_interval,
+                                 max_interval=tune_max_interval)
+  batch = client.batch()
+  for i in range(len(tiles)):
+    measured = move.result()
+    batch.fast_scan_start(scan_type,plan.width,plan.duration)
+    batch.fast_scan_poll(scan_type)
+    t0 = time.perf_counter()
+    started, poll = batch.execute(raise_errors=True)
+    t1 = time.perf_counter()
+    start_time = t0 + start_timeout
+    while poll[1]:
+      if t1 >= start_time:
+        client.fast_scan_stop(scan_type)
+        raise TimeoutError("Fast scan of tile "+str(i)+
+                           " was not seen running within the start timeout")
+      if poll_interval > 0:
+        time.sleep(poll_interval)
+      t0 = time.perf_counter()
+      poll = client.fast_scan_poll(scan_type)
+      t1 = time.perf_counter()
+    t_start = t0
+    times = []
+    tuner = []
+    end_time = t_start + plan.duration + timeout
+    while not poll[1]:
+      times.append((t0 + t1)/2.)
+      tuner.append(poll[0])
+      if t1 >= end_time:
+        client.fast_scan_stop(scan_type)
+        raise TimeoutError("Fast scan of tile "+str(i)+
+                           " did not finish within the timeout")
+      if poll_interval > 0:
+        time.sleep(poll_interval)
+      t0 = time.perf_counter()
+      poll = client.fast_scan_poll(scan_type)
+      t1 = time.perf_counter()
+    t_end = t1
+    trace = TileTrace(i,tiles[i],measured,np.array(times),np.array(tuner),
+                      t_tune,t_start,t_end)
+    if i + 1 < len(tiles):
+      t_tune = time.perf_counter()
+      move = client.start_set_wave_m(float(tiles["centre"][i+1]),
+                                     poll_interval=tune_poll_interval,
+                                     max_interval=tune_max_interval)
+    yield trace
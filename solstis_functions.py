@@ -1,11 +1,17 @@
+import sys
 import time
 import socket
+import struct
 import json
+import re
+import weakref
+import selectors
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import Future, CancelledError
 from enum import Enum
 
-#Global variables for use within module
-next_data = '' #Extra TCP socket data to carry forward for next read statement
-
 #Exception class for Solstis specific errors
 class SolstisError(Exception):
   """Exception raised when the Solstis response indicates an error
@@ -16,87 +22,362 @@ class SolstisError(Exception):
   def __init__(self,message):
     self.message = message
 
-def init_socket(address='192.168.1.222',port=39933):
-  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-  sock.connect((address,port))
-  sock.settimeout(100)
-  return sock
+#Run of JSON text up to the next brace, skipping over complete string literals
+_FRAME_SKIP = re.compile(rb'(?:[^{}"]+|"[^"\\]*(?:\\.[^"\\]*)*")*',re.DOTALL)
+_WHITESPACE = re.compile(rb'\s*')
 
-def send_msg(s,transmission_id=1,op='start_link',params=None,debug=False):
+#Kernel receive timestamps (Linux). The option doubles as the control
+#message type; Python does not export it
+_SO_TIMESTAMPNS = getattr(socket,'SO_TIMESTAMPNS',35)
+_TIMESPEC = struct.Struct("@ll")
+_ANCBUFSIZE = (socket.CMSG_SPACE(_TIMESPEC.size)
+               if hasattr(socket,'CMSG_SPACE') else 0)
+
+class FrameDecoder:
+  """Incremental splitter of the TCP byte stream into complete JSON messages
+
+  Received bytes are appended to a single bytearray and scanned for the
+  closing brace of the outermost object. Scanning resumes where the previous
+  call stopped and runs from brace to brace, so the interpreter only handles
+  the structural characters no matter how the stream was fragmented. Braces
+  inside string literals (including escaped quotes) are ignored, and messages
+  are only decoded once complete so multi-byte UTF-8 characters split across
+  reads are handled.
+
+  Attributes:
+    buffer ~ (bytearray) Received bytes not yet returned as a frame
+    recv_time ~ (float) perf_counter time of the read that completed the
+                frame last returned by recv_frame, or of the arrival of that
+                data in the kernel if kernel_timestamps is True
+    kernel_timestamps ~ (Boolean) True if reads take the receive timestamp
+                        of the kernel, see use_kernel_timestamps
   """
-  Function to carry out the most basic communication send function
-  s ~ Socket
-  transmission_id ~ Arbitrary(?) integer
-  op ~ String containing operating command
-  params ~ dict containing Solstis Key/Value pairs as necessary
+  def __init__(self,bufsize=4096):
+    self.buffer = bytearray()
+    self.recv_time = None
+    self.kernel_timestamps = False
+    self._chunk = bytearray(bufsize) #Reusable receive buffer
+    self._view = memoryview(self._chunk)
+    self._pos = 0 #Offset at which scanning resumes
+    self._depth = 0 #Brace depth at self._pos
+    self._selector = None #Selector of self._sock and self._wakeup
+    self._sock = None
+    self._wakeup = None
+
+  def use_kernel_timestamps(self,s,enable=True):
+    """Switches recv_time to the time the data reached the kernel
+
+    Sets SO_TIMESTAMPNS on the socket so each read returns the kernel's
+    receive time (CLOCK_REALTIME), which is mapped onto perf_counter at the
+    read. recv_time then excludes the scheduling and interpreter delays
+    between the arrival of the data and the read. Only available on Linux
+    sockets; elsewhere the read time is kept.
+
+    Parameters:
+      s ~ Socket read by recv_frame
+      enable ~ (Boolean) False to go back to the read time
+    Returns:
+      True if kernel timestamps are in use
+    """
+    use = (enable and sys.platform.startswith('linux') and _ANCBUFSIZE > 0 and
+           hasattr(s,'recvmsg_into'))
+    if use:
+      try:
+        s.setsockopt(socket.SOL_SOCKET,_SO_TIMESTAMPNS,1)
+      except OSError:
+        use = False
+    self.kernel_timestamps = use
+    return use
+
+  def _recv(self,s):
+    """Reads once into self._chunk, setting self.recv_time"""
+    if not self.kernel_timestamps:
+      n = s.recv_into(self._chunk)
+      self.recv_time = time.perf_counter()
+      return n
+    n, ancdata, flags, address = s.recvmsg_into((self._chunk,),_ANCBUFSIZE)
+    self.recv_time = time.perf_counter()
+    for level, kind, data in ancdata:
+      if (level == socket.SOL_SOCKET and kind == _SO_TIMESTAMPNS and
+          len(data) >= _TIMESPEC.size):
+        sec, nsec = _TIMESPEC.unpack_from(data)
+        #Age of the data by the realtime clock, taken off the read time
+        self.recv_time -= time.time() - (sec + nsec*1e-9)
+    return n
+
+  def clear(self):
+    """Discards all buffered data"""
+    del self.buffer[:]
+    self._pos = 0
+    self._depth = 0
+
+  def feed(self,data):
+    """Appends received bytes to the buffer"""
+    self.buffer += data
+
+  def next_frame(self):
+    """Extracts the next complete message from the buffer
+
+    Returns:
+      bytes of the complete JSON message or None if more data is required
+    Raises:
+      SolstisError if the data between messages is not the start of an object
+    """
+    buf = self.buffer
+    pos = self._pos
+    depth = self._depth
+    if depth == 0:
+      #Drop whitespace between messages and check for the opening brace
+      end = _WHITESPACE.match(buf).end()
+      if end:
+        del buf[:end]
+      if len(buf) == 0:
+        return None
+      if buf[0] != 0x7b:
+        self.clear()
+        raise SolstisError("Received data from TCP/IP is invalid.")
+      depth = 1
+      pos = 1
+    n = len(buf)
+    while True:
+      pos = _FRAME_SKIP.match(buf,pos).end()
+      if pos == n or buf[pos] == 0x22:
+        #Out of data, possibly in the middle of a string which is rescanned
+        break
+      pos += 1
+      if buf[pos-1] == 0x7b:
+        depth += 1
+      else:
+        depth -= 1
+        if depth == 0:
+          frame = bytes(buf[:pos])
+          del buf[:pos]
+          self._pos = 0
+          self._depth = 0
+          return frame
+    self._pos = pos
+    self._depth = depth
+    return None
+
+  def __iter__(self):
+    """Yields every complete message currently buffered"""
+    frame = self.next_frame()
+    while frame is not None:
+      yield frame
+      frame = self.next_frame()
+
+  def _wait_readable(self,s,wakeup,timeout):
+    """Waits until s is readable, returns False on timeout"""
+    if s is not self._sock or wakeup is not self._wakeup:
+      if self._selector is not None:
+        self._selector.close()
+      self._selector = selectors.DefaultSelector()
+      self._selector.register(s,selectors.EVENT_READ,False)
+      if wakeup is not None:
+        self._selector.register(wakeup,selectors.EVENT_READ,True)
+      self._sock = s
+      self._wakeup = wakeup
+    events = self._selector.select(timeout)
+    for key, mask in events:
+      if key.data:
+        raise CancelledError()
+    return len(events) > 0
+
+  def recv_frame(self,s,timeout=10.,wakeup=None):
+    """Reads from a socket until a complete message is available
+
+    The socket should be non-blocking: reads are attempted directly and only
+    when no data is available does the call wait in a selector, so the
+    timeout is enforced whatever the socket's own timeout is.
+
+    Parameters:
+      s ~ Socket to read from
+      timeout ~ (float) Seconds after which to give up waiting
+      wakeup ~ Socket interrupting the wait when it becomes readable
+    Returns:
+      bytes of the complete JSON message
+    Raises:
+      TimeoutError if no complete message arrived within timeout
+      ConnectionError if the connection was closed by the Solstis
+      CancelledError if wakeup became readable
+    """
+    frame = self.next_frame()
+    if frame is not None:
+      return frame
+    deadline = time.perf_counter() + timeout
+    while True:
+      try:
+        n = self._recv(s)
+      except (BlockingIOError,InterruptedError):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or not self._wait_readable(s,wakeup,remaining):
+          raise TimeoutError()
+        continue
+      if n == 0:
+        raise ConnectionError("Connection closed by the Solstis.")
+      self.buffer += self._view[:n]
+      #A message can only have been completed by a chunk with a closing brace
+      if self._chunk.find(b'}',0,n) >= 0:
+        frame = self.next_frame()
+        if frame is not None:
+          return frame
+      if time.perf_counter() > deadline:
+        raise TimeoutError()
+
+def sendall(s,data,timeout=10.):
+  """Sends all of data on a socket, waiting at most timeout for buffer space
+
+  Parameters:
+    s ~ Socket, possibly non-blocking
+    data ~ bytes to send
+    timeout ~ (float) Seconds after which to give up waiting
+  Raises:
+    TimeoutError if the data could not be sent within timeout
   """
-  if params is not None:
-    message = {"transmission_id": [transmission_id],
-               "op": op,
-               "parameters": params}
-  else:
-    message = {"transmission_id": [transmission_id],
-               "op": op}
-  command = {"message": message}
-  send_msg = json.dumps(command).encode('utf8')
-  if debug==True:
-    print(send_msg)
-  s.sendall(send_msg)
+  view = memoryview(data)
+  sent = 0
+  deadline = None
+  while sent < len(view):
+    try:
+      sent += s.send(view[sent:])
+    except (BlockingIOError,InterruptedError):
+      if deadline is None:
+        deadline = time.perf_counter() + timeout
+      remaining = deadline - time.perf_counter()
+      if remaining <= 0:
+        raise TimeoutError()
+      with selectors.DefaultSelector() as selector:
+        selector.register(s,selectors.EVENT_WRITE)
+        selector.select(remaining)
+
+#JSON library decoding replies and encoding non-numeric parameter values.
+#orjson is used when installed, the standard library otherwise
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+JSON_BACKEND = None
+
+def _to_builtin(obj):
+  #NumPy arrays and scalars for json, as OPT_SERIALIZE_NUMPY does for orjson
+  tolist = getattr(obj,'tolist',None)
+  if tolist is None:
+    raise TypeError("Object of type "+type(obj).__name__+
+                    " is not JSON serializable")
+  return tolist()
+
+def set_json_backend(name=None):
+  """Selects the JSON library used by the codec
 
-def recv_msg(s,timeout=10.):
-  global next_data
-  i = 0 #Index
-  open_brc_count = 1 #Open Brace Count
-  close_brc_count = 0 #Closing brace count
-  #Initialize data
-  data = next_data
-
-  #Check For existing data and if so, parse it
-  if len(data) > 0:
-    if data[0] != "{":
-      raise SolstisError("Stored data from previous TCP/IP is invalid.")
-  
-    #Check if existing data contains complete message
-    for i in range(1,len(data)):
-      if data[i] == "{":
-        open_brc_count += 1
-      elif data[i] == "}":
-        close_brc_count += 1
-        if close_brc_count == open_brc_count:
-          next_data = data[i+1:len(data)]
-          data = data[0:i+1]
-          return json.loads(data)
-  
-  #There is NOT a complete message cached so we must continue to read TCP/IP
-
-  #Start timing in case of timeout
-  init_time = time.perf_counter()
-  #Loop reading TCP/IP until there is some data
-  while len(data) == 0:
-    data += s.recv(1024).decode('utf8')
-    if time.perf_counter() - init_time > timeout:
-      raise TimeoutError()
+  Parameters:
+    name ~ (str) "orjson" or "json", None for the fastest one installed
+  Returns:
+    The name of the library selected
+  """
+  global JSON_BACKEND, _loads, _dumps
+  if name is None:
+    name = "json" if orjson is None else "orjson"
+  if name == "orjson":
+    if orjson is None:
+      raise ValueError("orjson is not installed")
+    def _loads(data):
+      try:
+        return orjson.loads(data)
+      except orjson.JSONDecodeError:
+        #orjson rejects the NaN and Infinity literals json accepts
+        return json.loads(data)
+    def _dumps(obj):
+      return orjson.dumps(obj,option=orjson.OPT_SERIALIZE_NUMPY)
+  elif name == "json":
+    _loads = json.loads
+    def _dumps(obj):
+      return json.dumps(obj,default=_to_builtin).encode('utf8')
+  else:
+    raise ValueError("Unknown JSON backend: "+str(name))
+  JSON_BACKEND = name
+  return name
+
+set_json_backend()
+
+def decode_message(data):
+  """Decodes the bytes of one complete message into a dict"""
+  return _loads(data)
+
+#Message templates. Requests are spliced from prebuilt bytes around the
+#transmission ID and parameter values, laid out as json.dumps would
+_MESSAGE_PREFIX = b'{"message": {"transmission_id": ['
+_op_templates = {} #op -> (suffix without parameters, start of parameters)
+_param_templates = {} #(op, parameter keys) -> bytes before each value
+_strings = {} #Cache of encoded string values (ops, scan types, on/off...)
+
+def _encode_value(value):
+  if isinstance(value,float):
+    if value - value == 0:
+      return float.__repr__(value).encode()
+    return json.dumps(value).encode('utf8') #NaN and infinities
+  elif value.__class__ is int:
+    return int.__repr__(value).encode()
+  elif value.__class__ is str:
+    data = _strings.get(value)
+    if data is None:
+      data = json.dumps(value).encode('utf8')
+      if len(_strings) < 1024:
+        _strings[value] = data
+    return data
+  elif value.__class__ is list and len(value) == 1:
+    return b'[' + _encode_value(value[0]) + b']'
+  elif getattr(value,'shape',None) == ():
+    return _encode_value(value.item()) #NumPy scalar, e.g. from a plan grid
+  return _dumps(value)
+
+def _op_template(op):
+  template = _op_templates.get(op)
+  if template is None:
+    name = json.dumps(op).encode('utf8')
+    template = (b'], "op": ' + name + b'}}',
+                b'], "op": ' + name + b', "parameters": {')
+    _op_templates[op] = template
+  return template
+
+def encode_message(op,params,transmission_id):
+  """Returns the bytes of a single command message
+
+  Parameterless requests are a cached template with only the transmission ID
+  spliced in. Requests with parameters reuse the prebuilt keys of their op
+  and encode only the values.
 
-  #Check (if not already done so) that the message starts with a '{'
-  if i == 0:
-    if data[0] != "{":
-      raise SolstisError("Received data from TCP/IP is invalid.")
-
-  #Loop checking for complete message and receiving new data
-  while True:
-    if len(data) > i+1:
-      for i in range(i+1,len(data)):
-        if data[i] == "{":
-          open_brc_count += 1
-        elif data[i] == "}":
-          close_brc_count += 1
-          if close_brc_count == open_brc_count:
-            next_data = data[i+1:len(data)]
-            data = data[0:i+1]
-            return json.loads(data)
-    data += s.recv(1024).decode('utf8')
-    if time.perf_counter() - init_time > timeout:
-      raise TimeoutError()
+  Parameters:
+    op ~ String containing operating command
+    params ~ dict containing Solstis Key/Value pairs, or None
+    transmission_id ~ (int) ID of the message
+  """
+  template = _op_template(op)
+  tid = _encode_value(transmission_id)
+  if not params:
+    if params is None:
+      return _MESSAGE_PREFIX + tid + template[0]
+    return _MESSAGE_PREFIX + tid + template[1] + b'}}}'
+  keys = tuple(params)
+  prefixes = _param_templates.get((op,keys))
+  if prefixes is None:
+    prefixes = tuple((b', ' if i else b'') + json.dumps(key).encode('utf8') +
+                     b': ' for i, key in enumerate(keys))
+    _param_templates[(op,keys)] = prefixes
+  parts = [_MESSAGE_PREFIX,tid,template[1]]
+  for prefix, value in zip(prefixes,params.values()):
+    parts.append(prefix)
+    parts.append(_encode_value(value))
+  parts.append(b'}}}')
+  return b''.join(parts)
+
+def init_socket(address='192.168.1.222',port=39933,timeout=10.):
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.settimeout(timeout)
+  sock.connect((address,port))
+  #Waits are bounded by the deadline of each call rather than a socket timeout
+  sock.setblocking(False)
+  return sock
 
 def verify_msg(msg,op=None,transmission_id=None):
   msgID = msg["message"]["transmission_id"][0]
@@ -116,132 +397,6 @@ def verify_msg(msg,op=None,transmission_id=None):
             "' did not match expected operation command of: "+op
       raise SolstisError(msg)
 
-def start_link(sock,transmission_id=1,ip_address='192.168.1.107'):
-  send_msg(sock,transmission_id,'start_link',{'ip_address': ip_address})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op='start_link_reply')
-  if val["message"]["parameters"]["status"] == "ok":
-    return
-  elif val["message"]["parameters"]["status"] == "failed":
-    raise SolstisError("Link could not be formed")
-  else:
-    raise SolstisError("Unknown error: Could not determine link status")
-
-def set_wave_m(sock, wavelength, transmission_id = 1):
-  """Sets wavelength given that a wavelength meter is configured
-
-  Parameters:
-    sock ~ Socket object to use
-    wavelength ~ (float) wavelength to tune to in nanometers
-    transmission_id ~ (int) Arbitrary integer
-  Returns:
-    The wavelength of the most recent measurement made by the wavelength meter
-  """
-  send_msg(sock,transmission_id,"set_wave_m",{"wavelength": [wavelength]})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="set_wave_m_reply")
-  status = val["message"]["parameters"]["status"]
-  if status == 1:
-    raise SolstisError("No (wavelength) meter found.")
-  elif status == 2:
-    raise SolstisError("Wavelength Out of Range.")
-  return val["message"]["parameters"]["wavelength"][0]
-
-#Same as above but requests a final report as well
-def set_wave_m_f_r(sock, wavelength, transmission_id = 1):
-  """Sets wavelength given that a wavelength meter is configured
-
-  Parameters:
-    sock ~ Socket object to use
-    wavelength ~ (float) wavelength to tune to in nanometers
-    transmission_id ~ (int) Arbitrary integer
-  Returns:
-    The wavelength of the most recent measurement made by the wavelength meter
-  """
-  send_msg(sock,transmission_id,"set_wave_m",{"wavelength": [wavelength],
-                                              "report": "finished"})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="set_wave_m_reply")
-  status = val["message"]["parameters"]["status"]
-  if status == 1:
-    raise SolstisError("No (wavelength) meter found.")
-  elif status == 2:
-    raise SolstisError("Wavelength Out of Range.")
-  #Final Report
-  val = recv_msg(sock)
-  verify_msg(val,op="set_wave_m_f_r")
-  #TODO: Check other variables
-  return val["message"]["parameters"]["wavelength"][0]
-
-def poll_wave_m(sock,transmission_id=1):
-  """Gets the latest Wavemeter reading and current wavelength tuning status
-
-  Parameters:
-    sock ~ socket object to use
-    transmission_id ~ (int) Arbitrary integer to use for communications
-  Returns:
-    Tuple containing (in increasing index order):
-      -floating point value for current wavelength
-      -Boolean stating whether tuning is done/inactive (True = Not tuning)
-  """
-
-  send_msg(sock,transmission_id,"poll_wave_m")
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="poll_wave_m_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 1:
-    raise SolstisError("No (wavelength) meter found.")
-  elif status == 0 or status == 3:
-    status = True #Not tuning
-  else:
-    status = False #Still Tuning
-  return val["message"]["parameters"]["current_wavelength"][0], status
-
-def move_wave_t(sock, wavelength, transmission_id=1):
-  """Sets the wavelength based on wavelength table
-
-  Parameters:
-    sock ~ socket object to use
-    wavelength ~ (float) wavelength set point
-    transmission_id ~ (int) Arbitrary integer for communications
-  Returns:
-    Nothing
-  """
-
-  send_msg(sock,transmission_id,"move_wave_t", {"wavelength": [wavelength]})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="move_wave_t_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("move_wave_t: Failed, is your wavemeter configured?")
-  else:
-    raise SolstisError("Wavelength out of range.")
-
-def poll_move_wave_t(sock,transmission_id=1):
-  """Gets the currently set wavelength according to wavelength table
-
-  Parameters:
-    sock ~ socket object to use
-    transmission_id ~ (int) Arbitrary integer for communications
-  Returns:
-    Tuple containing the following (in increasing index order):
-      -Current wavelength
-      -Boolean with value True if Tuning is not taking place, False o/w
-  """
-  send_msg(sock,transmission_id,"poll_move_wave_t")
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="poll_move_wave_t_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 2:
-    raise SolstisError("poll_move_wave_t: Failed,is your wavemeter configured?")
-  elif status == 1:
-    statu
-  else:
-    status = True
-  return val["message"]["parameters"]["wavelength"][0], status
-
 #TODO: Move to own file?
 class TeraScan(Enum):
   SCAN_TYPE_MEDIUM = 1
@@ -275,633 +430,1508 @@ class TeraScan(Enum):
   SCAN_RATE_LINE_100_KHZ = 28
   SCAN_RATE_LINE_50_KHZ = 29
 
-#TODO: Ensure that the Units parameters is filled in
-def scan_stitch_initialize(sock,
-                           scan_type,
-                           start,
-                           stop,
-                           scan_rate,
-                           transmission_id=1):
-  """Initializes TeraScan operations
-
-  Parameters:
-    sock ~ Socket to use for communications
-    transmission_id ~ (int) Arbitrary integer for communications 
-    scan_type ~ (TeraScan Enum) Type of scan to perform
-    start ~ (float) Starting wavelength for scan
-    stop ~ (float) Ending wavelength for scan
-    scan_rate ~ (TeraScan Enum) Scan rate for scan1
-  Returns:
-    Nothing on success
-  Raises:
-    SolstisError on failure to initialize
-    ValueError on illegal argument input
-  """
-
-  #Create the message based on Input:
-  #Scan Type:
-  if scan_type == TeraScan.SCAN_TYPE_MEDIUM:
-    scan_type = "medium"
-  elif scan_type == TeraScan.SCAN_TYPE_FINE:
-    scan_type = "fine"
-  elif scan_type == TeraScan.SCAN_TYPE_LINE:
-    scan_type = "line"
-  else:
+#Strings sent for each TeraScan scan type
+SCAN_TYPES = {TeraScan.SCAN_TYPE_MEDIUM: "medium",
+              TeraScan.SCAN_TYPE_FINE: "fine",
+              TeraScan.SCAN_TYPE_LINE: "line"}
+
+#Rate and units sent for each TeraScan scan rate
+SCAN_RATES = {TeraScan.SCAN_RATE_MEDIUM_100_GHZ: ([100], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_50_GHZ: ([50], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_20_GHZ: ([20], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_15_GHZ: ([15], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_10_GHZ: ([10], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_5_GHZ: ([5], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_2_GHZ: ([2], "GHz/s"),
+              TeraScan.SCAN_RATE_MEDIUM_1_GHZ: ([1], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_20_GHZ: ([20], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_10_GHZ: ([10], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_5_GHZ: ([5], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_2_GHZ: ([2], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_1_GHZ: ([1], "GHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_500_MHZ: ([500], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_200_MHZ: ([200], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_100_MHZ: ([100], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_50_MHZ: ([50], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_20_MHZ: ([20], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_10_MHZ: ([10], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_5_MHZ: ([5], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_2_MHZ: ([2], "MHz/s"),
+              TeraScan.SCAN_RATE_FINE_LINE_1_MHZ: ([1], "MHz/s"),
+              TeraScan.SCAN_RATE_LINE_500_KHZ: ([500], "kHz/s"),
+              TeraScan.SCAN_RATE_LINE_200_KHZ: ([200], "kHz/s"),
+              TeraScan.SCAN_RATE_LINE_100_KHZ: ([100], "kHz/s"),
+              TeraScan.SCAN_RATE_LINE_50_KHZ: ([50], "kHz/s")}
+
+#Converters of command arguments to parameter values
+def _listed(value):
+  return [value]
+
+def _scan_type(scan_type):
+  try:
+    return SCAN_TYPES[scan_type]
+  except (KeyError,TypeError):
     raise ValueError('scan_type is not a valid TeraScan Enum')
 
-  #Scan Rate and units:
-  if scan_rate == TeraScan.SCAN_RATE_MEDIUM_100_GHZ:
-    scan_rate = [100]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_50_GHZ:
-    scan_rate = [50]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_20_GHZ:
-    scan_rate = [20]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_15_GHZ:
-    scan_rate = [15]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_10_GHZ:
-    scan_rate = [10]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_5_GHZ:
-    scan_rate = [5]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_2_GHZ:
-    scan_rate = [2]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_MEDIUM_1_GHZ:
-    scan_rate = [1]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_20_GHZ:
-    scan_rate = [20]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_10_GHZ:
-    scan_rate = [10]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_5_GHZ:
-    scan_rate = [5]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_2_GHZ:
-    scan_rate = [2]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_1_GHZ:
-    scan_rate = [1]; units = "GHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_500_MHZ:
-    scan_rate = [500]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_200_MHZ:
-    scan_rate = [200]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_100_MHZ:
-    scan_rate = [100]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_50_MHZ:
-    scan_rate = [50]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_20_MHZ:
-    scan_rate = [20]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_10_MHZ:
-    scan_rate = [10]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_5_MHZ:
-    scan_rate = [5]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_2_MHZ:
-    scan_rate = [2]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_FINE_LINE_1_MHZ:
-    scan_rate = [1]; units = "MHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_LINE_500_KHZ:
-    scan_rate = [500]; units = "kHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_LINE_200_KHZ:
-    scan_rate = [200]; units = "kHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_LINE_100_KHZ:
-    scan_rate = [100]; units = "kHz/s"
-  elif scan_rate == TeraScan.SCAN_RATE_LINE_50_KHZ:
-    scan_rate = [50]; units = "kHz/s"
-  else:
+def _scan_rate(scan_rate):
+  try:
+    return SCAN_RATES[scan_rate]
+  except (KeyError,TypeError):
     raise ValueError("Input Scan rate is not valid TeraScan Enum.")
 
-  send_msg(sock,transmission_id,"scan_stitch_initialise",
-                      {"scan": scan_type,
-                      "start": [start],
-                      "stop": [stop],
-                      "rate": scan_rate,
-                      "units": units})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,
-             op="scan_stitch_initialise_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("TeraScan start wavelength out of range.")
-  elif status == 2:
-    raise SolstisError("TeraScan stop wavelength out of range.")
-  elif status == 3:
-    raise SolstisError("TeraScan requested scan range is out of range.")
-  else:
-    raise SolstisError("TeraScan is not available.")
+def _on_off(value):
+  return "on" if value == True else "off"
+
+def _start_stop(value):
+  return "start" if value == True else "stop"
 
-def scan_stitch_op(sock, scan_type, operation, transmission_id=1):
-  """Controls the TeraScan Operation
+def _decoder(errors=None,ok=None,default_error=None,extract=None):
+  """Builds the function extracting the result from the parameters of a reply
 
   Parameters:
-    sock ~ Socket to use for communications
-    transmission_id ~ (int) Arbitrary integer for use in communications
-    scan_type ~ (TeraScan Enum) Type of scan to carry out 
-    operation ~ (str) Either "start" or "stop"
+    errors ~ dict mapping failing status codes to their error message, None
+             if the reply has no status to check
+    ok ~ Status codes that succeed, None if every code not in errors succeeds
+    default_error ~ Error message of codes in neither ok nor errors
+    extract ~ Function taking (params, status) and returning the result,
+              None to return None
   Returns:
-    Nothing
-  Raises:
-    SolstisError on failure to execute command
-    ValueError if scan type is invalid
+    Function taking the reply parameters and returning the result or raising
+    SolstisError
   """
+  if errors is None:
+    def decode(params):
+      return extract(params,None)
+    return decode
+  if ok is not None:
+    ok = frozenset(ok)
+  def decode(params):
+    status = params["status"]
+    if status.__class__ is list:
+      status = status[0]
+    if ok is None:
+      message = errors.get(status)
+    elif status in ok:
+      message = None
+    else:
+      message = errors.get(status,default_error)
+    if message is not None:
+      raise SolstisError(message)
+    if extract is None:
+      return None
+    return extract(params,status)
+  return decode
+
+class Command:
+  """Description of a Solstis command, from which its encoder and result
+  decoder are built
 
-  #Translate Scan type:
-  if scan_type == TeraScan.SCAN_TYPE_MEDIUM:
-    scan_type = "medium"
-  elif scan_type == TeraScan.SCAN_TYPE_FINE:
-    scan_type = "fine"
-  elif scan_type == TeraScan.SCAN_TYPE_LINE:
-    scan_type = "line"
-  else:
-    raise ValueError("scan_type is not a valid TeraScan Enum")
-
-  send_msg(sock,transmission_id,"scan_stitch_op",{
-                                "scan": scan_type,
-                                "operation": operation})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="scan_stitch_op_reply")
-  status = val["message"]["parameters"]["status"][0]
+  Attributes:
+    op ~ (str) Operation sent to the Solstis
+    fields ~ Tuple of (key, converter) of the parameters taken from the
+             arguments of encode in order. converter is None to send the
+             argument unchanged; a tuple of keys takes a tuple of values from
+             its converter
+    constants ~ dict of parameters sent unchanged after the fields
+    result ~ Function extracting the result from the reply parameters
+    report ~ Function extracting the result from the final report, None if
+             the command has no final report
+  """
+  def __init__(self,
+               op,
+               fields=(),
+               constants=None,
+               errors=None,
+               ok=None,
+               default_error=None,
+               extract=None,
+               report=None):
+    self.op = op
+    self.fields = tuple((key,convert,key.__class__ is tuple)
+                        for key, convert in fields)
+    self.constants = {} if constants is None else constants
+    self.result = _decoder(errors,ok,default_error,extract)
+    self.report = report
+
+  def encode(self,*args):
+    """Returns the parameters dict of the command, None if it has none"""
+    if not self.fields and not self.constants:
+      return None
+    params = {}
+    for (key, convert, multiple), arg in zip(self.fields,args):
+      if convert is None:
+        params[key] = arg
+      elif multiple:
+        params.update(zip(key,convert(arg)))
+      else:
+        params[key] = convert(arg)
+    params.update(self.constants)
+    return params
+
+#Functions extracting the result from the parameters of successful replies
+def _wavelength(params,status):
+  return params["wavelength"][0]
+
+def _poll_wave_m_result(params,status):
+  #Status 0 or 3 is not tuning, 2 still tuning
+  return params["current_wavelength"][0], (status == 0 or status == 3)
+
+def _poll_move_wave_t_result(params,status):
+  #Status 1 is still tuning
+  return params["wavelength"][0], status != 1
+
+def _scan_stitch_status_result(params,status):
   if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("TeraScan Failed; Unknown Reason.")
+    return {"in_progress": False}
+  #A scan is in progress so we fill out the other entries
+  return {"in_progress": True,
+          "wavelength": params["current"][0],
+          "start": params["start"][0],
+          "stop": params["stop"][0],
+          "tuning": params["operation"][0] == 0}
+
+def _get_status_result(params,status):
+  return_val = {"status": 0}
+  return_val["wavelength"] = params["wavelength"][0]
+  return_val["temperature"] = params["temperature"][0]
+  return_val["temperature_status"] = params["temperature_status"]
+  return_val["etalon_lock"] = params["etalon_lock"]
+  return_val["etalon_voltage"] = params["etalon_voltage"][0]
+  return_val["cavity_lock"] = params["cavity_lock"]
+  return_val["resonator_voltage"] = params["resonator_voltage"][0]
+  return_val["ecd_lock"] = params["ecd_lock"]
+  if params["ecd_voltage"] == "not_fitted":
+    return_val["ecd_voltage"] = -float('inf')
   else:
-    raise SolstisError("TeraScan not Available.")
+    return_val["ecd_voltage"] = params["ecd_voltage"][0]
+  return_val["output_monitor"] = params["output_monitor"][0]
+  return_val["etalon_pd_dc"] = params["etalon_pd_dc"][0]
+  return_val["dither"] = params["dither"]
+  return return_val
 
-def scan_stitch_status(sock,scan_type,transmission_id=1):
-  """Checks the status of the TeraScan operations on Solstis
-
-  Parameters:
-    sock ~ Socket to use for communications
-    transmission_id ~ (int) Arbitrary integer for communications
-    scan_type ~ (TeraScan Enum) Type of TeraScan
-  Returns:
-    Dictionary containing the following key/value pairs:
-      "in_progress" ~ (Boolean) True if a scan is in progress [Note: Other
-                                values will be omitted if this is False.]
-      "wavelength" ~ (float) Current wavelength in scan
-      "start" ~ (float) Starting wavelength from scan
-      "stop" ~ (float) Ending wavelength in scan
-      "tuning" ~ (Boolean) True if TeraScan is currently tuning and False if
-                           it's currently scanning
-  Raises:
-    SolstisError if TeraScan is not available
-    ValueError if scan_type is not a valid TeraScan Enum
+def _fast_scan_poll_result(params,status):
+  #Status 1 is still scanning
+  return params["tuner_value"][0], status != 1
+
+def _auto_output_fields(params,status):
+  return {"wavelength": params["wavelength"][0], "status": params["status"]}
+
+#Decoders of the messages sent without a request
+#TODO: Check other variables of the final report
+_set_wave_m_f_r_result = _decoder(extract=_wavelength)
+_auto_output_result = _decoder(extract=_auto_output_fields)
+
+#Every command by method name. The reply of each is op+"_reply"
+COMMANDS = {
+  "start_link": Command(
+    "start_link",(("ip_address",None),),
+    errors={"failed": "Link could not be formed"},ok=("ok",),
+    default_error="Unknown error: Could not determine link status"),
+  "set_wave_m": Command(
+    "set_wave_m",(("wavelength",_listed),),
+    errors={1: "No (wavelength) meter found.",
+            2: "Wavelength Out of Range."},
+    extract=_wavelength),
+  "set_wave_m_f_r": Command(
+    "set_wave_m",(("wavelength",_listed),),{"report": "finished"},
+    errors={1: "No (wavelength) meter found.",
+            2: "Wavelength Out of Range."},
+    extract=_wavelength,report=_set_wave_m_f_r_result),
+  "poll_wave_m": Command(
+    "poll_wave_m",
+    errors={1: "No (wavelength) meter found."},
+    extract=_poll_wave_m_result),
+  "move_wave_t": Command(
+    "move_wave_t",(("wavelength",_listed),),
+    errors={1: "move_wave_t: Failed, is your wavemeter configured?"},ok=(0,),
+    default_error="Wavelength out of range."),
+  "poll_move_wave_t": Command(
+    "poll_move_wave_t",
+    errors={2: "poll_move_wave_t: Failed,is your wavemeter configured?"},
+    extract=_poll_move_wave_t_result),
+  "scan_stitch_initialize": Command(
+    "scan_stitch_initialise",(("scan",_scan_type),
+                              ("start",_listed),
+                              ("stop",_listed),
+                              (("rate","units"),_scan_rate)),
+    errors={1: "TeraScan start wavelength out of range.",
+            2: "TeraScan stop wavelength out of range.",
+            3: "TeraScan requested scan range is out of range."},ok=(0,),
+    default_error="TeraScan is not available."),
+  "scan_stitch_op": Command(
+    "scan_stitch_op",(("scan",_scan_type),("operation",None)),
+    errors={1: "TeraScan Failed; Unknown Reason."},ok=(0,),
+    default_error="TeraScan not Available."),
+  "scan_stitch_status": Command(
+    "scan_stitch_status",(("scan",_scan_type),),
+    errors={},ok=(0,1),default_error="TeraScan is not available",
+    extract=_scan_stitch_status_result),
+  "terascan_output": Command(
+    "terascan_output",(("operation",_start_stop),
+                       ("delay",_listed),
+                       ("update",_listed),
+                       ("pause",_on_off)),
+    errors={1: "Automatic Output Configuration failed",
+            2: "Automatic Output failed; Delay period out of range",
+            3: "Automatic Output failed; Update step out of range"},ok=(0,),
+    default_error="TeraScan not available."),
+  "terascan_continue": Command(
+    "terascan_continue",
+    errors={1: "terascan_continue failed; TeraScan was not paused."},ok=(0,),
+    default_error="TeraScan is not available."),
+  "get_status": Command(
+    "get_status",
+    errors={1: "get_status failed: reason unknown"},
+    extract=_get_status_result),
+  "tune_etalon": Command(
+    "tune_etalon",(("setting",_listed),),
+    errors={1: "Etalon Tuning value is out of range."},ok=(0,),
+    default_error="tune_etalon Failed; Reason Unknown"),
+  "tune_resonator": Command(
+    "tune_resonator",(("setting",_listed),),
+    errors={1: "Resonator Tuning value is out of range."},ok=(0,),
+    default_error="tune_resonator Failed; Reason Unknown"),
+  "fine_tune_resonator": Command(
+    "fine_tune_resonator",(("setting",_listed),),
+    errors={1: "Resonator Fine-Tuning value is out of range."},ok=(0,),
+    default_error="fine_tune_resonator Failed; Reason Unknown"),
+  "etalon_lock": Command(
+    "etalon_lock",(("operation",_on_off),),
+    errors={},ok=(0,),default_error="etalon_lock Failed; Reason Unknown"),
+  "fast_scan_start": Command(
+    "fast_scan_start",(("scan",None),("width",None),("time",None)),
+    errors={1: "Fast Scan Failed: Scan width too large for position",
+            2: "Fast Scan Failed: No reference cavity fitted",
+            3: "Fast Scan Failed: no ERC fitted",
+            4: "Fast Scan Failed: Invalid Scan Type requested"},ok=(0,),
+    default_error="Fast Scan Failed: Time > 10000 seconds"),
+  "fast_scan_poll": Command(
+    "fast_scan_poll",(("scan",None),),
+    errors={},extract=_fast_scan_poll_result),
+  "fast_scan_stop": Command(
+    "fast_scan_stop",(("scan",None),),
+    errors={1: "fast_scan_stop Failed; Cause unknown",
+            2: "fast_scan_stop Failed; Reference Cavity not fitted.",
+            3: "fast_scan_stop Failed; ECD not fitted."},ok=(0,),
+    default_error="fast_scan_stop Failed; Invalid Scan Type."),
+  "fast_scan_stop_nr": Command(
+    "fast_scan_stop_nr",(("scan",None),),
+    errors={1: "fast_scan_stop_nr Failed; Cause unknown",
+            2: "fast_scan_stop_nr Failed; Reference Cavity not fitted.",
+            3: "fast_scan_stop_nr Failed; ECD not fitted."},ok=(0,),
+    default_error="fast_scan_stop_nr Failed; Invalid Scan Type."),
+  "set_wave_tolerance_m": Command(
+    "set_wave_tolerance_m",(("tolerance",None),),
+    errors={1: "Could not set tolerance; No wavemeter connected"},ok=(0,),
+    default_error="Could not set tolerance; Tolerance Value Out of Range"),
+}
+
+#Largest transmission ID accepted by the Solstis before wrapping back to 1
+MAX_TRANSMISSION_ID = 16383
+
+#Abandoned final report IDs remembered to drop their late reports
+MAX_ABANDONED_REPORTS = 1024
+
+class SolstisCommands:
+  """Command methods shared by the Solstis clients
+
+  Each method looks its command up in COMMANDS, which builds the parameters
+  and hands them to self._call together with the function extracting the
+  result from the reply.
+  The clients implement _call (blocking in SolstisClient, returning a coroutine
+  in solstis_async.AsyncSolstisClient) and recv_auto_output. When
+  transmission_id is omitted the next ID from the client's counter is used.
 
+  Attributes:
+    ip_address ~ (str) IP address of this computer sent with start_link
+    debug ~ (Boolean) True to print every outgoing message
   """
-  #Scan Type:
-  if scan_type == TeraScan.SCAN_TYPE_MEDIUM:
-    scan_type = "medium"
-  elif scan_type == TeraScan.SCAN_TYPE_FINE:
-    scan_type = "fine"
-  elif scan_type == TeraScan.SCAN_TYPE_LINE:
-    scan_type = "line"
-  else:
-    raise ValueError('scan_type is not a valid TeraScan Enum')
-  send_msg(sock,transmission_id,"scan_stitch_status",{"scan":scan_type})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,
-             op="scan_stitch_status_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    in_progress = False
-    return {"in_progress":in_progress}
-  elif status == 1:
-    in_progress = True
-  else:
-    raise SolstisError("TeraScan is not available")
-
-  #At this point we know in_progress=True so we fill out other entries
-  wavelength = val["message"]["parameters"]["current"][0]
-  start = val["message"]["parameters"]["start"][0]
-  stop = val["message"]["parameters"]["stop"][0]
-  current_op = val["message"]["parameters"]["operation"][0]
-  if current_op == 0:
-    tuning = True
-  else:
-    tuning = False
+  ip_address = '192.168.1.107'
+  debug = False
+  _last_id = 0
+
+  def next_transmission_id(self):
+    """Returns the next transmission ID of this connection"""
+    self._last_id = self._last_id % MAX_TRANSMISSION_ID + 1
+    return self._last_id
+
+  def _encode(self,op,params,transmission_id,debug=None):
+    """Returns the bytes of a single command message
+
+    Parameters:
+      op ~ String containing operating command
+      params ~ dict containing Solstis Key/Value pairs as necessary
+      transmission_id ~ (int) ID of the message
+      debug ~ (Boolean) True to print the message, defaults to self.debug
+    """
+    data = encode_message(op,params,transmission_id)
+    if debug is None:
+      debug = self.debug
+    if debug==True:
+      print(data)
+    return data
+
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    """Sends a command and extracts the result from its reply
+
+    Parameters:
+      op ~ String containing operating command
+      params ~ dict of command parameters or None
+      result ~ Function taking the reply parameters and returning the result
+      transmission_id ~ (int) ID of the message, allocated if None
+      report ~ Function returning the result from the final report which is
+               waited for after the reply, or None if there is no report
+    """
+    raise NotImplementedError
+
+  def _command(self,name,transmission_id,*args):
+    """Calls the command of COMMANDS with the given name and arguments"""
+    command = COMMANDS[name]
+    return self._call(command.op,command.encode(*args),command.result,
+                      transmission_id,command.report)
+
+  def start_link(self,transmission_id=None,ip_address=None):
+    """Starts the link to the Solstis
+
+    Parameters:
+      transmission_id ~ (int) Arbitrary integer
+      ip_address ~ (str) IP address of this computer, defaults to
+                   self.ip_address
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError if the link could not be formed
+    """
+    if ip_address is None:
+      ip_address = self.ip_address
+    return self._command("start_link",transmission_id,ip_address)
+
+  def set_wave_m(self, wavelength, transmission_id=None):
+    """Sets wavelength given that a wavelength meter is configured
+
+    Parameters:
+      wavelength ~ (float) wavelength to tune to in nanometers
+      transmission_id ~ (int) Arbitrary integer
+    Returns:
+      The wavelength of the most recent measurement made by the wavelength
+      meter
+    """
+    return self._command("set_wave_m",transmission_id,wavelength)
 
-  return_dict = {"in_progress": in_progress, "wavelength": wavelength,
-                 "start": start, "stop": stop, "tuning": tuning}
-  return return_dict
+  def set_wave_m_f_r(self, wavelength, transmission_id=None):
+    """Sets wavelength and waits for the final report of the tuning
 
-def terascan_output(sock,
-                    transmission_id=1,
-                    operation=True,
-                    delay=1,
-                    update_step=1,
-                    pause=False):
-  """Configures Terascan automatic TCP/IP transmission during transmission
+    Parameters:
+      wavelength ~ (float) wavelength to tune to in nanometers
+      transmission_id ~ (int) Arbitrary integer
+    Returns:
+      The wavelength measured by the wavelength meter once tuning finished
+    """
+    return self._command("set_wave_m_f_r",transmission_id,wavelength)
 
-  Parameters:
-    sock ~ Socket object to use
-    transmission_id ~ (int) Arbitrary int to use for communications
-    operation ~ (Boolean) True turns the feature on and False disables it
-    delay ~ (int 1-1000) Scan delay after start transmission in 1/100s
-    update_step ~ (int 0-50) Causes automatic output messges to be generated
-                             the specified number of internal tuning DAC steps
-                             have been made. i.e. higher number = less output
-                             Note: setting to zero will disable mid scan
-                             segment output.
-    pause ~ (Boolean) True to enable the feature where the TeraScan will stop
-                      after every message transmission of status "start" or
-                      "repeat" and will continue upon transmission of a
-                      terascan_continue command
+  def poll_wave_m(self,transmission_id=None):
+    """Gets the latest Wavemeter reading and current wavelength tuning status
+
+    Parameters:
+      transmission_id ~ (int) Arbitrary integer to use for communications
+    Returns:
+      Tuple containing (in increasing index order):
+        -floating point value for current wavelength
+        -Boolean stating whether tuning is done/inactive (True = Not tuning)
+    """
+    return self._command("poll_wave_m",transmission_id)
+
+  def move_wave_t(self, wavelength, transmission_id=None):
+    """Sets the wavelength based on wavelength table
+
+    Parameters:
+      wavelength ~ (float) wavelength set point
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Nothing
+    """
+    return self._command("move_wave_t",transmission_id,wavelength)
+
+  def poll_move_wave_t(self,transmission_id=None):
+    """Gets the currently set wavelength according to wavelength table
+
+    Parameters:
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Tuple containing the following (in increasing index order):
+        -Current wavelength
+        -Boolean with value True if Tuning is not taking place, False o/w
+    """
+    return self._command("poll_move_wave_t",transmission_id)
+
+  #TODO: Ensure that the Units parameters is filled in
+  def scan_stitch_initialize(self,
+                             scan_type,
+                             start,
+                             stop,
+                             scan_rate,
+                             transmission_id=None):
+    """Initializes TeraScan operations
+
+    Parameters:
+      scan_type ~ (TeraScan Enum) Type of scan to perform
+      start ~ (float) Starting wavelength for scan
+      stop ~ (float) Ending wavelength for scan
+      scan_rate ~ (TeraScan Enum) Scan rate for scan1
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError on failure to initialize
+      ValueError on illegal argument input
+    """
+    return self._command("scan_stitch_initialize",transmission_id,
+                         scan_type,start,stop,scan_rate)
+
+  def scan_stitch_op(self, scan_type, operation, transmission_id=None):
+    """Controls the TeraScan Operation
+
+    Parameters:
+      scan_type ~ (TeraScan Enum) Type of scan to carry out
+      operation ~ (str) Either "start" or "stop"
+      transmission_id ~ (int) Arbitrary integer for use in communications
+    Returns:
+      Nothing
+    Raises:
+      SolstisError on failure to execute command
+      ValueError if scan type is invalid
+    """
+    return self._command("scan_stitch_op",transmission_id,scan_type,operation)
+
+  def scan_stitch_status(self,scan_type,transmission_id=None):
+    """Checks the status of the TeraScan operations on Solstis
+
+    Parameters:
+      scan_type ~ (TeraScan Enum) Type of TeraScan
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Dictionary containing the following key/value pairs:
+        "in_progress" ~ (Boolean) True if a scan is in progress [Note: Other
+                                  values will be omitted if this is False.]
+        "wavelength" ~ (float) Current wavelength in scan
+        "start" ~ (float) Starting wavelength from scan
+        "stop" ~ (float) Ending wavelength in scan
+        "tuning" ~ (Boolean) True if TeraScan is currently tuning and False if
+                             it's currently scanning
+    Raises:
+      SolstisError if TeraScan is not available
+      ValueError if scan_type is not a valid TeraScan Enum
+    """
+    return self._command("scan_stitch_status",transmission_id,scan_type)
+
+  def terascan_output(self,
+                      transmission_id=None,
+                      operation=True,
+                      delay=1,
+                      update_step=1,
+                      pause=False):
+    """Configures Terascan automatic TCP/IP transmission during transmission
+
+    Parameters:
+      transmission_id ~ (int) Arbitrary int to use for communications
+      operation ~ (Boolean) True turns the feature on and False disables it
+      delay ~ (int 1-1000) Scan delay after start transmission in 1/100s
+      update_step ~ (int 0-50) Causes automatic output messges to be
+                               generated the specified number of internal
+                               tuning DAC steps have been made. i.e. higher
+                               number = less output
+                               Note: setting to zero will disable mid scan
+                               segment output.
+      pause ~ (Boolean) True to enable the feature where the TeraScan will
+                        stop after every message transmission of status
+                        "start" or "repeat" and will continue upon
+                        transmission of a terascan_continue command
     Returns:
       Nothing on successful call
     Raises:
       SolstisError if the command cannot be carried out
-  """
-  
-  #Create message:
-  if operation == True:
-    operation = "start"
-  else: 
-    operation = "stop"
-
-  if pause == True:
-    pause = "on"
-  else:
-    pause  = "off"
+    """
+    return self._command("terascan_output",transmission_id,
+                         operation,delay,update_step,pause)
 
+  def terascan_continue(self,transmission_id=None):
+    """Instructs a paused terascan using automatic output to continue
 
-  send_msg(sock,transmission_id,"terascan_output",{
-                                  "operation": operation,
-                                  "delay": [delay],
-                                  "update": [update_step],
-                                  "pause": pause})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="terascan_output_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Automatic Output Configuration failed")
-  elif status == 2:
-    raise SolstisError("Automatic Output failed; Delay period out of range")
-  elif status == 3:
-    raise SolstisError("Automatic Output failed; Update step out of range")
-  else:
-    raise SolstisError("TeraScan not available.")
+    Parameters:
+      transmision_id ~ (int) arbitrary integer used for communications
+    Returns:
+      Nothing on valid execution
+    Raises:
+      SolstisError on operation failure
+    """
+    return self._command("terascan_continue",transmission_id)
 
-def recv_auto_output(sock):
-  """Receives an automatic message from the Solstis during a TeraScan
-  
-  Parameters:
-    sock ~ Socket to use for communications
-  Returns:
-    A dictionary object containing the following key/value pairs:
-      "wavelength" ~ The current wavelength reading in nm (between 650-1100)
-      "status" ~ String being one of "start", "repeat", "recover", "scan", or
-                 "end". See Solstis_3_TCP_JSON_protocol_V21.pdf for details
-                 Note: If pausing is configured, then a contiue message must be
-                 sent after reveiving any "start" or "repeat" values
-  Raises:
-    SolstisError on bad transmission
-    TimeoutError when the socket times out
-  """
+  def get_status(self, transmission_id=None):
+    """Retrieves the system status information available to the user
 
-  try:
-    val = recv_msg(sock)
-  except socket.timeout:
-    raise TimeoutError
-  verify_msg(val,op="automatic_output")
-  status = val["message"]["parameters"]["status"]
-  wavelength = val["message"]["parameters"]["wavelength"][0]
+    Parameters:
+      transmission_id ~ (int) arbitrary integer to use for communications
+    Returns:
+      A dictionary containing the following key/value pairs:
+        "status" ~ 0 on a succesful call, and 1 otherwise
+        "wavelength" ~ The current wavelength in nm
+        "temperature" ~ Current temperature in degrees Celcius
+        "temperature_status" ~ "on" or "off"
+        "etalon_lock" ~ "on","off","debug","error","search" or "low". See
+                        Manual.
+        "etalon_voltage" ~ Reading in Volts
+        "cavity_lock" ~ "on","off","debug","error","search" or "low"
+        "resonator_voltage" ~ Reading in Volts
+        "ecd_lock" ~ "not_fitted","on","off","debug","error","search" or "low"
+        "ecd_voltage" ~ Reading in Volts
+        "output_monitor" ~ Reading in Volts
+        "etalon_pd_dc" ~ Reading in Volts
+        "dither" ~ "on" or "off"
+    Raises:
+      SolstisError on operation failure
+    """
+    return self._command("get_status",transmission_id)
 
-  return {"wavelength": wavelength, "status": status}
+  def tune_etalon(self, setting, transmission_id=None):
+    """Tunes the etalon to user-defined value
 
-def terascan_continue(sock,transmission_id=1):
-  """Instructs a paused terascan using automatic output to continue
+    Parameters:
+      setting ~ (float) Percentage (0-100) of etalon range to go to
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError on failure to execute
+    """
+    return self._command("tune_etalon",transmission_id,setting)
 
-  Parameters: 
-    sock ~ Socket object to use for communications
-    transmision_id ~ (int) arbitrary integer used for communications
-  Returns:
-    Nothing on valid execution
-  Raises:
-    SolstisError on operation failure
-  """
-  send_msg(sock,transmission_id,"terascan_continue")
-  val = recv_msg(sock)
-  verify_msg(val,op="terascan_continue_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("terascan_continue failed; TeraScan was not paused.")
-  else:
-    raise SolstisError("TeraScan is not available.")
+  def tune_resonator(self, setting, transmission_id=None):
+    """Tunes the resonator to user-defined value
 
-def get_status(sock, transmission_id=1):
-  """Retrieves the system status information available to the user
+    Parameters:
+      setting ~ (float) Percentage (0-100) of resonator range to go to
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError on failure to execute
+    """
+    return self._command("tune_resonator",transmission_id,setting)
 
-  Parameters:
-    sock ~ Socket object to use
-    transmission_id ~ (int) arbitrary integer to use for communications
-  Returns:
-    A dictionary containing the following key/value pairs:
-      "status" ~ 0 on a succesful call, and 1 otherwise 
-      "wavelength" ~ The current wavelength in nm
-      "temperature" ~ Current temperature in degrees Celcius
-      "temperature_status" ~ "on" or "off"
-      "etalon_lock" ~ "on","off","debug","error","search" or "low". See Manual.
-      "etalon_voltage" ~ Reading in Volts
-      "cavity_lock" ~ "on","off","debug","error","search" or "low"
-      "resonator_voltage" ~ Reading in Volts
-      "ecd_lock" ~ "not_fitted","on","off","debug","error","search" or "low"
-      "ecd_voltage" ~ Reading in Volts
-      "output_monitor" ~ Reading in Volts
-      "etalon_pd_dc" ~ Reading in Volts
-      "dither" ~ "on" or "off"
-  Raises:
-    SolstisError on operation failure
-  """
+  def fine_tune_resonator(self, setting, transmission_id=None):
+    """Fine-Tunes the resonator to user-defined value
 
-  send_msg(sock,transmission_id,"get_status")
-  val = recv_msg(sock)
-  verify_msg(val,op="get_status_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 1:
-    raise SolstisError("get_status failed: reason unknown")
-  params = val["message"]["parameters"]
-  return_val = {"status": 0}
-  return_val["wavelength"] = params["wavelength"][0]
-  return_val["temperature"] = params["temperature"][0]
-  return_val["temperature_status"] = params["temperature_status"]
-  return_val["etalon_lock"] = params["etalon_lock"]
-  return_val["etalon_voltage"] = params["etalon_voltage"][0]
-  return_val["cavity_lock"] = params["cavity_lock"]
-  return_val["resonator_voltage"] = params["resonator_voltage"][0]
-  return_val["ecd_lock"] = params["ecd_lock"]
-  if params["ecd_voltage"] == "not_fitted":
-    return_val["ecd_voltage"] = -float('inf')
-  else:
-    return_val["ecd_voltage"] = params["ecd_voltage"][0]
-  return_val["output_monitor"] = params["output_monitor"][0]
-  return_val["etalon_pd_dc"] = params["etalon_pd_dc"][0]
-  return_val["dither"] = params["dither"]
+    Parameters:
+      setting ~ (float) Percentage (0-100) of resonator fine-tuning range
+      transmission_id ~ (int) Arbitrary integer for communications
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError on failure to execute
+    """
+    return self._command("fine_tune_resonator",transmission_id,setting)
 
-  return return_val
+  def etalon_lock(self,lock,transmission_id=None):
+    """Either locks or unlocks the etalon
 
-def tune_etalon(sock, setting, transmission_id=1):
-  """Tunes the etalon to user-defined value
+    Parameters:
+      lock ~ (Boolean) True to lock the etalon, False to unlock it
+      transmission_id ~ (int) arbitrary integer for use in communications
+    Returns:
+      Nothing on success
+    Raises:
+      SolstisError on failure
+    """
+    return self._command("etalon_lock",transmission_id,lock)
+
+  def fast_scan_start(self,
+                      scan_type="etalon_continuous",
+                      width=0.01,
+                      time=0.01,
+                      transmission_id=None):
+    """Starts a Fast scan centered at the current set wavelength
+
+    Parameters:
+      scan_type ~ One of: "etalon_continuous", "etalon_single",
+                          "cavity_continuous", "cavity_single",
+                          "resonator_continuous", "resonator_single",
+                          "ecd_continuous", "fringe_test", "resonator_ramp",
+                          "ecd_ramp", "cavity_triangular",
+                          "resonator_triangular"
+                          See Manual for details
+      width ~ (float) Width of scan about center frequency in GHz
+      time ~ (float) Duration of scan in seconds. Will ramp at max speed if
+             time segment is too small.
+      transmission_id ~ (int) Arbitrary integer for use in communications
+    Returns:
+      Nothing on a succesful execution
+    Raises:
+      SolstisError on failed execution
+    """
+    return self._command("fast_scan_start",transmission_id,scan_type,width,time)
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    setting ~ (float) Percentage (0-100) of etalon range to go to
-    transmission_id ~ (int) Arbitrary integer for communications
-  Returns:
-    Nothing on success
-  Raises:
-    SolstisError on failure to execute
-  """
+  def fast_scan_poll(self, scan_type="etalon_continuous", transmission_id=None):
+    """Polls a currently running fast scan.
 
-  send_msg(sock,transmission_id,"tune_etalon",{"setting": [setting]})
-  val = recv_msg(sock)
-  verify_msg(val,op="tune_etalon_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Etalon Tuning value is out of range.")
-  else:
-    raise SolstisError("tune_etalon Failed; Reason Unknown")
+    Parameters:
+      scan_type ~ Fast scan type, see fast_scan_start
+      transmission_id ~ (int) Arbitrary integer to use for communications
+    Returns:
+      Tuple containing (in increasing index order):
+        -floating point value representing the current tuner value
+        -Boolean stating whether tuning is done/inactive (True = Not scanning)
+    Raises:
+      SolstisError on execution failure
+    """
+    return self._command("fast_scan_poll",transmission_id,scan_type)
 
-def tune_resonator(sock, setting, transmission_id=1):
-  """Tunes the resonator to user-defined value
+  def fast_scan_stop(self,scan_type="etalon_continuous",transmission_id=None):
+    """Stops a fast-scan in progress
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    setting ~ (float) Percentage (0-100) of resonator range to go to
-    transmission_id ~ (int) Arbitrary integer for communications
-  Returns:
-    Nothing on success
-  Raises:
-    SolstisError on failure to execute
-  """
+    Parameters:
+      scan_type ~ Fast scan type, see fast_scan_start
+      transmission_id ~ (int) Arbitrary integer to use for communications
+    Returns:
+      Nothing on successful execution
+    Raises:
+      SolstisError on failed execution
+    """
+    return self._command("fast_scan_stop",transmission_id,scan_type)
 
-  send_msg(sock,transmission_id,"tune_resonator",{"setting": [setting]})
-  val = recv_msg(sock)
-  verify_msg(val,op="tune_resonator_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Resonator Tuning value is out of range.")
-  else:
-    raise SolstisError("tune_resonator Failed; Reason Unknown")
+  def fast_scan_stop_nr(self,scan_type="etalon_continuous",
+                        transmission_id=None):
+    """Stops a fast-scan in progress without returning to the original position
 
-def fine_tune_resonator(sock, setting, transmission_id=1):
-  """Fine-Tunes the resonator to user-defined value
+    Parameters:
+      scan_type ~ Fast scan type, see fast_scan_start
+      transmission_id ~ (int) Arbitrary integer to use for communications
+    Returns:
+      Nothing on successful execution
+    Raises:
+      SolstisError on failed execution
+    """
+    return self._command("fast_scan_stop_nr",transmission_id,scan_type)
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    setting ~ (float) Percentage (0-100) of resonator fine-tuning range to go to
-    transmission_id ~ (int) Arbitrary integer for communications
-  Returns:
-    Nothing on success
-  Raises:
-    SolstisError on failure to execute
+  def set_wave_tolerance_m(self,tolerance=1.0,transmission_id=None):
+    """Sets the tolerance for the sending of the set_wave_m final report
+
+    Parameters:
+      tolerance ~ (float) New tolerance value
+      transmission_id ~ (int) Arbitrary integer for use in communications
+    Returns:
+      Nothing on successful execution
+    Raises:
+      SolstisError on failed execution
+    """
+    return self._command("set_wave_tolerance_m",transmission_id,tolerance)
+
+class SolstisClient(SolstisCommands):
+  """Connection to a single Solstis controller
+
+  The client owns its socket, receive buffer, transmission ID counter and
+  configuration, so several controllers can be driven from one process without
+  their streams interfering. Every command function of this module is
+  available as a method taking the same arguments without the socket, see
+  SolstisCommands.
+
+  Received messages are dispatched by type: replies go to the command waiting
+  for their transmission ID, final reports (e.g. set_wave_m_f_r) are held for
+  the command that requested them and unsolicited automatic_output messages
+  are queued in auto_output for recv_auto_output. Commands may therefore be
+  issued while a TeraScan streams automatic output, and from several threads
+  at once; whichever thread is waiting reads the socket on behalf of all.
+
+  The socket is used non-blocking and every wait is bounded by timeout, or by
+  an earlier deadline set with the deadline() context manager, so a silent
+  controller cannot stall a call for longer. cancel() makes all waits in
+  progress raise CancelledError from any thread.
+
+  Receive times are perf_counter times of the read of each message, or with
+  kernel_timestamps True of its arrival in the kernel (Linux only, see
+  FrameDecoder.use_kernel_timestamps). They are returned with automatic
+  output by recv_auto_output(with_time=True) and for replies by
+  last_recv_time().
+
+  Attributes:
+    sock ~ Socket connected to the Solstis (None until connected)
+    address ~ (str) IP address of the Solstis
+    port ~ (int) TCP port of the Solstis
+    ip_address ~ (str) IP address of this computer sent with start_link
+    timeout ~ (float) Seconds to wait for each reply
+    debug ~ (Boolean) True to print every outgoing message
+    decoder ~ (FrameDecoder) Receive buffer of this connection
+    auto_output ~ (deque) (receive time, message) of automatic_output
+                  messages not yet received
+    final_reports ~ (deque) Final reports no command was waiting for
+    metrics ~ solstis_metrics.ClientMetrics recording the traffic and
+              latencies of this client, None to not record them
+    trace ~ solstis_trace.WireTrace recording every frame sent and received,
+            None to not trace
+    kernel_timestamps ~ (Boolean) True to timestamp received messages with
+                        their arrival in the kernel where supported
   """
+  def __init__(self,
+               address='192.168.1.222',
+               port=39933,
+               ip_address='192.168.1.107',
+               timeout=10.,
+               debug=False,
+               sock=None,
+               auto_output_maxlen=None,
+               metrics=None,
+               trace=None,
+               kernel_timestamps=False):
+    self.address = address
+    self.port = port
+    self.ip_address = ip_address
+    self.timeout = timeout
+    self.debug = debug
+    self.sock = sock
+    if sock is not None and hasattr(sock,'setblocking'):
+      sock.setblocking(False)
+    self.decoder = FrameDecoder()
+    self.kernel_timestamps = kernel_timestamps
+    if sock is not None and kernel_timestamps:
+      self.decoder.use_kernel_timestamps(sock)
+    self.auto_output = deque(maxlen=auto_output_maxlen)
+    self.final_reports = deque()
+    self.metrics = metrics
+    self.trace = trace
+    self._replies = {} #transmission_id -> reply, None while awaited
+    self._recv_times = {} #transmission_id -> receive time of its reply
+    self._reports = {} #transmission_id -> final report, None while awaited
+    #IDs of commands that stopped waiting for their final report (resolved by
+    #a poll, timed out or cancelled), oldest first; their late reports are
+    #dropped
+    self._abandoned = {}
+    self._cond = threading.Condition()
+    self._send_lock = threading.Lock()
+    self._reading = False #True while a thread is reading the socket
+    self._local = threading.local() #Deadline of each thread
+    self._cancels = 0 #Incremented by every cancel()
+    #Written to by cancel() to wake up the thread reading the socket
+    self._wakeup = self._wakeup_writer = None
+    self._open_wakeup()
+
+  def _open_wakeup(self):
+    if self._wakeup is None:
+      self._wakeup, self._wakeup_writer = socket.socketpair()
+      self._wakeup.setblocking(False)
+      self._wakeup_writer.setblocking(False)
+
+  def connect(self):
+    """Opens the TCP connection to the Solstis
 
-  send_msg(sock,transmission_id,"fine_tune_resonator",{"setting": [setting]})
-  val = recv_msg(sock)
-  verify_msg(val,op="fine_tune_resonator_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Resonator Fine-Tuning value is out of range.")
-  else:
-    raise SolstisError("fine_tune_resonator Failed; Reason Unknown")
+    Returns:
+      The client itself
+    """
+    self._open_wakeup()
+    self.decoder.clear()
+    self.sock = init_socket(self.address,self.port,self.timeout)
+    if self.kernel_timestamps:
+      self.decoder.use_kernel_timestamps(self.sock)
+    return self
+
+  def use_kernel_timestamps(self,enable=True):
+    """Timestamps received messages with their arrival in the kernel
 
-def etalon_lock(sock,lock,transmission_id=1):
-  """Either locks or unlocks the etalon
+    Returns:
+      True if kernel timestamps are in use, False if unsupported here
+    """
+    self.kernel_timestamps = enable
+    if self.sock is None:
+      return enable
+    return self.decoder.use_kernel_timestamps(self.sock,enable)
+
+  def last_recv_time(self):
+    """Returns the receive time of the reply to the last command the calling
+    thread completed, None if there was none
+    """
+    return getattr(self._local,'recv_time',None)
+
+  def close(self):
+    """Closes the TCP connection to the Solstis"""
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+    if self._wakeup is not None:
+      self._wakeup.close()
+      self._wakeup_writer.close()
+      self._wakeup = self._wakeup_writer = None
+
+  def __enter__(self):
+    if self.sock is None:
+      self.connect()
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
+
+  @contextlib.contextmanager
+  def deadline(self,timeout):
+    """Context manager bounding all waits of the calling thread
+
+    Every command made by this thread within the block fails with
+    TimeoutError once timeout seconds from entering the block have passed,
+    however many round trips it takes. Nested deadlines can only shorten the
+    enclosing one. Example:
+      with client.deadline(0.05):
+        status = client.get_status()
+        wavelength, done = client.poll_wave_m()
+    """
+    outer = getattr(self._local,'deadline',None)
+    deadline = time.perf_counter() + timeout
+    if outer is not None and outer < deadline:
+      deadline = outer
+    self._local.deadline = deadline
+    try:
+      yield
+    finally:
+      self._local.deadline = outer
+
+  @contextlib.contextmanager
+  def _without_deadline(self):
+    """Lifts the deadline of the calling thread within the block"""
+    outer = getattr(self._local,'deadline',None)
+    self._local.deadline = None
+    try:
+      yield
+    finally:
+      self._local.deadline = outer
+
+  def _deadline_passed(self):
+    """Returns True if the deadline of the calling thread has passed"""
+    deadline = getattr(self._local,'deadline',None)
+    return deadline is not None and time.perf_counter() >= deadline
+
+  def _send_timeout(self):
+    """Returns the seconds a send may wait for buffer space, timeout
+    shortened to the deadline of the calling thread
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    lock ~ (Boolean) True to lock the etalon, False to unlock it 
-    transmission_id ~ (int) arbitrary integer for use in communications
-  Returns:
-    Nothing on success
-  Raises:
-    SolstisError on failure
+    Raises:
+      TimeoutError if the deadline has passed
+    """
+    deadline = getattr(self._local,'deadline',None)
+    if deadline is None:
+      return self.timeout
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:
+      raise TimeoutError()
+    return min(self.timeout,remaining)
+
+  def cancel(self):
+    """Makes every wait in progress on this client raise CancelledError
+
+    May be called from any thread. Waits started afterwards are unaffected.
+    """
+    with self._cond:
+      self._cancels += 1
+      self._cond.notify_all()
+    writer = self._wakeup_writer
+    if writer is None:
+      return #Closed, nothing to wake up
+    try:
+      writer.send(b'\0')
+    except OSError:
+      pass #Already woken, or closed meanwhile
+
+  def send(self,op,params=None,transmission_id=None,debug=None):
+    """Sends a single command to the Solstis
+
+    Parameters:
+      op ~ String containing operating command
+      params ~ dict containing Solstis Key/Value pairs as necessary
+      transmission_id ~ (int) ID of the message, allocated if None
+      debug ~ (Boolean) True to print the message, defaults to self.debug
+    Returns:
+      The transmission ID of the message sent
+    """
+    if transmission_id is None:
+      with self._cond:
+        transmission_id = self.next_transmission_id()
+    data = self._encode(op,params,transmission_id,debug)
+    if self.sock is None:
+      raise ConnectionError("Not connected to the Solstis.")
+    with self._send_lock:
+      sendall(self.sock,data,self._send_timeout())
+    if self.metrics is not None:
+      self.metrics.sent(len(data))
+    if self.trace is not None:
+      self.trace.sent(op,data)
+    return transmission_id
+
+  def recv(self,timeout=None):
+    """Receives the next complete message from the Solstis
+
+    Note: This reads the socket directly, bypassing the dispatching of
+    messages to the commands waiting for them.
+
+    Parameters:
+      timeout ~ (float) Seconds to wait, defaults to self.timeout
+    Returns:
+      The decoded JSON message as a dict
+    Raises:
+      SolstisError on invalid data
+      TimeoutError if no complete message arrived within timeout
+    """
+    if timeout is None:
+      timeout = self.timeout
+    return self._decode(self.decoder.recv_frame(self.sock,timeout))
+
+  def _decode(self,frame):
+    """Decodes a received frame, timing the parse if metrics are recorded
+    and tracing it if a trace is kept
+    """
+    if self.metrics is None:
+      msg = decode_message(frame)
+    else:
+      t0 = time.perf_counter()
+      msg = decode_message(frame)
+      self.metrics.received(len(frame),time.perf_counter() - t0)
+    if self.trace is not None:
+      self.trace.received(msg["message"]["op"],frame,self.decoder.recv_time)
+    return msg
+
+  def _dispatch(self,msg,recv_time=None):
+    """Stores a received message for the command waiting for it
+
+    Must be called with self._cond held. Automatic output is queued together
+    with recv_time, the perf_counter time at which it was read.
+    """
+    op = msg["message"]["op"]
+    if op == "automatic_output":
+      self.auto_output.append((recv_time,msg))
+      if self.metrics is not None:
+        self.metrics.auto_output(recv_time)
+      return
+    transmission_id = msg["message"]["transmission_id"][0]
+    if op.endswith("_f_r"):
+      waiting = self._reports
+      if transmission_id in self._abandoned and transmission_id not in waiting:
+        del self._abandoned[transmission_id]
+        return
+      if transmission_id not in waiting:
+        #Route a report with an ID this client never issued to the oldest
+        #waiting command
+        transmission_id = next((i for i, val in waiting.items()
+                                if val is None),None)
+        if transmission_id is None:
+          self.final_reports.append(msg)
+          return
+    else:
+      waiting = self._replies
+      if transmission_id in waiting:
+        self._recv_times[transmission_id] = recv_time
+    if transmission_id in waiting:
+      waiting[transmission_id] = msg
+    #Replies nobody waits for (e.g. after a timeout) are dropped
+
+  def _wait(self,take,timeout=None):
+    """Waits for a message, reading and dispatching the stream meanwhile
+
+    Parameters:
+      take ~ Function returning the awaited message or None if it has not
+             arrived yet, called with self._cond held
+      timeout ~ (float) Seconds to wait, defaults to self.timeout, shortened
+                to the deadline of the calling thread if that is earlier
+    Returns:
+      The message returned by take
+    Raises:
+      TimeoutError if the message did not arrive within timeout
+      CancelledError if cancel() was called while waiting
+    """
+    if timeout is None:
+      timeout = self.timeout
+    deadline = time.perf_counter() + timeout
+    outer = getattr(self._local,'deadline',None)
+    if outer is not None and outer < deadline:
+      deadline = outer
+    with self._cond:
+      cancels = self._cancels
+      while True:
+        if self._cancels != cancels:
+          raise CancelledError()
+        msg = take()
+        if msg is not None:
+          return msg
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+          raise TimeoutError()
+        if self._reading:
+          #Another thread reads the socket and notifies on each message
+          self._cond.wait(remaining)
+          continue
+        if self.sock is None:
+          raise ConnectionError("Not connected to the Solstis.")
+        self._reading = True
+        self._cond.release()
+        try:
+          try:
+            frame = self.decoder.recv_frame(self.sock,remaining,self._wakeup)
+          except CancelledError:
+            frame = None
+            try:
+              while self._wakeup.recv(64):
+                pass
+            except BlockingIOError:
+              pass
+          if frame is not None:
+            msg = self._decode(frame)
+            recv_time = self.decoder.recv_time
+        finally:
+          self._cond.acquire()
+          self._reading = False
+          self._cond.notify_all()
+        if frame is not None:
+          self._dispatch(msg,recv_time)
+
+  def _take(self,waiting,transmission_id):
+    val = waiting[transmission_id]
+    if val is not None:
+      del waiting[transmission_id]
+    return val
+
+  def _register(self,transmission_id,report):
+    """Reserves a transmission ID for a command, must hold self._cond
+
+    Parameters:
+      transmission_id ~ (int) ID requested by the caller, allocated if None
+      report ~ (Boolean) True if the command is followed by a final report
+    Returns:
+      The reserved transmission ID
+    """
+    if transmission_id is None:
+      transmission_id = self.next_transmission_id()
+      while (transmission_id in self._replies or
+             transmission_id in self._reports or
+             transmission_id in self._abandoned):
+        transmission_id = self.next_transmission_id()
+    elif (transmission_id in self._replies or
+          transmission_id in self._reports):
+      raise SolstisError("Transmission ID "+str(transmission_id)+
+                         " is already in use.")
+    self._abandoned.pop(transmission_id,None)
+    self._replies[transmission_id] = None
+    if report:
+      self._reports[transmission_id] = None
+    return transmission_id
+
+  def _unregister(self,transmission_ids):
+    with self._cond:
+      for transmission_id in transmission_ids:
+        self._replies.pop(transmission_id,None)
+        if (transmission_id in self._reports and
+            self._reports.pop(transmission_id) is None):
+          #The report is still to come, unless the command failed
+          self._abandoned[transmission_id] = None
+          if len(self._abandoned) > MAX_ABANDONED_REPORTS:
+            del self._abandoned[next(iter(self._abandoned))]
+        self._recv_times.pop(transmission_id,None)
+
+  def _collect(self,op,result,transmission_id,report,sent=None):
+    """Waits for the reply (and final report) of a sent command
+
+    sent is the perf_counter time the command was sent, from which the round
+    trip times recorded in self.metrics are measured.
+    """
+    val = self._wait_reply(op,self._replies,transmission_id,sent)
+    self._local.recv_time = self._recv_times.pop(transmission_id,None)
+    verify_msg(val,transmission_id=transmission_id,op=op+"_reply")
+    val = result(val["message"]["parameters"])
+    if report is None:
+      return val
+    val = self._wait_reply(op+"_f_r",self._reports,transmission_id,sent)
+    verify_msg(val,op=op+"_f_r")
+    return report(val["message"]["parameters"])
+
+  def _wait_reply(self,op,waiting,transmission_id,sent):
+    try:
+      val = self._wait(lambda: self._take(waiting,transmission_id))
+    except TimeoutError:
+      if self.metrics is not None:
+        self.metrics.timeout(op)
+      raise
+    if self.metrics is not None and sent is not None:
+      self.metrics.reply(op,time.perf_counter() - sent)
+    return val
+
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    with self._cond:
+      transmission_id = self._register(transmission_id,report is not None)
+    try:
+      sent = time.perf_counter()
+      self.send(op,params,transmission_id)
+      return self._collect(op,result,transmission_id,report,sent)
+    finally:
+      self._unregister((transmission_id,))
+
+  def batch(self):
+    """Returns a SolstisBatch collecting commands to send in one write"""
+    return SolstisBatch(self)
+
+  def _call_many(self,calls):
+    """Sends several commands in one write and collects all their replies
+
+    Parameters:
+      calls ~ List of (op, params, result, transmission_id, report) tuples as
+              taken by _call
+    Returns:
+      List with the result of every command in order, or the SolstisError or
+      TimeoutError it raised
+    """
+    with self._cond:
+      transmission_ids = []
+      try:
+        for op, params, result, transmission_id, report in calls:
+          transmission_ids.append(self._register(transmission_id,
+                                                 report is not None))
+      except SolstisError:
+        self._unregister(transmission_ids)
+        raise
+    try:
+      messages = [self._encode(call[0],call[1],transmission_id)
+                  for call, transmission_id in zip(calls,transmission_ids)]
+      data = b''.join(messages)
+      if self.sock is None:
+        raise ConnectionError("Not connected to the Solstis.")
+      sent = time.perf_counter()
+      with self._send_lock:
+        sendall(self.sock,data,self._send_timeout())
+      if self.metrics is not None:
+        self.metrics.sent(len(data),len(calls))
+      if self.trace is not None:
+        for call, message in zip(calls,messages):
+          self.trace.sent(call[0],message)
+      results = []
+      for call, transmission_id in zip(calls,transmission_ids):
+        try:
+          results.append(self._collect(call[0],call[2],transmission_id,
+                                       call[4],sent))
+        except (SolstisError,TimeoutError) as exc:
+          results.append(exc)
+      return results
+    finally:
+      self._unregister(transmission_ids)
+
+  def start_set_wave_m(self,
+                       wavelength,
+                       poll_interval=0.01,
+                       backoff=2.,
+                       max_interval=0.5,
+                       deadline=60.,
+                       transmission_id=None):
+    """Sets wavelength without waiting for the tuning to finish
+
+    The move requests a final report and is tracked on a background thread:
+    the returned future resolves when the report arrives or when poll_wave_m
+    shows tuning is done, whichever comes first. Polls start poll_interval
+    apart and the interval grows by backoff up to max_interval so the
+    controller is not flooded during long moves.
+
+    Parameters:
+      wavelength ~ (float) wavelength to tune to in nanometers
+      poll_interval ~ (float) Seconds before the first poll
+      backoff ~ (float) Factor applied to the interval after each poll
+      max_interval ~ (float) Longest interval between polls in seconds
+      deadline ~ (float) Seconds after which the future fails with
+                 TimeoutError
+      transmission_id ~ (int) Arbitrary integer
+    Returns:
+      concurrent.futures.Future resolving to the measured wavelength once
+      tuning is done, or failing with the SolstisError of the command
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    thread = threading.Thread(target=self._run_move,
+                              args=(future,"set_wave_m",wavelength,
+                                    poll_interval,backoff,max_interval,
+                                    deadline,transmission_id),
+                              daemon=True)
+    thread.start()
+    return future
+
+  def start_move_wave_t(self,
+                        wavelength,
+                        poll_interval=0.01,
+                        backoff=2.,
+                        max_interval=0.5,
+                        deadline=60.,
+                        transmission_id=None):
+    """Sets the wavelength from the wavelength table without waiting
+
+    Tuning is tracked with poll_move_wave_t on a background thread, see
+    start_set_wave_m for the polling parameters.
+
+    Returns:
+      concurrent.futures.Future resolving to the wavelength once tuning is
+      done, or failing with the SolstisError of the command
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    thread = threading.Thread(target=self._run_move,
+                              args=(future,"move_wave_t",wavelength,
+                                    poll_interval,backoff,max_interval,
+                                    deadline,transmission_id),
+                              daemon=True)
+    thread.start()
+    return future
+
+  def _run_move(self,future,op,wavelength,poll_interval,backoff,max_interval,
+                deadline,transmission_id):
+    try:
+      future.set_result(self._move(op,wavelength,poll_interval,backoff,
+                                   max_interval,deadline,transmission_id))
+    except BaseException as exc:
+      future.set_exception(exc)
+
+  def _move(self,op,wavelength,poll_interval,backoff,max_interval,deadline,
+            transmission_id):
+    """Sends a move and waits for the final report or a done poll"""
+    end_time = time.perf_counter() + deadline
+    if op == "set_wave_m":
+      command = COMMANDS["set_wave_m_f_r"]
+      poll = self.poll_wave_m
+    else:
+      command = COMMANDS["move_wave_t"]
+      poll = self.poll_move_wave_t
+    params = command.encode(wavelength)
+    result = command.result
+    report = op == "set_wave_m"
+    with self._cond:
+      transmission_id = self._register(transmission_id,report)
+      cancels = self._cancels
+    try:
+      sent = time.perf_counter()
+      self.send(op,params,transmission_id)
+      self._collect(op,result,transmission_id,None,sent)
+      interval = poll_interval
+      while True:
+        with self._cond:
+          #Woken early if another thread dispatches the final report or
+          #cancels
+          remaining = end_time - time.perf_counter()
+          if report:
+            self._cond.wait_for(lambda: self._reports[transmission_id]
+                                          is not None or
+                                        self._cancels != cancels,
+                                min(interval,max(remaining,0.)))
+            val = self._reports[transmission_id]
+          else:
+            self._cond.wait(min(interval,max(remaining,0.)))
+            val = None
+          if self._cancels != cancels:
+            raise CancelledError()
+        if val is not None:
+          verify_msg(val,op=op+"_f_r")
+          if self.metrics is not None:
+            self.metrics.reply(op+"_f_r",time.perf_counter() - sent)
+          return _set_wave_m_f_r_result(val["message"]["parameters"])
+        if time.perf_counter() >= end_time:
+          raise TimeoutError("Tuning to "+str(wavelength)+
+                             " did not finish within the deadline")
+        current, done = poll()
+        if done:
+          return current
+        interval = min(interval*backoff,max_interval)
+    finally:
+      self._unregister((transmission_id,))
+
+  def recv_auto_output(self,timeout=None,with_time=False):
+    """Receives an automatic message from the Solstis during a TeraScan
+
+    Parameters:
+      timeout ~ (float) Seconds to wait, defaults to self.timeout
+      with_time ~ (Boolean) True to also return the time of receipt
+    Returns:
+      If with_time is True, a tuple of the perf_counter time at which the
+      message was read from the socket (before parsing), or arrived in the
+      kernel with kernel timestamps, and the dictionary below, otherwise just
+      A dictionary object containing the following key/value pairs:
+        "wavelength" ~ The current wavelength reading in nm (between 650-1100)
+        "status" ~ String being one of "start", "repeat", "recover", "scan",
+                   or "end". See Solstis_3_TCP_JSON_protocol_V21.pdf for
+                   details
+                   Note: If pausing is configured, then a contiue message must
+                   be sent after reveiving any "start" or "repeat" values
+    Raises:
+      SolstisError on bad transmission
+      TimeoutError when the socket times out
+    """
+    try:
+      recv_time, val = self._wait(lambda: self.auto_output.popleft()
+                                            if len(self.auto_output) > 0
+                                            else None,
+                                  timeout)
+    except socket.timeout:
+      raise TimeoutError
+    verify_msg(val,op="automatic_output")
+    val = _auto_output_result(val["message"]["parameters"])
+    if with_time:
+      return recv_time, val
+    return val
+
+class SolstisBatch(SolstisCommands):
+  """Commands queued for a SolstisClient and sent back-to-back in one write
+
+  Calling a command method on the batch only queues it (returning its index).
+  execute() then writes all queued requests with a single sendall and
+  collects the replies, so N commands cost one round trip instead of N.
+  Example:
+    batch = client.batch()
+    batch.get_status()
+    batch.poll_wave_m()
+    status, (wavelength, done) = batch.execute()
   """
+  def __init__(self,client):
+    self.client = client
+    self.calls = []
 
-  if lock == True:
-    lock = "on"
-  else:
-    lock = "off"
+  @property
+  def ip_address(self):
+    return self.client.ip_address
 
-  send_msg(sock,transmission_id,"etalon_lock",{"operation": lock})
-  val = recv_msg(sock)
-  verify_msg(val,op="etalon_lock_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  else:
-    raise SolstisError("etalon_lock Failed; Reason Unknown")
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    self.calls.append((op,params,result,transmission_id,report))
+    return len(self.calls) - 1
 
-def fast_scan_start(sock,
-                    scan_type="etalon_continuous",
-                    width=0.01,
-                    time=0.01,
-                    transmission_id=1):
-  """Starts a Fast scan centered at the current set wavelength
+  def __len__(self):
+    return len(self.calls)
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    scan_type ~ One of: "etalon_continuous", "etalon_single",
-                        "cavity_continuous", "cavity_single",
-                        "resonator_continuous", "resonator_single",
-                        "ecd_continuous", "fringe_test", "resonator_ramp",
-                        "ecd_ramp", "cavity_triangular", "resonator_triangular"
-                        See Manual for details
-    width ~ (float) Width of scan about center frequency in GHz
-    time ~ (float) Duration of scan in seconds. Will ramp at max speed if time
-           segment is too small.
-    transmission_id ~ (int) Arbitrary integer for use in communications
-  Returns:
-    Nothing on a succesful execution
-  Raises:
-    SolstisError on failed execution
-  """
+  def execute(self,raise_errors=False):
+    """Sends the queued commands and returns their results in order
 
-  send_msg(sock,transmission_id,"fast_scan_start",
-                                {"scan": scan_type,
-                                 "width": width,
-                                 "time": time} )
-  val = recv_msg(sock)
-  verify_msg(val,op="fast_scan_start_reply",transmission_id=transmission_id)
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Fast Scan Failed: Scan width too large for position")
-  elif status == 2:
-    raise SolstisError("Fast Scan Failed: No reference cavity fitted")
-  elif status == 3:
-    raise SolstisError("Fast Scan Failed: no ERC fitted")
-  elif status == 4:
-    raise SolstisError("Fast Scan Failed: Invalid Scan Type requested")
-  else:
-    raise SolstisError("Fast Scan Failed: Time > 10000 seconds")
+    Parameters:
+      raise_errors ~ (Boolean) True to raise the first per-command error
+                     once all replies were collected
+    Returns:
+      List with the result of every command, or the SolstisError or
+      TimeoutError raised by that command if raise_errors is False
+    """
+    calls = self.calls
+    self.calls = []
+    results = self.client._call_many(calls)
+    if raise_errors:
+      for val in results:
+        if isinstance(val,Exception):
+          raise val
+    return results
+
+#Clients backing the socket based functions below, one per socket
+_clients = weakref.WeakKeyDictionary()
+
+def client_for(sock):
+  """Returns the SolstisClient wrapping a socket, creating it if necessary"""
+  client = _clients.get(sock)
+  if client is None:
+    client = SolstisClient(sock=sock)
+    _clients[sock] = client
+  return client
 
-def fast_scan_poll(sock, scan_type="etalon_continuous", transmission_id=1):
-  """Polls a currently running fast scan.
+def send_msg(s,transmission_id=1,op='start_link',params=None,debug=False):
+  """
+  Function to carry out the most basic communication send function
+  s ~ Socket
+  transmission_id ~ Arbitrary(?) integer
+  op ~ String containing operating command
+  params ~ dict containing Solstis Key/Value pairs as necessary
+  """
+  client_for(s).send(op,params,transmission_id,debug)
+
+def recv_msg(s,timeout=10.):
+  """Receives the next complete message from the Solstis
 
   Parameters:
-    sock ~ Sock object to use for communications
-    scan_type ~ One of: "etalon_continuous", "etalon_single",
-                        "cavity_continuous", "cavity_single",
-                        "resonator_continuous", "resonator_single",
-                        "ecd_continuous", "fringe_test", "resonator_ramp",
-                        "ecd_ramp", "cavity_triangular", "resonator_triangular"
-                        See Manual for details
-    transmission_id ~ (int) Arbitrary integer to use for communications
+    s ~ Socket
+    timeout ~ (float) Seconds after which to give up waiting
   Returns:
-    Tuple containing (in increasing index order):
-      -floating point value representing the current tuner value
-      -Boolean stating whether tuning is done/inactive (True = Not scanning)
+    The decoded JSON message as a dict
   Raises:
-    SolstisError on execution failure
+    SolstisError on invalid data
+    TimeoutError if no complete message arrived within timeout
   """
+  return client_for(s).recv(timeout)
 
-  send_msg(sock,transmission_id,"fast_scan_poll",{"scan": scan_type})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="fast_scan_poll_reply")
-  status = val["message"]["parameters"]["status"][0]
-  tuner_value = val["message"]["parameters"]["tuner_value"][0]
-  if status == 1:
-    status = False
-  else:
-    status = True
-  return (tuner_value,status)
+#Socket based command functions, see the SolstisClient methods of the same
+#name for their documentation. Transmission IDs are allocated by the client
+#unless given.
+def start_link(sock,transmission_id=None,ip_address='192.168.1.107'):
+  return client_for(sock).start_link(transmission_id,ip_address)
 
-def fast_scan_stop(sock,scan_type="etalon_continuous",transmission_id=1):
-  """Stops a fast-scan in progress
+def set_wave_m(sock, wavelength, transmission_id=None):
+  return client_for(sock).set_wave_m(wavelength,transmission_id)
 
-  Parameters:
-    sock ~ Sock object to use for communications
-    scan_type ~ One of: "etalon_continuous", "etalon_single",
-                        "cavity_continuous", "cavity_single",
-                        "resonator_continuous", "resonator_single",
-                        "ecd_continuous", "fringe_test", "resonator_ramp",
-                        "ecd_ramp", "cavity_triangular", "resonator_triangular"
-                        See Manual for details
-    transmission_id ~ (int) Arbitrary integer to use for communications
-  Returns:
-    Nothing on successful execution
-  Raises:
-    SolstisError on failed execution
-  """
+def set_wave_m_f_r(sock, wavelength, transmission_id=None):
+  return client_for(sock).set_wave_m_f_r(wavelength,transmission_id)
 
-  send_msg(sock,transmission_id,"fast_scan_stop",{"scan": scan_type})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="fast_scan_stop_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("fast_scan_stop Failed; Cause unknown")
-  elif status == 2:
-    raise SolstisError("fast_scan_stop Failed; Reference Cavity not fitted.")
-  elif status == 3:
-    raise SolstisError("fast_scan_stop Failed; ECD not fitted.")
-  else:
-    raise solstisError("fast_scan_stop Failed; Invalid Scan Type.")
+def poll_wave_m(sock,transmission_id=None):
+  return client_for(sock).poll_wave_m(transmission_id)
 
-def fast_scan_stop_nr(sock,scan_type="etalon_continuous",transmission_id=1):
-  """Stops a fast-scan in progress without returning to the original position
+def move_wave_t(sock, wavelength, transmission_id=None):
+  return client_for(sock).move_wave_t(wavelength,transmission_id)
 
-  Parameters:
-    sock ~ Sock object to use for communications
-    scan_type ~ One of: "etalon_continuous", "etalon_single",
-                        "cavity_continuous", "cavity_single",
-                        "resonator_continuous", "resonator_single",
-                        "ecd_continuous", "fringe_test", "resonator_ramp",
-                        "ecd_ramp", "cavity_triangular", "resonator_triangular"
-                        See Manual for details
-    transmission_id ~ (int) Arbitrary integer to use for communications
-  Returns:
-    Nothing on successful execution
-  Raises:
-    SolstisError on failed execution
-  """
+def poll_move_wave_t(sock,transmission_id=None):
+  return client_for(sock).poll_move_wave_t(transmission_id)
 
-  send_msg(sock,transmission_id,"fast_scan_stop_nr",{"scan": scan_type})
-  val = recv_msg(sock)
-  verify_msg(val,transmission_id=transmission_id,op="fast_scan_stop_nr_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("fast_scan_stop_nr Failed; Cause unknown")
-  elif status == 2:
-    raise SolstisError("fast_scan_stop_nr Failed; Reference Cavity not fitted.")
-  elif status == 3:
-    raise SolstisError("fast_scan_stop_nr Failed; ECD not fitted.")
-  else:
-    raise solstisError("fast_scan_stop_nr Failed; Invalid Scan Type.")
+def scan_stitch_initialize(sock,
+                           scan_type,
+                           start,
+                           stop,
+                           scan_rate,
+                           transmission_id=None):
+  return client_for(sock).scan_stitch_initialize(scan_type,start,stop,
+                                                 scan_rate,transmission_id)
 
-def set_wave_tolerance_m(sock,tolerance=1.0,transmission_id=1):
-  """Sets the tolerance for the sending of the set_wave_m final report
+def scan_stitch_op(sock, scan_type, operation, transmission_id=None):
+  return client_for(sock).scan_stitch_op(scan_type,operation,transmission_id)
 
-  Parameters:
-    sock ~ Socket object to use for communications
-    tolerance ~ (float) New tolerance value
-    transmission_id ~ (int) Arbitrary integer for use in communications
-  Returns:
-    Nothing on successful execution
-  Raises:
-    SolstisError on failed execution
-  """
-  send_msg(sock,transmission_id,"set_wave_tolerance_m",{"tolerance": tolerance})
-  val = recv_msg(sock)
-  verify_msg(val,
-             transmission_id=transmission_id,
-             op="set_wave_tolerance_m_reply")
-  status = val["message"]["parameters"]["status"][0]
-  if status == 0:
-    return
-  elif status == 1:
-    raise SolstisError("Could not set tolerance; No wavemeter connected")
-  else:
-    raise SolstisError("Could not set tolerance; Tolerance Value Out of Range")
+def scan_stitch_status(sock,scan_type,transmission_id=None):
+  return client_for(sock).scan_stitch_status(scan_type,transmission_id)
+
+def terascan_output(sock,
+                    transmission_id=None,
+                    operation=True,
+                    delay=1,
+                    update_step=1,
+                    pause=False):
+  return client_for(sock).terascan_output(transmission_id,operation,delay,
+                                          update_step,pause)
+
+def recv_auto_output(sock):
+  return client_for(sock).recv_auto_output()
+
+def terascan_continue(sock,transmission_id=None):
+  return client_for(sock).terascan_continue(transmission_id)
+
+def get_status(sock, transmission_id=None):
+  return client_for(sock).get_status(transmission_id)
+
+def tune_etalon(sock, setting, transmission_id=None):
+  return client_for(sock).tune_etalon(setting,transmission_id)
+
+def tune_resonator(sock, setting, transmission_id=None):
+  return client_for(sock).tune_resonator(setting,transmission_id)
+
+def fine_tune_resonator(sock, setting, transmission_id=None):
+  return client_for(sock).fine_tune_resonator(setting,transmission_id)
+
+def etalon_lock(sock,lock,transmission_id=None):
+  return client_for(sock).etalon_lock(lock,transmission_id)
+
+def fast_scan_start(sock,
+                    scan_type="etalon_continuous",
+                    width=0.01,
+                    time=0.01,
+                    transmission_id=None):
+  return client_for(sock).fast_scan_start(scan_type,width,time,transmission_id)
+
+def fast_scan_poll(sock, scan_type="etalon_continuous", transmission_id=None):
+  return client_for(sock).fast_scan_poll(scan_type,transmission_id)
+
+def fast_scan_stop(sock,scan_type="etalon_continuous",transmission_id=None):
+  return client_for(sock).fast_scan_stop(scan_type,transmission_id)
+
+def fast_scan_stop_nr(sock,scan_type="etalon_continuous",transmission_id=None):
+  return client_for(sock).fast_scan_stop_nr(scan_type,transmission_id)
+
+def set_wave_tolerance_m(sock,tolerance=1.0,transmission_id=None):
+  return client_for(sock).set_wave_tolerance_m(tolerance,transmission_id)
@@ -0,0 +1,207 @@
+# Driving several Solstis controllers in parallel from one process
+
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from solstis_functions import SolstisClient, SolstisError
+from solstis_sweep import (C_NM_GHZ, PollSettle, sweep_point, record_point,
+                           new_results, check_tolerance)
+
+class SolstisManager:
+  """Connections to several Solstis controllers driven concurrently
+
+  Commands are run on every laser at once from a thread pool with one worker
+  per laser. Each laser has its own SolstisClient, so the lasers only wait on
+  their own controller and the throughput grows with the number of lasers.
+
+  Results of commands run on several lasers are returned as a dict of laser
+  name to result. With raise_errors False a laser whose command failed has
+  the SolstisError, OSError (e.g. TimeoutError, ConnectionError) or
+  threading.BrokenBarrierError in place of its result, so one faulty unit
+  does not hide the results of the others.
+
+  lasers maps each laser name to the (address, port) of its controller, or to
+  a SolstisClient to use as is. ip_address, timeout and debug are passed to
+  the clients created.
+
+  Attributes:
+    clients ~ (dict) Laser name -> SolstisClient
+  """
+  def __init__(self,
+               lasers,
+               ip_address='192.168.1.107',
+               timeout=10.,
+               debug=False):
+    self.clients = {}
+    for name, laser in lasers.items():
+      if isinstance(laser,SolstisClient):
+        self.clients[name] = laser
+      else:
+        address, port = laser
+        self.clients[name] = SolstisClient(address,port,ip_address,timeout,
+                                           debug)
+    self._pool = ThreadPoolExecutor(max_workers=max(len(self.clients),1),
+                                    thread_name_prefix="solstis")
+
+  def __len__(self):
+    return len(self.clients)
+
+  def __getitem__(self,name):
+    return self.clients[name]
+
+  def connect(self,start_link=True):
+    """Connects to every controller at once and starts their links"""
+    def connect(client):
+      if client.sock is None:
+        client.connect()
+      if start_link:
+        client.start_link()
+    self._gather({name: self._pool.submit(connect,client)
+                  for name, client in self.clients.items()},True)
+
+  def close(self):
+    """Closes every connection and stops the thread pool"""
+    for client in self.clients.values():
+      client.close()
+    self._pool.shutdown()
+
+  def __enter__(self):
+    self.connect()
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
+
+  def _gather(self,futures,raise_errors):
+    results = {}
+    for name, future in futures.items():
+      try:
+        results[name] = future.result()
+      except (SolstisError,OSError,threading.BrokenBarrierError) as exc:
+        if raise_errors:
+          raise
+        results[name] = exc
+    return results
+
+  def submit(self,name,command,*args,**kwargs):
+    """Runs a command on one laser in the thread pool
+
+    Returns:
+      concurrent.futures.Future of the command's result
+    """
+    return self._pool.submit(getattr(self.clients[name],command),*args,
+                             **kwargs)
+
+  def run(self,command,*args,names=None,raise_errors=False,**kwargs):
+    """Runs the same command with the same arguments on several lasers
+
+    Parameters:
+      command ~ (str) Name of the SolstisClient method, e.g. "get_status"
+      names ~ Names of the lasers to run on, all lasers if None
+      raise_errors ~ (Boolean) True to raise the first per-laser error once
+                     all lasers finished
+    Returns:
+      dict of laser name -> result
+    """
+    if names is None:
+      names = self.clients
+    return self._gather({name: self.submit(name,command,*args,**kwargs)
+                         for name in names},raise_errors)
+
+  def run_each(self,command,args,raise_errors=False):
+    """Runs a command on several lasers with different arguments
+
+    Parameters:
+      command ~ (str) Name of the SolstisClient method
+      args ~ (dict) Laser name -> tuple of arguments of that laser
+      raise_errors ~ (Boolean) See run
+    Returns:
+      dict of laser name -> result
+    """
+    return self._gather({name: self.submit(name,command,*val)
+                         for name, val in args.items()},raise_errors)
+
+  def get_status(self,raise_errors=False):
+    """Returns the get_status of every laser as a dict of laser name -> status
+    """
+    return self.run("get_status",raise_errors=raise_errors)
+
+  def start_terascans(self,scan_type,ranges,scan_rate,timeout=None,
+                      raise_errors=True):
+    """Initializes a TeraScan on several lasers and starts them together
+
+    Each laser's scan is initialized on its own pool thread, which then waits
+    for the others so the start commands are released at the same moment.
+    If a laser fails to initialize, or the lasers do not all get there
+    within timeout, no scan is started: the failed laser reports its error
+    and the others threading.BrokenBarrierError.
+
+    Parameters:
+      scan_type ~ (TeraScan Enum) Type of scan to perform
+      ranges ~ (dict) Laser name -> (start, stop) wavelengths of its scan
+      scan_rate ~ (TeraScan Enum) Scan rate of the scans
+      timeout ~ (float) Seconds an initialized laser waits for the others,
+                defaults to the longest client timeout
+      raise_errors ~ (Boolean) See run
+    Returns:
+      dict of laser name -> perf_counter time its start was acknowledged
+    Raises:
+      SolstisError if a scan could not be initialized or started
+      threading.BrokenBarrierError if the lasers were not all initialized
+      within timeout
+    """
+    if timeout is None:
+      timeout = max([self.clients[name].timeout for name in ranges],
+                    default=0.)
+    barrier = threading.Barrier(len(ranges),timeout=timeout)
+    def run(client,start,stop):
+      try:
+        client.scan_stitch_initialize(scan_type,start,stop,scan_rate)
+      except BaseException:
+        barrier.abort() #Releases the other lasers without starting
+        raise
+      barrier.wait()
+      client.scan_stitch_op(scan_type,"start")
+      return time.perf_counter()
+    return self._gather({name: self._pool.submit(run,self.clients[name],
+                                                 start,stop)
+                         for name, (start, stop) in ranges.items()},
+                        raise_errors)
+
+  def lockstep_sweep(self,grids,frequency=False,settle=None,tolerance=None):
+    """Sweeps several lasers together, step by step
+
+    At every step all lasers are set to their next setpoint at once, and the
+    next step only starts once every laser has settled. Use this when the
+    lasers must be at corresponding setpoints at the same time; independent
+    sweeps finish sooner with solstis_sweep.sweep run on each client.
+
+    Parameters:
+      grids ~ (dict) Laser name -> grid of setpoints, all of the same length,
+              in nm or in GHz if frequency is True
+      frequency ~ (Boolean) True if the grids hold frequencies in GHz
+      settle ~ Settle policy, see solstis_sweep.sweep
+      tolerance ~ (float) See solstis_sweep.sweep
+    Returns:
+      dict of laser name -> structured array of solstis_sweep.SWEEP_DTYPE
+    """
+    grids = {name: np.asarray(grid,dtype=np.float64)
+             for name, grid in grids.items()}
+    lengths = set(len(grid) for grid in grids.values())
+    if len(lengths) > 1:
+      raise ValueError("All grids of a lockstep sweep must have one length")
+    if settle is None:
+      settle = PollSettle()
+    wavelengths = {name: C_NM_GHZ/grid if frequency else grid
+                   for name, grid in grids.items()}
+    results = {name: new_results(grid) for name, grid in grids.items()}
+    for i in range(lengths.pop() if lengths else 0):
+      futures = {name: self._pool.submit(sweep_point,self.clients[name],
+                                         float(wavelengths[name][i]),settle)
+                 for name in grids}
+      for name, future in futures.items():
+        record_point(results[name][i],future.result(),frequency)
+    for val in results.values():
+      check_tolerance(val,tolerance)
+    return results
@@ -0,0 +1,251 @@
+# Latency histograms and traffic counters of a Solstis client
+#
+# Pass a ClientMetrics to a client to instrument it:
+#   metrics = ClientMetrics()
+#   client = SolstisClient(address,port,metrics=metrics)
+#   ...
+#   print(metrics.snapshot()["rtt"]["poll_wave_m"])
+#   metrics.write("/var/lib/node_exporter/solstis.prom")
+
+import os
+import math
+import time
+import threading
+from collections import deque
+
+class Histogram:
+  """Histogram of durations on logarithmic bins
+
+  Bin i > 0 counts values in [low*factor**(i-1), low*factor**i), bin 0 the
+  values below low and the last bin everything above. With the defaults the
+  bins span 10 us to about 5 min with a resolution of 19 %.
+
+  Attributes:
+    low ~ (float) Upper edge of the first bin in seconds
+    factor ~ (float) Ratio between successive bin edges
+    counts ~ (list) Number of values in each bin
+    count ~ (int) Number of values recorded
+    total ~ (float) Sum of the values recorded
+    max ~ (float) Largest value recorded
+  """
+  def __init__(self,low=1e-5,factor=2**0.25,bins=100):
+    self.low = low
+    self.factor = factor
+    self.counts = [0]*bins
+    self.count = 0
+    self.total = 0.
+    self.max = 0.
+    self._log_factor = math.log(factor)
+
+  def add(self,value):
+    if value < self.low:
+      i = 0
+    else:
+      i = min(int(math.log(value/self.low)/self._log_factor) + 1,
+              len(self.counts) - 1)
+    self.counts[i] += 1
+    self.count += 1
+    self.total += value
+    if value > self.max:
+      self.max = value
+
+  def edge(self,i):
+    """Returns the upper edge of bin i"""
+    if i == len(self.counts) - 1:
+      return math.inf
+    return self.low*self.factor**i
+
+  def quantile(self,q):
+    """Returns the upper edge of the bin holding the q quantile, capped at max
+    """
+    if self.count == 0:
+      return math.nan
+    target = q*self.count
+    seen = 0
+    for i, n in enumerate(self.counts):
+      seen += n
+      if seen >= target and n > 0:
+        return min(self.edge(i),self.max)
+    return self.max
+
+  def summary(self):
+    """Returns a dict of count, mean, p50, p90, p99 and max in seconds"""
+    return {"count": self.count,
+            "mean": self.total/self.count if self.count else math.nan,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max}
+
+class ClientMetrics:
+  """Instrumentation of a SolstisClient, AsyncSolstisClient or
+  SupervisedClient
+
+  The client reports every message it sends and receives, the round trip
+  time of every command by op (final reports under op+"_f_r", measured from
+  the request), the time spent parsing each received message, commands that
+  timed out, commands repeated after a reconnect and automatic output
+  messages. Comparing the round trip times with the parse times tells the
+  controller and network apart from the Python side.
+
+  All methods are thread safe. One ClientMetrics may be shared by several
+  clients to aggregate them.
+
+  Attributes:
+    labels ~ (dict) Label -> value added to every exported metric, e.g.
+             {"laser": "ti_sapph"}
+    window ~ (float) Seconds over which auto_output_rate is computed
+    bytes_out ~ (int) Bytes sent
+    bytes_in ~ (int) Bytes of messages received
+    messages_out ~ (int) Messages sent
+    messages_in ~ (int) Messages received
+    rtt ~ (dict) op -> Histogram of the command round trip times
+    parse_time ~ (Histogram) Seconds spent decoding each received message
+    timeouts ~ (dict) op -> number of commands that timed out
+    retries ~ (dict) op -> number of commands sent again after a reconnect
+    recoveries ~ (int) Reconnects of a SupervisedClient
+    auto_outputs ~ (int) Automatic output messages received
+  """
+  def __init__(self,labels=None,window=10.):
+    self.labels = {} if labels is None else dict(labels)
+    self.window = window
+    self.start_time = time.time()
+    self.bytes_out = 0
+    self.bytes_in = 0
+    self.messages_out = 0
+    self.messages_in = 0
+    self.rtt = {}
+    self.parse_time = Histogram()
+    self.timeouts = {}
+    self.retries = {}
+    self.recoveries = 0
+    self.auto_outputs = 0
+    self._auto_times = deque(maxlen=4096) #perf_counter receive times
+    self._lock = threading.Lock()
+
+  def sent(self,nbytes,messages=1):
+    with self._lock:
+      self.bytes_out += nbytes
+      self.messages_out += messages
+
+  def received(self,nbytes,parse_time):
+    with self._lock:
+      self.bytes_in += nbytes
+      self.messages_in += 1
+      self.parse_time.add(parse_time)
+
+  def reply(self,op,rtt):
+    with self._lock:
+      hist = self.rtt.get(op)
+      if hist is None:
+        hist = self.rtt[op] = Histogram()
+      hist.add(rtt)
+
+  def timeout(self,op):
+    with self._lock:
+      self.timeouts[op] = self.timeouts.get(op,0) + 1
+
+  def retry(self,op):
+    with self._lock:
+      self.retries[op] = self.retries.get(op,0) + 1
+
+  def recovery(self):
+    with self._lock:
+      self.recoveries += 1
+
+  def auto_output(self,recv_time):
+    with self._lock:
+      self.auto_outputs += 1
+      self._auto_times.append(time.perf_counter() if recv_time is None
+                              else recv_time)
+
+  def auto_output_rate(self):
+    """Returns the automatic output messages per second over the last window
+    seconds, 0 if fewer than two arrived
+    """
+    now = time.perf_counter()
+    with self._lock:
+      times = [t for t in self._auto_times if now - t <= self.window]
+    if len(times) < 2 or times[-1] <= times[0]:
+      return 0.
+    return (len(times) - 1)/(times[-1] - times[0])
+
+  def snapshot(self):
+    """Returns the current values as a dict
+
+    Returns:
+      Dictionary with the counters of the attributes, "rtt" and "parse_time"
+      as Histogram.summary() dicts (rtt by op), and "auto_output_rate"
+    """
+    rate = self.auto_output_rate()
+    with self._lock:
+      return {"bytes_out": self.bytes_out,
+              "bytes_in": self.bytes_in,
+              "messages_out": self.messages_out,
+              "messages_in": self.messages_in,
+              "rtt": {op: hist.summary() for op, hist in self.rtt.items()},
+              "parse_time": self.parse_time.summary(),
+              "timeouts": dict(self.timeouts),
+              "retries": dict(self.retries),
+              "recoveries": self.recoveries,
+              "auto_outputs": self.auto_outputs,
+              "auto_output_rate": rate}
+
+  def _labels(self,**extra):
+    labels = dict(self.labels,**extra)
+    if not labels:
+      return ""
+    return "{"+",".join('%s="%s"' % (key,str(val).replace('"','\\"'))
+                        for key, val in labels.items())+"}"
+
+  def _histogram_lines(self,name,hist,**labels):
+    lines = []
+    cumulative = 0
+    for i, n in enumerate(hist.counts):
+      cumulative += n
+      #Exported on every fourth edge (powers of two with the defaults)
+      if i % 4 == 0 or i == len(hist.counts) - 1:
+        edge = hist.edge(i)
+        le = "+Inf" if math.isinf(edge) else "%.6g" % edge
+        lines.append("%s_bucket%s %d" % (name,self._labels(**labels,le=le),
+                                         cumulative))
+    lines.append("%s_sum%s %.9g" % (name,self._labels(**labels),hist.total))
+    lines.append("%s_count%s %d" % (name,self._labels(**labels),hist.count))
+    return lines
+
+  def export(self):
+    """Returns the metrics in the Prometheus text exposition format"""
+    rate = self.auto_output_rate()
+    with self._lock:
+      lines = []
+      for name, kind, val in (("bytes_out","counter",self.bytes_out),
+                              ("bytes_in","counter",self.bytes_in),
+                              ("messages_out","counter",self.messages_out),
+                              ("messages_in","counter",self.messages_in),
+                              ("recoveries","counter",self.recoveries),
+                              ("auto_outputs","counter",self.auto_outputs),
+                              ("auto_output_rate","gauge",rate),
+                              ("start_time_seconds","gauge",
+                               self.start_time)):
+        lines.append("# TYPE solstis_%s %s" % (name,kind))
+        lines.append("solstis_%s%s %.17g" % (name,self._labels(),val))
+      for name, counts in (("timeouts",self.timeouts),
+                           ("retries",self.retries)):
+        lines.append("# TYPE solstis_%s counter" % name)
+        for op, n in sorted(counts.items()):
+          lines.append("solstis_%s%s %d" % (name,self._labels(op=op),n))
+      lines.append("# TYPE solstis_rtt_seconds histogram")
+      for op, hist in sorted(self.rtt.items()):
+        lines += self._histogram_lines("solstis_rtt_seconds",hist,op=op)
+      lines.append("# TYPE solstis_parse_seconds histogram")
+      lines += self._histogram_lines("solstis_parse_seconds",self.parse_time)
+    return "\n".join(lines)+"\n"
+
+  def write(self,path):
+    """Writes export() to a text file, replacing it atomically so a scraper
+    never reads a partial file
+    """
+    tmp = path+".tmp"
+    with open(tmp,'w') as f:
+      f.write(self.export())
+    os.replace(tmp,path)
@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# Proxy holding the single link to a Solstis and sharing it between several
+# local programs speaking the same TCP/JSON protocol. Run directly:
+#   python3 solstis_proxy.py --address 192.168.1.222 --listen-port 39933
+# then point every program (GUI, logger, scan script) at 127.0.0.1:39933.
+
+import time
+import heapq
+import socket
+import argparse
+import threading
+import socketserver
+from solstis_functions import (FrameDecoder, SolstisError, MAX_TRANSMISSION_ID,
+                               MAX_ABANDONED_REPORTS, init_socket, sendall,
+                               encode_message, decode_message)
+
+#Ops sent ahead of every queued command
+STOP_OPS = frozenset(("fast_scan_stop", "fast_scan_stop_nr"))
+
+def is_stop(op,params):
+  """Returns True if a command stops a scan and so jumps the queue"""
+  if op in STOP_OPS:
+    return True
+  return (op == "scan_stitch_op" and params is not None and
+          params.get("operation") == "stop")
+
+class _Client(socketserver.BaseRequestHandler):
+  """Handles one local program, passing its commands to the proxy"""
+  def setup(self):
+    self.proxy = self.server.proxy
+    self.send_lock = threading.Lock()
+    self.request.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+    self.proxy._connected(self)
+
+  def send(self,data):
+    try:
+      with self.send_lock:
+        self.request.sendall(data)
+    except OSError:
+      pass #Disconnected, cleaned up by handle
+
+  def handle(self):
+    decoder = FrameDecoder()
+    try:
+      while True:
+        data = self.request.recv(4096)
+        if not data:
+          return
+        decoder.feed(data)
+        while True:
+          try:
+            frame = decoder.next_frame()
+          except SolstisError:
+            self.send(encode_message("parse_fail",
+                                     {"protocol_error": ["invalid_json"]},0))
+            break
+          if frame is None:
+            break
+          self.proxy._submit(self,frame)
+    except OSError:
+      return
+    finally:
+      self.proxy._disconnected(self)
+
+class _Server(socketserver.ThreadingMixIn,socketserver.TCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class SolstisProxy:
+  """Shares one link to a Solstis between several local client connections
+
+  The proxy opens the link and sends start_link once. Local clients connect
+  to listen_address:listen_port and send commands as they would to the
+  controller; their start_link is answered by the proxy with the reply it
+  got itself. Every other command gets a transmission ID unique on the link,
+  and the reply (and final report) is returned to the client that sent it
+  with its own transmission ID restored. Automatic output goes to every
+  client.
+
+  At most max_in_flight commands await their reply at the controller; the
+  rest are queued in the proxy, where commands stopping a scan (see is_stop)
+  are sent ahead of everything else so they are not stuck behind the polls
+  of other clients. A command not answered within timeout is forgotten so
+  it cannot block the queue; its late reply is dropped. Likewise a final
+  report not received within report_timeout of its command is forgotten,
+  and a late report of a forgotten command or of a disconnected client is
+  dropped rather than passed to another client.
+
+  If the link to the controller fails, every client is disconnected and the
+  proxy stops, so each program sees the same failure as with a direct link.
+
+  Attributes:
+    address ~ (str) IP address of the Solstis
+    port ~ (int) TCP port of the Solstis
+    listen_address ~ (str) Address local clients connect to
+    listen_port ~ (int) Port local clients connect to (the assigned port if
+                  0 was requested)
+    ip_address ~ (str) IP address of this computer sent with start_link
+    timeout ~ (float) Seconds to wait for each reply
+    report_timeout ~ (float) Seconds to wait for each final report
+    max_in_flight ~ (int) Commands sent to the controller ahead of replies
+    error ~ Exception that stopped the proxy, None while running
+  """
+  def __init__(self,
+               address='192.168.1.222',
+               port=39933,
+               listen_address='127.0.0.1',
+               listen_port=39933,
+               ip_address='192.168.1.107',
+               timeout=10.,
+               max_in_flight=4,
+               report_timeout=300.):
+    self.address = address
+    self.port = port
+    self.listen_address = listen_address
+    self.listen_port = listen_port
+    self.ip_address = ip_address
+    self.timeout = timeout
+    self.max_in_flight = max_in_flight
+    self.report_timeout = report_timeout
+    self.error = None
+    self.sock = None
+    self.server = None
+    self._start_link_reply = None
+    self._cond = threading.Condition()
+    self._running = False
+    self._clients = set()
+    self._queue = [] #Heap of (priority, sequence, client, ID, op, params)
+    self._sequence = 0
+    self._last_id = 0
+    self._pending = {} #Proxy ID -> (client, client's ID, time sent)
+    #Proxy ID -> (client, client's ID, time sent), oldest first
+    self._reports = {}
+    #Proxy IDs of final reports no longer awaited, oldest first; their late
+    #reports are dropped
+    self._abandoned = {}
+    self._threads = []
+    self._decoder = None #Receive buffer of the link
+
+  def start(self):
+    """Opens the link, starts it and starts serving local clients
+
+    Returns:
+      The proxy itself
+    Raises:
+      SolstisError if the controller refused start_link
+    """
+    self.sock = init_socket(self.address,self.port,self.timeout)
+    decoder = FrameDecoder()
+    sendall(self.sock,encode_message("start_link",
+                                     {"ip_address": self.ip_address},1),
+            self.timeout)
+    reply = decode_message(decoder.recv_frame(self.sock,self.timeout))
+    params = reply["message"].get("parameters",{})
+    if params.get("status") != "ok":
+      self.sock.close()
+      raise SolstisError("Solstis refused the link: "+str(params))
+    self._start_link_reply = params
+    self._running = True
+    self.server = _Server((self.listen_address,self.listen_port),_Client)
+    self.server.proxy = self
+    self.listen_port = self.server.server_address[1]
+    self._decoder = decoder
+    for target in (self._read_loop,self._write_loop,
+                   self.server.serve_forever):
+      thread = threading.Thread(target=target,daemon=True)
+      thread.start()
+      self._threads.append(thread)
+    return self
+
+  def stop(self):
+    """Disconnects every client and closes the link"""
+    with self._cond:
+      if not self._running:
+        return
+      self._running = False
+      self._cond.notify_all()
+      clients = list(self._clients)
+    self.server.shutdown()
+    self.server.server_close()
+    for client in clients:
+      try:
+        client.request.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+    try:
+      self.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self.sock.close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.stop()
+
+  def wait(self):
+    """Blocks until the proxy stops, re-raising the error that stopped it"""
+    with self._cond:
+      self._cond.wait_for(lambda: not self._running)
+    if self.error is not None:
+      raise self.error
+
+  def _connected(self,client):
+    with self._cond:
+      self._clients.add(client)
+
+  def _disconnected(self,client):
+    with self._cond:
+      self._clients.discard(client)
+      #Final reports of a gone client must not be routed to another client
+      self._abandon([i for i, val in self._reports.items()
+                     if val[0] is client])
+
+  def _submit(self,client,frame):
+    """Queues a command received from a local client"""
+    try:
+      message = decode_message(frame)["message"]
+      transmission_id = message["transmission_id"][0]
+      op = message["op"]
+      params = message.get("parameters")
+    except (ValueError,KeyError,IndexError,TypeError):
+      client.send(encode_message("parse_fail",
+                                 {"protocol_error": ["invalid_message"]},0))
+      return
+    if op == "start_link":
+      client.send(encode_message("start_link_reply",self._start_link_reply,
+                                 transmission_id))
+      return
+    with self._cond:
+      self._sequence += 1
+      heapq.heappush(self._queue,(0 if is_stop(op,params) else 1,
+                                  self._sequence,client,transmission_id,op,
+                                  params))
+      self._cond.notify_all()
+
+  def _next_id(self):
+    """Returns a transmission ID unused on the link, must hold self._cond"""
+    while True:
+      self._last_id = self._last_id % MAX_TRANSMISSION_ID + 1
+      if (self._last_id not in self._pending and
+          self._last_id not in self._reports and
+          self._last_id not in self._abandoned):
+        return self._last_id
+
+  def _abandon(self,transmission_ids):
+    """Stops awaiting the final reports of transmission_ids, must hold
+    self._cond
+    """
+    for transmission_id in transmission_ids:
+      if self._reports.pop(transmission_id,None) is not None:
+        self._abandoned[transmission_id] = None
+        if len(self._abandoned) > MAX_ABANDONED_REPORTS:
+          del self._abandoned[next(iter(self._abandoned))]
+
+  def _expire(self):
+    """Forgets commands unanswered for timeout and final reports not
+    received within report_timeout, must hold self._cond
+    """
+    now = time.perf_counter()
+    expired = [i for i, val in self._pending.items()
+               if now - val[2] > self.timeout]
+    for transmission_id in expired:
+      del self._pending[transmission_id]
+    self._abandon(expired)
+    self._abandon([i for i, val in self._reports.items()
+                   if now - val[2] > self.report_timeout])
+
+  def _write_loop(self):
+    try:
+      while True:
+        with self._cond:
+          while self._running and (len(self._queue) == 0 or
+                                   len(self._pending) >= self.max_in_flight):
+            if len(self._pending) > 0 or len(self._reports) > 0:
+              self._expire()
+            self._cond.wait(min(self.timeout,self.report_timeout)/10.)
+          if not self._running:
+            return
+          _, _, client, client_id, op, params = heapq.heappop(self._queue)
+          transmission_id = self._next_id()
+          sent = time.perf_counter()
+          self._pending[transmission_id] = (client,client_id,sent)
+          if params is not None and params.get("report") == "finished":
+            self._reports[transmission_id] = (client,client_id,sent)
+        sendall(self.sock,encode_message(op,params,transmission_id),
+                self.timeout)
+    except OSError as exc:
+      self._failed(exc)
+
+  def _read_loop(self):
+    decoder = self._decoder
+    try:
+      while self._running:
+        try:
+          frame = decoder.recv_frame(self.sock,1.)
+        except TimeoutError:
+          continue
+        self._route(frame)
+    except (OSError,SolstisError,ValueError) as exc:
+      self._failed(exc)
+
+  def _route(self,frame):
+    """Returns a message from the controller to the client(s) it is for"""
+    message = decode_message(frame)["message"]
+    op = message["op"]
+    if op == "automatic_output":
+      with self._cond:
+        clients = list(self._clients)
+      for client in clients:
+        client.send(frame)
+      return
+    transmission_id = message["transmission_id"][0]
+    with self._cond:
+      if op.endswith("_f_r"):
+        entry = self._reports.pop(transmission_id,None)
+        if entry is None and transmission_id in self._abandoned:
+          del self._abandoned[transmission_id]
+        elif entry is None and len(self._reports) > 0:
+          #Route a report with an ID the proxy never issued to the oldest
+          #waiting command
+          entry = self._reports.pop(next(iter(self._reports)))
+      else:
+        entry = self._pending.pop(transmission_id,None)
+        self._cond.notify_all()
+    if entry is not None:
+      entry[0].send(encode_message(op,message.get("parameters"),entry[1]))
+
+  def _failed(self,exc):
+    with self._cond:
+      running = self._running
+      if running:
+        self.error = exc
+    if running:
+      self.stop()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Shares one Solstis link "
+                                               "between local programs")
+  parser.add_argument("--address",default="192.168.1.222",
+                      help="Address of the Solstis")
+  parser.add_argument("--port",type=int,default=39933)
+  parser.add_argument("--listen-address",default="127.0.0.1")
+  parser.add_argument("--listen-port",type=int,default=39933)
+  parser.add_argument("--ip-address",default="192.168.1.107",
+                      help="Address of this computer sent with start_link")
+  parser.add_argument("--max-in-flight",type=int,default=4)
+  parser.add_argument("--report-timeout",type=float,default=300.,
+                      help="Seconds to wait for each final report")
+  args = parser.parse_args()
+  proxy = SolstisProxy(args.address,args.port,args.listen_address,
+                       args.listen_port,args.ip_address,
+                       max_in_flight=args.max_in_flight,
+                       report_timeout=args.report_timeout).start()
+  print("Solstis proxy listening on %s:%d" % (proxy.listen_address,
+                                               proxy.listen_port))
+  try:
+    proxy.wait()
+  except KeyboardInterrupt:
+    proxy.stop()
@@ -0,0 +1,230 @@
+# Recording of the bytes exchanged with a Solstis and replay of the recording
+# as a stand-in for the controller
+#
+# Record a session by wrapping the socket before it is used:
+#   sock = RecordingSocket(init_socket(),"session.cap")
+# and replay it later with the same script, without the laser:
+#   sock = ReplaySocket("session.cap",realtime=False)
+
+import time
+import struct
+import socket
+import threading
+from solstis_functions import FrameDecoder, SolstisError, decode_message
+
+MAGIC = b"SOLSCAP1"
+_HEADER = struct.Struct("<8sd") #Magic, time.time() at the start
+_RECORD = struct.Struct("<dBI") #Seconds since the start, direction, length
+
+SENT = 0
+RECEIVED = 1
+
+class ReplayMismatch(SolstisError):
+  """Raised when a replayed script sends other commands than the recording
+  """
+
+class RecordingSocket:
+  """Socket wrapper writing every byte sent and received to a capture file
+
+  Each send and each read is stored as one record of the seconds since
+  recording started, the direction (SENT or RECEIVED) and the bytes, so the
+  fragmentation of the stream is preserved. All other socket methods are
+  passed through, so the wrapper can be given to SolstisClient or
+  client_for like the socket itself.
+
+  Attributes:
+    sock ~ Wrapped socket
+    path ~ (str) Capture file written to
+  """
+  def __init__(self,sock,path):
+    self.sock = sock
+    self.path = path
+    self._file = open(path,'wb')
+    self._file.write(_HEADER.pack(MAGIC,time.time()))
+    self._start = time.perf_counter()
+    self._lock = threading.Lock()
+
+  def _record(self,direction,data):
+    with self._lock:
+      if self._file is not None:
+        self._file.write(_RECORD.pack(time.perf_counter() - self._start,
+                                      direction,len(data)))
+        self._file.write(data)
+
+  def send(self,data,flags=0):
+    n = self.sock.send(data,flags)
+    self._record(SENT,bytes(data[:n]))
+    return n
+
+  def sendall(self,data,flags=0):
+    self.sock.sendall(data,flags)
+    self._record(SENT,bytes(data))
+
+  def recv(self,bufsize,flags=0):
+    data = self.sock.recv(bufsize,flags)
+    self._record(RECEIVED,data)
+    return data
+
+  def recv_into(self,buf,nbytes=0,flags=0):
+    n = self.sock.recv_into(buf,nbytes,flags)
+    self._record(RECEIVED,bytes(memoryview(buf)[:n]))
+    return n
+
+  def recvmsg_into(self,buffers,ancbufsize=0,flags=0):
+    val = self.sock.recvmsg_into(buffers,ancbufsize,flags)
+    data = b''.join(bytes(buf) for buf in buffers)
+    self._record(RECEIVED,data[:val[0]])
+    return val
+
+  def close(self):
+    """Closes the socket and the capture file"""
+    self.sock.close()
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+
+  def __getattr__(self,name):
+    return getattr(self.sock,name)
+
+def _op(frame):
+  """Returns the op of a sent frame, None if it has none"""
+  try:
+    return decode_message(frame)["message"]["op"]
+  except (ValueError,KeyError,TypeError):
+    return None
+
+def read_capture(path):
+  """Reads a capture file written by RecordingSocket
+
+  Returns:
+    Tuple of (time.time() when recording started, list of (seconds since
+    the start, direction, bytes) records)
+  """
+  with open(path,'rb') as f:
+    data = f.read()
+  magic, start = _HEADER.unpack_from(data,0)
+  if magic != MAGIC:
+    raise ValueError("Not a Solstis capture file")
+  records = []
+  pos = _HEADER.size
+  while pos + _RECORD.size <= len(data):
+    t, direction, n = _RECORD.unpack_from(data,pos)
+    pos += _RECORD.size
+    if pos + n > len(data):
+      break #Truncated by a crash while recording
+    records.append((t,direction,data[pos:pos+n]))
+    pos += n
+  return start, records
+
+class ReplaySocket:
+  """Stand-in for a Solstis socket replaying a capture
+
+  The received chunks of the capture are delivered in their recorded sizes
+  and order. Each chunk is only delivered once the client has sent as many
+  complete messages as had been sent before it in the recording, so replies
+  never overtake their requests. With realtime False chunks are delivered as
+  soon as that condition holds; with realtime True each chunk is further held
+  back by the delay it had after the preceding sent message in the
+  recording, reproducing the controller's timing.
+
+  A script replays correctly when it issues the same requests as the
+  recorded session, e.g. when it is the script that made the recording. The
+  op of every message sent is compared with the recorded one, and send
+  raises ReplayMismatch at the first difference or extra message, rather
+  than letting the script wait for replies that will never come. Parameters
+  are not compared. When the capture is exhausted
+  the connection is closed, as if by the controller, unless close_at_end is
+  False.
+
+  The socket is backed by a local socket pair, so it works with the
+  non-blocking reads and selectors of SolstisClient.
+
+  Attributes:
+    path ~ (str) Capture file replayed
+    realtime ~ (Boolean) True to reproduce the recorded timing
+    sent_messages ~ (int) Complete messages sent by the client so far
+    recorded_ops ~ (list) op of every message sent in the recording
+  """
+  def __init__(self,path,realtime=False,close_at_end=True):
+    self.path = path
+    self.realtime = realtime
+    self.close_at_end = close_at_end
+    self.sent_messages = 0
+    self.recorded_ops = []
+    start, records = read_capture(path)
+    #(sent messages required, delay after that message, bytes) of every
+    #received chunk
+    self._chunks = []
+    decoder = FrameDecoder()
+    sent = 0
+    last_send = 0.
+    for t, direction, data in records:
+      if direction == SENT:
+        decoder.feed(data)
+        for frame in decoder:
+          self.recorded_ops.append(_op(frame))
+          sent += 1
+          last_send = t
+      else:
+        self._chunks.append((sent,t - last_send,data))
+    self._decoder = FrameDecoder()
+    self._send_times = [time.perf_counter()] #Time of each sent message
+    self._cond = threading.Condition()
+    self._closed = False
+    self._sock, self._peer = socket.socketpair()
+    self._thread = threading.Thread(target=self._run,daemon=True)
+    self._thread.start()
+
+  def _run(self):
+    try:
+      for required, delay, data in self._chunks:
+        with self._cond:
+          while self.sent_messages < required and not self._closed:
+            self._cond.wait()
+          if self._closed:
+            return
+          send_time = self._send_times[required]
+        if self.realtime:
+          remaining = send_time + delay - time.perf_counter()
+          if remaining > 0:
+            time.sleep(remaining)
+        self._peer.sendall(data)
+      if self.close_at_end:
+        self._peer.shutdown(socket.SHUT_WR)
+    except OSError:
+      pass #Closed while replaying
+
+  def send(self,data,flags=0):
+    now = time.perf_counter()
+    self._decoder.feed(data)
+    with self._cond:
+      for frame in self._decoder:
+        i = self.sent_messages
+        op = _op(frame)
+        if i >= len(self.recorded_ops):
+          raise ReplayMismatch("Message "+str(i)+" ("+str(op)+") was sent "
+                               "after the end of the recording")
+        if op != self.recorded_ops[i]:
+          raise ReplayMismatch("Message "+str(i)+" is "+str(op)+
+                               " but the recording sent "+
+                               str(self.recorded_ops[i]))
+        self.sent_messages += 1
+        self._send_times.append(now)
+      self._cond.notify_all()
+    return len(data)
+
+  def sendall(self,data,flags=0):
+    self.send(data,flags)
+
+  def close(self):
+    """Stops the replay and closes the socket"""
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._peer.close()
+    self._sock.close()
+
+  def __getattr__(self,name):
+    #Reads, fileno, setblocking, shutdown... act on the client end of the pair
+    return getattr(self._sock,name)
@@ -0,0 +1,541 @@
+#!/usr/bin/python3
+# Local stand-in for a Solstis controller speaking the TCP/JSON protocol, for
+# benchmarking and testing without the laser. Run directly to serve on a port:
+#   python3 solstis_sim.py --port 39933
+
+import time
+import json
+import random
+import socket
+import argparse
+import threading
+import socketserver
+from solstis_functions import FrameDecoder, SolstisError
+
+#Speed of light used for GHz <-> nm conversions
+C = 299792458.
+
+#Scan rate units of scan_stitch_initialise in Hz/s
+_RATE_UNITS = {"GHz/s": 1e9, "MHz/s": 1e6, "kHz/s": 1e3}
+
+FAST_SCAN_TYPES = ("etalon_continuous", "etalon_single", "cavity_continuous",
+                   "cavity_single", "resonator_continuous", "resonator_single",
+                   "ecd_continuous", "fringe_test", "resonator_ramp",
+                   "ecd_ramp", "cavity_triangular", "resonator_triangular")
+
+class _Connection(socketserver.BaseRequestHandler):
+  """Handles one client link, replying to each command in order"""
+  def setup(self):
+    self.sim = self.server.sim
+    self.send_lock = threading.Lock()
+    self.request.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+
+  def send(self,op,transmission_id,params):
+    """Sends one message, fragmented as configured on the simulator"""
+    data = json.dumps({"message": {"transmission_id": [transmission_id],
+                                   "op": op,
+                                   "parameters": params}}).encode('utf8')
+    size = self.sim.fragment_size
+    with self.send_lock:
+      if size is None:
+        self.request.sendall(data)
+        return
+      for i in range(0,len(data),size):
+        self.request.sendall(data[i:i+size])
+        if self.sim.fragment_delay > 0:
+          time.sleep(self.sim.fragment_delay)
+
+  def handle(self):
+    decoder = FrameDecoder()
+    try:
+      while True:
+        data = self.request.recv(4096)
+        if not data:
+          return
+        decoder.feed(data)
+        while True:
+          try:
+            frame = decoder.next_frame()
+          except SolstisError:
+            self.send("parse_fail",0,{"protocol_error": ["invalid_json"]})
+            break
+          if frame is None:
+            break
+          self.sim.handle_message(self,frame)
+    except (ConnectionError,OSError):
+      return
+    finally:
+      self.sim.disconnected(self)
+
+class _Server(socketserver.ThreadingMixIn,socketserver.TCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class SolstisSimulator:
+  """Simulated Solstis controller served over TCP on the local machine
+
+  Implements the ops used by solstis_functions with simple tuning dynamics:
+  the wavelength moves linearly at tune_rate towards its set point and is
+  reported tuned after settle_time. TeraScans step through segments and
+  stream automatic_output messages, fast scans ramp the tuner for their
+  duration. All state belongs to one simulated laser shared by connections.
+
+  Attributes:
+    address ~ (str) Address served on
+    port ~ (int) Port served on (the assigned port if 0 was requested)
+    wavelength ~ (float) Current wavelength in nm
+    tune_rate ~ (float) Wavelength tuning speed in nm/s
+    settle_time ~ (float) Seconds from reaching a set point to tuning done
+    noise ~ (float) Standard deviation of wavemeter readings in nm
+    latency ~ (float) Seconds before each reply is sent
+    latency_jitter ~ (float) Extra uniformly distributed reply delay in s
+    fragment_size ~ (int) Bytes per TCP write of each message, None for one
+    fragment_delay ~ (float) Seconds between fragments of a message
+    errors ~ (dict) op -> status value to reply with instead of success
+    wavelength_range ~ (tuple) Minimum and maximum tunable wavelength in nm
+    terascan_segment ~ (float) Width of a TeraScan segment in nm
+    terascan_tune_time ~ (float) Seconds spent tuning before each segment
+    terascan_dac_steps ~ (int) Tuning DAC steps per TeraScan segment
+    terascan_speedup ~ (float) Factor applied to the requested scan rate
+  """
+  def __init__(self,
+               address='127.0.0.1',
+               port=0,
+               wavelength=780.,
+               tune_rate=50.,
+               settle_time=0.01,
+               noise=0.,
+               latency=0.,
+               latency_jitter=0.,
+               fragment_size=None,
+               fragment_delay=0.,
+               errors=None,
+               wavelength_range=(700.,1000.),
+               terascan_segment=0.1,
+               terascan_tune_time=0.01,
+               terascan_dac_steps=100,
+               terascan_speedup=1.):
+    self.address = address
+    self.port = port
+    self.tune_rate = tune_rate
+    self.settle_time = settle_time
+    self.noise = noise
+    self.latency = latency
+    self.latency_jitter = latency_jitter
+    self.fragment_size = fragment_size
+    self.fragment_delay = fragment_delay
+    self.errors = {} if errors is None else errors
+    self.wavelength_range = wavelength_range
+    self.terascan_segment = terascan_segment
+    self.terascan_tune_time = terascan_tune_time
+    self.terascan_dac_steps = terascan_dac_steps
+    self.terascan_speedup = terascan_speedup
+    self.lock = threading.RLock()
+    self.server = None
+    #Laser state
+    self._from = wavelength #Wavelength at the start of the current move
+    self._target = wavelength
+    self._move_time = 0. #perf_counter at the start of the current move
+    self._move_id = 0 #Incremented on every move to cancel old final reports
+    self._maintaining = False #True once a set_wave_m set point was given
+    self.tolerance = 1.
+    self.etalon = 50.
+    self.resonator = 50.
+    self.fine_resonator = 50.
+    self.etalon_locked = True
+    self.output = {"operation": "stop", "delay": 1, "update": 1, "pause": "off"}
+    self.terascan = None #Configuration from scan_stitch_initialise
+    self._scan = None #State of a running TeraScan
+    self._fast_scan = None #(type, width, duration, start time) of fast scan
+
+  def start(self):
+    """Starts serving in a background thread
+
+    Returns:
+      The simulator itself
+    """
+    self.server = _Server((self.address,self.port),_Connection)
+    self.server.sim = self
+    self.port = self.server.server_address[1]
+    thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+    thread.start()
+    return self
+
+  def stop(self):
+    """Stops serving and any running TeraScan"""
+    with self.lock:
+      if self._scan is not None:
+        self._scan["stop"].set()
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+      self.server = None
+
+  def __enter__(self):
+    if self.server is None:
+      self.start()
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.stop()
+
+  def disconnected(self,conn):
+    with self.lock:
+      if self._scan is not None and self._scan["conn"] is conn:
+        self._scan["stop"].set()
+
+  #Tuning dynamics
+  @property
+  def wavelength(self):
+    return self.current_wavelength()
+
+  def current_wavelength(self,now=None):
+    """Returns the true wavelength at time now (perf_counter)"""
+    if now is None:
+      now = time.perf_counter()
+    distance = self._target - self._from
+    moved = self.tune_rate*(now - self._move_time)
+    if moved >= abs(distance):
+      return self._target
+    return self._from + (moved if distance > 0 else -moved)
+
+  def measured_wavelength(self):
+    """Returns a wavemeter reading of the current wavelength"""
+    val = self.current_wavelength()
+    if self.noise > 0:
+      val += random.gauss(0.,self.noise)
+    return val
+
+  def tuning_done_time(self):
+    """Returns the perf_counter time at which the current move settles"""
+    distance = abs(self._target - self._from)
+    return self._move_time + distance/self.tune_rate + self.settle_time
+
+  def is_tuning(self):
+    return time.perf_counter() < self.tuning_done_time()
+
+  def move_to(self,wavelength):
+    """Starts tuning towards a new set point, returns the move ID"""
+    now = time.perf_counter()
+    self._from = self.current_wavelength(now)
+    self._target = wavelength
+    self._move_time = now
+    self._move_id += 1
+    return self._move_id
+
+  def in_range(self,wavelength):
+    return self.wavelength_range[0] <= wavelength <= self.wavelength_range[1]
+
+  #Message handling
+  def handle_message(self,conn,frame):
+    try:
+      message = json.loads(frame)["message"]
+      transmission_id = message["transmission_id"][0]
+      op = message["op"]
+      params = message.get("parameters",{})
+    except (ValueError,KeyError,IndexError,TypeError):
+      conn.send("parse_fail",0,{"protocol_error": ["invalid_message"]})
+      return
+    handler = getattr(self,"_op_"+op,None)
+    if self.latency > 0 or self.latency_jitter > 0:
+      time.sleep(self.latency + random.random()*self.latency_jitter)
+    if handler is None:
+      conn.send("parse_fail",transmission_id,
+                {"protocol_error": ["unknown_op"], "op": op})
+      return
+    with self.lock:
+      if op in self.errors:
+        status = self.errors[op]
+        reply = {"status": status if op == "start_link" else [status]}
+        if op == "poll_wave_m":
+          reply["current_wavelength"] = [self.measured_wavelength()]
+        elif op in ("set_wave_m","poll_move_wave_t"):
+          reply["wavelength"] = [self.measured_wavelength()]
+        elif op == "fast_scan_poll":
+          reply["tuner_value"] = [0.]
+      else:
+        try:
+          reply = handler(conn,transmission_id,params)
+        except (KeyError,IndexError,TypeError,ValueError):
+          conn.send("parse_fail",transmission_id,
+                    {"protocol_error": ["invalid_parameters"], "op": op})
+          return
+    conn.send(op+"_reply",transmission_id,reply)
+
+  def _op_start_link(self,conn,transmission_id,params):
+    return {"status": "ok"}
+
+  def _op_set_wave_m(self,conn,transmission_id,params):
+    wavelength = params["wavelength"][0]
+    if not self.in_range(wavelength):
+      return {"status": [2], "wavelength": [self.measured_wavelength()]}
+    move_id = self.move_to(wavelength)
+    self._maintaining = True
+    if params.get("report") == "finished":
+      thread = threading.Thread(target=self._final_report,
+                                args=(conn,transmission_id,move_id),
+                                daemon=True)
+      thread.start()
+    return {"status": [0], "wavelength": [self.measured_wavelength()]}
+
+  def _final_report(self,conn,transmission_id,move_id):
+    with self.lock:
+      #Report once within tolerance of the set point and settled
+      distance = abs(self._target - self._from)
+      wait = (self._move_time + max(distance - self.tolerance,0.)/self.tune_rate
+              + self.settle_time - time.perf_counter())
+    if wait > 0:
+      time.sleep(wait)
+    with self.lock:
+      #A move superseded by a new set point is reported as failed
+      status = 0 if self._move_id == move_id else 1
+      wavelength = self.measured_wavelength()
+    try:
+      conn.send("set_wave_m_f_r",transmission_id,
+                {"status": [status], "wavelength": [wavelength]})
+    except OSError:
+      pass
+
+  def _op_poll_wave_m(self,conn,transmission_id,params):
+    if self.is_tuning():
+      status = 2
+    elif self._maintaining:
+      status = 3
+    else:
+      status = 0
+    return {"status": [status],
+            "current_wavelength": [self.measured_wavelength()]}
+
+  def _op_move_wave_t(self,conn,transmission_id,params):
+    wavelength = params["wavelength"][0]
+    if not self.in_range(wavelength):
+      return {"status": [2]}
+    self.move_to(wavelength)
+    self._maintaining = False
+    return {"status": [0]}
+
+  def _op_poll_move_wave_t(self,conn,transmission_id,params):
+    return {"status": [1 if self.is_tuning() else 0],
+            "wavelength": [self.current_wavelength()]}
+
+  def _op_set_wave_tolerance_m(self,conn,transmission_id,params):
+    tolerance = params["tolerance"]
+    if isinstance(tolerance,list):
+      tolerance = tolerance[0]
+    if not 0 < tolerance <= 100:
+      return {"status": [2]}
+    self.tolerance = tolerance
+    return {"status": [0]}
+
+  def _op_scan_stitch_initialise(self,conn,transmission_id,params):
+    start = params["start"][0]
+    stop = params["stop"][0]
+    if not self.in_range(start):
+      return {"status": [1]}
+    if not self.in_range(stop):
+      return {"status": [2]}
+    if stop <= start:
+      return {"status": [3]}
+    rate = params["rate"][0]*_RATE_UNITS[params["units"]]
+    self.terascan = {"scan": params["scan"], "start": start, "stop": stop,
+                     "rate": rate}
+    return {"status": [0]}
+
+  def _op_scan_stitch_op(self,conn,transmission_id,params):
+    if self.terascan is None or params["scan"] != self.terascan["scan"]:
+      return {"status": [1]}
+    if params["operation"] == "stop":
+      if self._scan is not None:
+        self._scan["stop"].set()
+      return {"status": [0]}
+    if self._scan is not None:
+      return {"status": [1]}
+    self._scan = {"conn": conn, "stop": threading.Event(),
+                  "continue": threading.Event(), "paused": False,
+                  "tuning": True, "current": self.terascan["start"]}
+    thread = threading.Thread(target=self._run_terascan,args=(self._scan,),
+                              daemon=True)
+    thread.start()
+    return {"status": [0]}
+
+  def _run_terascan(self,scan):
+    """Steps the laser through the TeraScan segments, emitting output"""
+    config = self.terascan
+    conn = scan["conn"]
+    stop = scan["stop"]
+    start = config["start"]
+    speed = (config["rate"]*self.terascan_speedup*
+             start**2/C*1e-9) #nm/s at the start wavelength
+    steps = self.terascan_dac_steps
+    try:
+      position = start
+      while position < config["stop"] and not stop.is_set():
+        end = min(position + self.terascan_segment,config["stop"])
+        with self.lock:
+          scan["tuning"] = True
+          scan["current"] = position
+          self.move_to(position)
+        if stop.wait(self.terascan_tune_time):
+          break
+        with self.lock:
+          scan["tuning"] = False
+          output = dict(self.output)
+        if output["operation"] == "start":
+          conn.send("automatic_output",0,{"wavelength": [position],
+                                          "status": "start"})
+          if output["pause"] == "on":
+            with self.lock:
+              scan["paused"] = True
+            while not scan["continue"].wait(0.05):
+              if stop.is_set():
+                return
+            scan["continue"].clear()
+          if stop.wait(output["delay"]/100.):
+            break
+        step_time = (end - position)/speed/steps
+        next_time = time.perf_counter()
+        for step in range(1,steps+1):
+          next_time += step_time
+          wait = next_time - time.perf_counter()
+          if wait > 0 and stop.wait(wait):
+            return
+          current = position + (end - position)*step/steps
+          with self.lock:
+            scan["current"] = current
+            self._from = self._target = current
+          if (output["operation"] == "start" and output["update"] > 0 and
+              step % output["update"] == 0 and step < steps):
+            conn.send("automatic_output",0,{"wavelength": [current],
+                                            "status": "scan"})
+        if output["operation"] == "start":
+          conn.send("automatic_output",0,{"wavelength": [end],
+                                          "status": "end"})
+        position = end
+    except OSError:
+      pass
+    finally:
+      with self.lock:
+        if self._scan is scan:
+          self._scan = None
+
+  def _op_scan_stitch_status(self,conn,transmission_id,params):
+    scan = self._scan
+    if scan is None or params["scan"] != self.terascan["scan"]:
+      return {"status": [0]}
+    return {"status": [1],
+            "current": [scan["current"]],
+            "start": [self.terascan["start"]],
+            "stop": [self.terascan["stop"]],
+            "operation": [0 if scan["tuning"] else 1]}
+
+  def _op_terascan_output(self,conn,transmission_id,params):
+    delay = params["delay"][0]
+    update = params["update"][0]
+    if not 1 <= delay <= 1000:
+      return {"status": [2]}
+    if not 0 <= update <= 50:
+      return {"status": [3]}
+    self.output = {"operation": params["operation"], "delay": delay,
+                   "update": update, "pause": params["pause"]}
+    return {"status": [0]}
+
+  def _op_terascan_continue(self,conn,transmission_id,params):
+    scan = self._scan
+    if scan is None or not scan["paused"]:
+      return {"status": [1]}
+    scan["paused"] = False
+    scan["continue"].set()
+    return {"status": [0]}
+
+  def _op_get_status(self,conn,transmission_id,params):
+    locked = "on" if self.etalon_locked else "off"
+    return {"status": [0],
+            "wavelength": [self.measured_wavelength()],
+            "temperature": [22.5 + random.gauss(0.,0.01)],
+            "temperature_status": "on",
+            "etalon_lock": locked,
+            "etalon_voltage": [2.*self.etalon],
+            "cavity_lock": "on",
+            "resonator_voltage": [2.*self.resonator],
+            "ecd_lock": "not_fitted",
+            "ecd_voltage": "not_fitted",
+            "output_monitor": [2.5 + random.gauss(0.,0.01)],
+            "etalon_pd_dc": [0.8 + random.gauss(0.,0.01)],
+            "dither": "off"}
+
+  def _tune(self,attribute,params):
+    setting = params["setting"][0]
+    if not 0 <= setting <= 100:
+      return {"status": [1]}
+    setattr(self,attribute,setting)
+    return {"status": [0]}
+
+  def _op_tune_etalon(self,conn,transmission_id,params):
+    return self._tune("etalon",params)
+
+  def _op_tune_resonator(self,conn,transmission_id,params):
+    return self._tune("resonator",params)
+
+  def _op_fine_tune_resonator(self,conn,transmission_id,params):
+    return self._tune("fine_resonator",params)
+
+  def _op_etalon_lock(self,conn,transmission_id,params):
+    self.etalon_locked = params["operation"] == "on"
+    return {"status": [0]}
+
+  def _op_fast_scan_start(self,conn,transmission_id,params):
+    scan_type = params["scan"]
+    width = params["width"]
+    duration = params["time"]
+    if isinstance(width,list):
+      width = width[0]
+    if isinstance(duration,list):
+      duration = duration[0]
+    if scan_type not in FAST_SCAN_TYPES:
+      return {"status": [4]}
+    if duration > 10000:
+      return {"status": [5]}
+    self._fast_scan = (scan_type,width,duration,time.perf_counter())
+    return {"status": [0]}
+
+  def _op_fast_scan_poll(self,conn,transmission_id,params):
+    scan = self._fast_scan
+    if scan is None or scan[0] != params["scan"]:
+      return {"status": [0], "tuner_value": [0.]}
+    elapsed = time.perf_counter() - scan[3]
+    if elapsed >= scan[2]:
+      self._fast_scan = None
+      return {"status": [0], "tuner_value": [0.]}
+    #Tuner ramps linearly across the scan width (in GHz about the centre)
+    return {"status": [1],
+            "tuner_value": [scan[1]*(elapsed/scan[2] - 0.5)]}
+
+  def _op_fast_scan_stop(self,conn,transmission_id,params):
+    if params["scan"] not in FAST_SCAN_TYPES:
+      return {"status": [4]}
+    self._fast_scan = None
+    return {"status": [0]}
+
+  def _op_fast_scan_stop_nr(self,conn,transmission_id,params):
+    return self._op_fast_scan_stop(conn,transmission_id,params)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Simulated Solstis controller")
+  parser.add_argument("--address",default="127.0.0.1")
+  parser.add_argument("--port",type=int,default=39933)
+  parser.add_argument("--tune-rate",type=float,default=50.,
+                      help="Tuning speed in nm/s")
+  parser.add_argument("--latency",type=float,default=0.,
+                      help="Reply delay in seconds")
+  parser.add_argument("--fragment-size",type=int,default=None,
+                      help="Bytes per TCP write of each message")
+  args = parser.parse_args()
+  sim = SolstisSimulator(args.address,args.port,tune_rate=args.tune_rate,
+                         latency=args.latency,
+                         fragment_size=args.fragment_size).start()
+  print("Simulated Solstis listening on %s:%d" % (sim.address,sim.port))
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    sim.stop()
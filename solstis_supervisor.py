@@ -0,0 +1,288 @@
+# Solstis client that recovers the link by itself when the connection drops
+
+import time
+import socket
+import random
+import threading
+from collections import deque
+from solstis_functions import SolstisClient, SolstisError, COMMANDS
+
+#Ops that are safe to send again when the link dropped before their reply
+RETRY_OPS = frozenset(("start_link", "set_wave_m", "poll_wave_m", "move_wave_t",
+                       "poll_move_wave_t", "scan_stitch_initialise",
+                       "scan_stitch_status", "terascan_output", "get_status",
+                       "tune_etalon", "tune_resonator", "fine_tune_resonator",
+                       "etalon_lock", "fast_scan_poll", "set_wave_tolerance_m"))
+
+#Commands setting state that is re-issued after a reconnect, by op
+STATE_COMMANDS = {"set_wave_tolerance_m": COMMANDS["set_wave_tolerance_m"],
+                  "terascan_output": COMMANDS["terascan_output"],
+                  "etalon_lock": COMMANDS["etalon_lock"]}
+
+class SupervisedClient(SolstisClient):
+  """SolstisClient that reconnects and restores its session when the link
+  drops
+
+  A command failing with a connection error, or timing out while a
+  get_status health check also fails, triggers a recovery: the socket is
+  reopened with jittered exponential backoff, start_link is replayed and,
+  if replay_state is True, the last wave tolerance, terascan_output
+  configuration and etalon lock set through this client are re-issued. The
+  command is then sent again if its op is in retry_ops, so callers see a
+  stall rather than an exception. Ops outside retry_ops (e.g. starting a
+  TeraScan) raise ConnectionError after the recovery, since they may or may
+  not have been carried out.
+
+  Several threads may hit the failure at once; only one of them recovers
+  and the others wait for it and then retry.
+
+  Attributes:
+    health_timeout ~ (float) Seconds allowed for the get_status health check
+    backoff_min ~ (float) Delay before the second connection attempt
+    backoff_max ~ (float) Longest delay between connection attempts
+    max_recovery ~ (float) Seconds after which a recovery gives up with
+                   ConnectionError
+    replay_state ~ (Boolean) True to re-issue the state commands on reconnect
+    retry_ops ~ (frozenset) Ops sent again after a recovery
+    session_state ~ (dict) op -> parameters of the last successful state
+                    command, re-issued in this order on reconnect
+    generation ~ (int) Number of recoveries completed
+    recoveries ~ (deque) (perf_counter start time, seconds taken, connection
+                 attempts) of the last recovery_history recoveries
+    recovery_seconds ~ (float) Total seconds taken by all recoveries
+    recovery_attempts ~ (int) Total connection attempts of all recoveries
+  """
+  def __init__(self,
+               address='192.168.1.222',
+               port=39933,
+               ip_address='192.168.1.107',
+               timeout=10.,
+               debug=False,
+               auto_output_maxlen=None,
+               health_timeout=2.,
+               backoff_min=0.1,
+               backoff_max=5.,
+               max_recovery=300.,
+               replay_state=True,
+               retry_ops=RETRY_OPS,
+               metrics=None,
+               trace=None,
+               kernel_timestamps=False,
+               recovery_history=100):
+    SolstisClient.__init__(self,address,port,ip_address,timeout,debug,
+                           auto_output_maxlen=auto_output_maxlen,
+                           metrics=metrics,trace=trace,
+                           kernel_timestamps=kernel_timestamps)
+    self.health_timeout = health_timeout
+    self.backoff_min = backoff_min
+    self.backoff_max = backoff_max
+    self.max_recovery = max_recovery
+    self.replay_state = replay_state
+    self.retry_ops = retry_ops
+    self.session_state = {}
+    self.generation = 0
+    self.recoveries = deque(maxlen=recovery_history)
+    self.recovery_seconds = 0.
+    self.recovery_attempts = 0
+    self._recover_lock = threading.Lock()
+    self._monitor = None
+    self._monitor_stop = threading.Event()
+
+  def _raw_call(self,command,params):
+    """Calls a command on the current socket without recovery"""
+    return SolstisClient._call(self,command.op,params,command.result,None,
+                               command.report)
+
+  def check(self):
+    """Health check of the link
+
+    Returns:
+      True if the Solstis answered get_status within health_timeout
+    """
+    if self.sock is None:
+      return False
+    #The link is judged on its own, not on the deadline of the caller
+    with self._without_deadline():
+      with self._cond:
+        transmission_id = self._register(None,False)
+      try:
+        #Any reply will do, so it is not decoded
+        self.send("get_status",None,transmission_id)
+        self._wait(lambda: self._take(self._replies,transmission_id),
+                   self.health_timeout)
+      except OSError:
+        return False
+      finally:
+        self._unregister((transmission_id,))
+    return True
+
+  def _drop(self):
+    if self.sock is not None:
+      try:
+        #Wakes up any thread blocked reading the old socket
+        self.sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+      #Not close(), which also closes the socket pair waking up readers
+      self.sock.close()
+      self.sock = None
+
+  def recover(self,generation=None):
+    """Reconnects, replays start_link and re-issues the session state
+
+    Parameters:
+      generation ~ (int) Value of self.generation when the failure was seen;
+                   if another thread recovered since, nothing is done
+    Returns:
+      Seconds the recovery took, 0 if another thread already recovered
+    Raises:
+      ConnectionError if the link could not be restored within max_recovery
+    """
+    with self._recover_lock, self._without_deadline():
+      if generation is not None and generation != self.generation:
+        return 0.
+      t0 = time.perf_counter()
+      delay = self.backoff_min
+      attempts = 0
+      self._drop()
+      while True:
+        attempts += 1
+        try:
+          self.connect()
+          self._raw_call(COMMANDS["start_link"],
+                         COMMANDS["start_link"].encode(self.ip_address))
+          if self.replay_state:
+            for op, params in list(self.session_state.items()):
+              self._raw_call(STATE_COMMANDS[op],params)
+          break
+        except (SolstisError,OSError) as exc:
+          self._drop()
+          #Jittered to between half and all of the current delay
+          wait = delay*random.uniform(0.5,1.)
+          if time.perf_counter() - t0 + wait > self.max_recovery:
+            raise ConnectionError("Could not reconnect to the Solstis within "+
+                                  str(self.max_recovery)+" s: "+str(exc))
+          time.sleep(wait)
+          delay = min(delay*2.,self.backoff_max)
+      elapsed = time.perf_counter() - t0
+      self.recoveries.append((t0,elapsed,attempts))
+      self.recovery_seconds += elapsed
+      self.recovery_attempts += attempts
+      self.generation += 1
+      if self.metrics is not None:
+        self.metrics.recovery()
+      return elapsed
+
+  def _retrying(self,ops):
+    if self.metrics is not None:
+      for op in ops:
+        self.metrics.retry(op)
+
+  def _failed(self,exc):
+    """Returns True if exc from a command means the link has to be recovered
+    """
+    if isinstance(exc,TimeoutError):
+      #Running out of the caller's deadline says nothing about the link
+      return not self._deadline_passed() and not self.check()
+    return isinstance(exc,OSError)
+
+  def _call(self,op,params,result,transmission_id=None,report=None):
+    while True:
+      generation = self.generation
+      try:
+        val = SolstisClient._call(self,op,params,result,transmission_id,
+                                  report)
+      except OSError as exc:
+        if not self._failed(exc):
+          raise
+      else:
+        if op in STATE_COMMANDS:
+          self.session_state.pop(op,None)
+          self.session_state[op] = params
+        return val
+      self.recover(generation)
+      if op not in self.retry_ops:
+        raise ConnectionError("The link to the Solstis was lost and "
+                              "recovered; "+op+" was not repeated")
+      self._retrying((op,))
+
+  def _call_many(self,calls):
+    while True:
+      generation = self.generation
+      try:
+        results = SolstisClient._call_many(self,calls)
+      except OSError as exc:
+        if not self._failed(exc):
+          raise
+      else:
+        if (not any(isinstance(val,TimeoutError) for val in results) or
+            self._deadline_passed() or self.check()):
+          return results
+      self.recover(generation)
+      if any(call[0] not in self.retry_ops for call in calls):
+        raise ConnectionError("The link to the Solstis was lost and "
+                              "recovered; the batch was not repeated")
+      self._retrying([call[0] for call in calls])
+
+  def _move(self,op,wavelength,poll_interval,backoff,max_interval,deadline,
+            transmission_id):
+    while True:
+      generation = self.generation
+      try:
+        return SolstisClient._move(self,op,wavelength,poll_interval,backoff,
+                                   max_interval,deadline,transmission_id)
+      except OSError as exc:
+        if not self._failed(exc):
+          raise
+      self.recover(generation)
+      self._retrying((op,))
+
+  def recv_auto_output(self,timeout=None,with_time=False):
+    if timeout is None:
+      timeout = self.timeout
+    deadline = time.perf_counter() + timeout
+    while True:
+      generation = self.generation
+      try:
+        return SolstisClient.recv_auto_output(self,
+                                              deadline - time.perf_counter(),
+                                              with_time)
+      except TimeoutError:
+        #No automatic output is normal between scans
+        raise
+      except OSError:
+        pass
+      self.recover(generation)
+      if time.perf_counter() >= deadline:
+        raise TimeoutError()
+
+  def start_monitor(self,interval=5.):
+    """Starts a background thread checking the link every interval seconds
+    and recovering it when the check fails, so drops are repaired even while
+    no command is sent
+    """
+    self._monitor_stop.clear()
+    self._monitor = threading.Thread(target=self._run_monitor,args=(interval,),
+                                     daemon=True)
+    self._monitor.start()
+
+  def stop_monitor(self):
+    """Stops the background health check thread"""
+    self._monitor_stop.set()
+    if self._monitor is not None:
+      self._monitor.join()
+      self._monitor = None
+
+  def _run_monitor(self,interval):
+    while not self._monitor_stop.wait(interval):
+      generation = self.generation
+      if not self.check():
+        try:
+          self.recover(generation)
+        except ConnectionError:
+          pass #Tried again at the next interval
+
+  def close(self):
+    """Stops the health check thread and closes the TCP connection"""
+    self.stop_monitor()
+    SolstisClient.close(self)
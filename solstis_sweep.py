@@ -0,0 +1,183 @@
+# Sweep engine stepping the Solstis through a grid of wavelengths or
+# frequencies and returning the results as a NumPy structured array
+#
+# The results are vectorized, the stepping is not: the laser can only be at
+# one setpoint, so each point is set and settled before the next is sent and
+# nothing is pipelined across points. Each point costs one round trip for
+# the set and first poll plus the settle polls. Sweep several lasers at once
+# with solstis_manager.SolstisManager.
+
+import time
+import numpy as np
+from solstis_functions import SolstisError
+
+#Speed of light in nm*GHz
+C_NM_GHZ = 299792458.
+
+#Status of each sweep point
+SWEEP_OK = 0
+SWEEP_OUT_OF_TOLERANCE = 1 #Settled, but further than tolerance from setpoint
+SWEEP_TIMEOUT = 2 #No reply, or did not settle in time
+SWEEP_ERROR = 3 #The Solstis rejected the setpoint
+
+SWEEP_DTYPE = np.dtype([("setpoint", "f8"), #In the units of the grid
+                        ("measured", "f8"), #In the units of the grid
+                        ("settle_time", "f8"), #Seconds from set to settled
+                        ("t_set", "f8"), #perf_counter time of the set
+                        ("t_measured", "f8"), #perf_counter time measured
+                        ("status", "u1")])
+
+class PollSettle:
+  """Settle policy waiting until poll_wave_m reports tuning is done
+
+  Polls start poll_interval apart and back off up to max_interval. If
+  tolerance is given the point is also only settled once the measured
+  wavelength is within tolerance (nm) of the setpoint.
+  """
+  def __init__(self,
+               poll_interval=0.002,
+               backoff=1.5,
+               max_interval=0.05,
+               deadline=30.,
+               tolerance=None):
+    self.poll_interval = poll_interval
+    self.backoff = backoff
+    self.max_interval = max_interval
+    self.deadline = deadline
+    self.tolerance = tolerance
+
+  def settled(self,wavelength,poll):
+    if not poll[1]:
+      return False
+    return self.tolerance is None or abs(poll[0]-wavelength) <= self.tolerance
+
+  def __call__(self,client,wavelength,poll):
+    """Waits for the laser to settle at wavelength
+
+    Parameters:
+      client ~ SolstisClient driving the laser
+      wavelength ~ (float) Setpoint in nm
+      poll ~ Result of the poll_wave_m sent together with the set
+    Returns:
+      The measured wavelength in nm once settled
+    Raises:
+      TimeoutError if the laser did not settle within the deadline
+    """
+    end_time = time.perf_counter() + self.deadline
+    interval = self.poll_interval
+    while not self.settled(wavelength,poll):
+      if time.perf_counter() >= end_time:
+        raise TimeoutError()
+      time.sleep(interval)
+      interval = min(interval*self.backoff,self.max_interval)
+      poll = client.poll_wave_m()
+    return poll[0]
+
+class FixedSettle:
+  """Settle policy waiting a fixed delay after each set, then measuring"""
+  def __init__(self,delay):
+    self.delay = delay
+
+  def __call__(self,client,wavelength,poll):
+    time.sleep(self.delay)
+    return client.poll_wave_m()[0]
+
+def sweep_point(client,wavelength,settle):
+  """Sets one wavelength and waits for the laser to settle there
+
+  The set_wave_m is batched with the first poll_wave_m, so the set and the
+  first settle check share one round trip.
+
+  Parameters:
+    client ~ SolstisClient driving the laser
+    wavelength ~ (float) Setpoint in nm
+    settle ~ Settle policy, see sweep
+  Returns:
+    Tuple of (measured wavelength in nm, status, t_set, t_measured) where the
+    times are perf_counter times of the set and of the measurement
+  """
+  t_set = time.perf_counter()
+  batch = client.batch()
+  batch.set_wave_m(wavelength)
+  batch.poll_wave_m()
+  set_result, poll = batch.execute()
+  status = SWEEP_OK
+  measured = np.nan
+  if isinstance(set_result,SolstisError) or isinstance(poll,SolstisError):
+    status = SWEEP_ERROR
+  elif isinstance(set_result,TimeoutError) or isinstance(poll,TimeoutError):
+    status = SWEEP_TIMEOUT
+  else:
+    try:
+      measured = settle(client,wavelength,poll)
+    except TimeoutError:
+      status = SWEEP_TIMEOUT
+    except SolstisError:
+      status = SWEEP_ERROR
+  return measured, status, t_set, time.perf_counter()
+
+def record_point(row,point,frequency=False):
+  """Stores the result of sweep_point in a row of a results array
+
+  Parameters:
+    row ~ Row of an array from new_results
+    point ~ Tuple returned by sweep_point
+    frequency ~ (Boolean) True if the grid holds frequencies in GHz
+  """
+  measured, status, t_set, t_measured = point
+  row["t_set"] = t_set
+  row["t_measured"] = t_measured
+  row["settle_time"] = t_measured - t_set
+  row["status"] = status
+  if status != SWEEP_ERROR:
+    row["measured"] = C_NM_GHZ/measured if frequency else measured
+
+def new_results(grid):
+  """Returns the results array of a sweep over grid, with every point
+  unmeasured
+  """
+  results = np.zeros(len(grid),dtype=SWEEP_DTYPE)
+  results["setpoint"] = grid
+  results["measured"] = np.nan
+  return results
+
+def check_tolerance(results,tolerance):
+  """Marks the SWEEP_OK points of results further than tolerance from
+  their setpoint as SWEEP_OUT_OF_TOLERANCE
+
+  Returns:
+    results, modified in place; unchanged if tolerance is None
+  """
+  if tolerance is not None:
+    off = ((results["status"] == SWEEP_OK) &
+           (np.abs(results["measured"] - results["setpoint"]) > tolerance))
+    results["status"][off] = SWEEP_OUT_OF_TOLERANCE
+  return results
+
+def sweep(client,grid,frequency=False,settle=None,tolerance=None):
+  """Steps the laser through a grid of setpoints, measuring each one
+
+  Each point is set with sweep_point and the settle policy then waits for the
+  laser. Rejected setpoints and timeouts are recorded in the status column
+  rather than aborting the sweep.
+
+  Parameters:
+    client ~ SolstisClient driving the laser
+    grid ~ (array) Setpoints in nm, or in GHz if frequency is True
+    frequency ~ (Boolean) True if grid holds frequencies in GHz
+    settle ~ Settle policy called as settle(client, wavelength, poll) and
+             returning the measured wavelength, PollSettle() by default
+    tolerance ~ (float) Maximum |measured - setpoint| in the units of the
+                grid for a point to count as SWEEP_OK, None to not check
+  Returns:
+    NumPy structured array of SWEEP_DTYPE with one row per setpoint
+  """
+  grid = np.asarray(grid,dtype=np.float64)
+  wavelengths = C_NM_GHZ/grid if frequency else grid
+  if settle is None:
+    settle = PollSettle()
+  results = new_results(grid)
+  for i in range(len(grid)):
+    record_point(results[i],sweep_point(client,float(wavelengths[i]),settle),
+                 frequency)
+  return check_tolerance(results,tolerance)
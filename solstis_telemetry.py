@@ -0,0 +1,550 @@
+# Telemetry acquisition from the Solstis get_status command
+
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+import numpy as np
+
+#Numeric get_status fields watched by default and the change that counts as
+#activity (in the units of the field)
+DEFAULT_THRESHOLDS = {"output_monitor": 0.01, "wavelength": 0.0001}
+
+#Lock state fields where any change counts as activity
+DEFAULT_STATES = ("etalon_lock", "cavity_lock", "ecd_lock")
+
+class AdaptivePoller:
+  """Polls get_status at a rate that follows how fast the status changes
+
+  After a sample in which a watched field changed the poll period drops to
+  min_period, and while the fields stay flat it grows by the backoff factor
+  up to max_period. Fast transients are therefore sampled in detail without
+  hammering the controller during stable periods.
+
+  Attributes:
+    client ~ Object with a get_status() method, e.g. a SolstisClient
+    min_period ~ (float) Shortest time between samples in seconds
+    max_period ~ (float) Longest time between samples in seconds
+    backoff ~ (float) Factor the period grows by after a flat sample
+    thresholds ~ (dict) Numeric field -> change that counts as activity
+    states ~ (tuple) Fields where any change counts as activity
+    period ~ (float) Current time between samples in seconds
+  """
+  def __init__(self,
+               client,
+               min_period=0.05,
+               max_period=2.,
+               backoff=1.5,
+               thresholds=None,
+               states=DEFAULT_STATES):
+    self.client = client
+    self.min_period = min_period
+    self.max_period = max_period
+    self.backoff = backoff
+    self.thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+    self.states = states
+    self.period = min_period
+    self._last = None #Status of the previous sample
+    self._next_time = None #perf_counter time of the next sample
+
+  def changed(self,status):
+    """Returns True if status differs from the previous sample"""
+    last = self._last
+    if last is None:
+      return True
+    for field, threshold in self.thresholds.items():
+      if abs(status[field] - last[field]) > threshold:
+        return True
+    for field in self.states:
+      if status[field] != last[field]:
+        return True
+    return False
+
+  def sample(self):
+    """Takes one sample now and adapts the period
+
+    Returns:
+      Tuple of (timestamp, status) where timestamp is the perf_counter time
+      halfway through the get_status round trip and status its result
+    """
+    t0 = time.perf_counter()
+    status = self.client.get_status()
+    t1 = time.perf_counter()
+    if self.changed(status):
+      self.period = self.min_period
+    else:
+      self.period = min(self.period*self.backoff,self.max_period)
+    self._last = status
+    self._next_time = t0 + self.period
+    return (t0 + t1)/2., status
+
+  def wait(self):
+    """Sleeps until the next sample is due"""
+    if self._next_time is not None:
+      remaining = self._next_time - time.perf_counter()
+      if remaining > 0:
+        time.sleep(remaining)
+
+  def __iter__(self):
+    """Yields (timestamp, status) samples forever at the adaptive rate"""
+    while True:
+      self.wait()
+      yield self.sample()
+
+  def run(self,duration=None,count=None):
+    """Collects samples for a duration in seconds or a number of samples
+
+    Returns:
+      List of (timestamp, status) tuples
+    """
+    samples = []
+    end_time = None if duration is None else time.perf_counter() + duration
+    for val in self:
+      samples.append(val)
+      if count is not None and len(samples) >= count:
+        break
+      if end_time is not None and time.perf_counter() >= end_time:
+        break
+    return samples
+
+#Fields of get_status stored by TelemetryRecorder by default. Lock states are
+#stored as their index in STATES
+RECORD_FIELDS = (("time", "<f8"),
+                 ("wavelength", "<f8"),
+                 ("temperature", "<f8"),
+                 ("etalon_voltage", "<f8"),
+                 ("resonator_voltage", "<f8"),
+                 ("ecd_voltage", "<f8"),
+                 ("output_monitor", "<f8"),
+                 ("etalon_pd_dc", "<f8"),
+                 ("etalon_lock", "u1"),
+                 ("cavity_lock", "u1"),
+                 ("ecd_lock", "u1"))
+
+STATES = ("off", "on", "debug", "error", "search", "low", "not_fitted")
+_STATE_CODES = {name: code for code, name in enumerate(STATES)}
+UNKNOWN_STATE = 255
+
+#File layout: HEADER_SIZE bytes of header followed by chunks of chunk_rows
+#rows, each chunk storing its columns one after the other
+MAGIC = b"SOLSTLM1"
+HEADER_SIZE = 4096
+_ROWS_OFFSET = 8 #Offset of the committed row count (uint64) in the header
+
+def _chunk_dtype(fields,chunk_rows):
+  return np.dtype([(name,dtype,(chunk_rows,)) for name, dtype in fields])
+
+class TelemetryRecorder:
+  """Append-only columnar binary log of get_status samples
+
+  Samples are written into a preallocated in-memory chunk of chunk_rows rows,
+  so memory use is constant and each append is O(1). flush() writes only the
+  rows added since the previous flush and then updates the committed row
+  count in the header, so a crash loses at most the unflushed rows and the
+  file never needs to be rewritten. The file can be opened with
+  TelemetryReader (memory-mapped) while it is being written, and reopening an
+  existing file continues appending to it.
+
+  Attributes:
+    path ~ (str) File written to
+    fields ~ Tuple of (name, numpy dtype) of the recorded columns
+    chunk_rows ~ (int) Rows per chunk
+    flush_every ~ (int) Rows after which flush() is called automatically
+    fsync ~ (Boolean) True to fsync on every flush for power-loss safety
+    rows ~ (int) Total number of rows appended
+  """
+  def __init__(self,
+               path,
+               fields=RECORD_FIELDS,
+               chunk_rows=4096,
+               flush_every=10,
+               fsync=False):
+    self.path = path
+    self.flush_every = flush_every
+    self.fsync = fsync
+    if os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+      self._file = open(path,'r+b')
+      header = _read_header(self._file)
+      self.fields = tuple((name,dtype) for name, dtype in header["fields"])
+      self.chunk_rows = header["chunk_rows"]
+      self.rows = header["rows"]
+    else:
+      self._file = open(path,'w+b')
+      self.fields = tuple(fields)
+      self.chunk_rows = chunk_rows
+      self.rows = 0
+      description = json.dumps({"fields": [list(f) for f in self.fields],
+                                "states": STATES}).encode('utf8')
+      if 24 + len(description) > HEADER_SIZE:
+        raise ValueError("Too many fields for the telemetry header")
+      header = bytearray(HEADER_SIZE)
+      header[0:8] = MAGIC
+      struct.pack_into("<QII",header,_ROWS_OFFSET,0,self.chunk_rows,
+                       len(description))
+      header[24:24+len(description)] = description
+      self._file.write(header)
+      self._file.flush()
+    self._dtype = _chunk_dtype(self.fields,self.chunk_rows)
+    self._chunk = np.zeros((),dtype=self._dtype)
+    self._columns = [(name,self._chunk[name],self._dtype.fields[name][1],
+                      np.dtype(dtype).itemsize)
+                     for name, dtype in self.fields]
+    self._flushed = self.rows #Rows already written to the file
+    self._index = self.rows % self.chunk_rows #Next row within the chunk
+    if self._index > 0:
+      #Resume the partially filled last chunk
+      self._file.seek(self._chunk_offset())
+      self._chunk[...] = np.frombuffer(self._file.read(self._dtype.itemsize),
+                                       dtype=self._dtype)[0]
+
+  def _chunk_offset(self,rows=None):
+    if rows is None:
+      rows = self.rows
+    return HEADER_SIZE + (rows//self.chunk_rows)*self._dtype.itemsize
+
+  def append(self,timestamp,status):
+    """Appends one get_status sample
+
+    Parameters:
+      timestamp ~ (float) Time of the sample, stored in the "time" column
+      status ~ dict returned by get_status
+    """
+    i = self._index
+    for name, column, offset, itemsize in self._columns:
+      if name == "time":
+        column[i] = timestamp
+      elif column.dtype == np.uint8:
+        column[i] = _STATE_CODES.get(status[name],UNKNOWN_STATE)
+      else:
+        column[i] = status[name]
+    self.rows += 1
+    self._index += 1
+    if self._index == self.chunk_rows:
+      self.flush()
+      self._chunk[...] = np.zeros((),dtype=self._dtype)
+      self._index = 0
+    elif self.rows - self._flushed >= self.flush_every:
+      self.flush()
+
+  def flush(self):
+    """Writes the rows appended since the last flush and commits them"""
+    if self.rows == self._flushed:
+      return
+    f = self._file
+    first = self._flushed % self.chunk_rows
+    last = self.rows - self._flushed + first
+    chunk_offset = self._chunk_offset(self._flushed)
+    if first == 0:
+      #Preallocate the whole chunk so readers can map it
+      f.truncate(chunk_offset + self._dtype.itemsize)
+    for name, column, offset, itemsize in self._columns:
+      f.seek(chunk_offset + offset + first*itemsize)
+      f.write(column[first:last].tobytes())
+    f.flush()
+    if self.fsync:
+      os.fsync(f.fileno())
+    #Commit only after the data is written
+    f.seek(_ROWS_OFFSET)
+    f.write(struct.pack("<Q",self.rows))
+    f.flush()
+    if self.fsync:
+      os.fsync(f.fileno())
+    self._flushed = self.rows
+
+  def close(self):
+    if self._file is not None:
+      self.flush()
+      self._file.close()
+      self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
+
+def _read_header(f):
+  f.seek(0)
+  header = f.read(HEADER_SIZE)
+  if header[0:8] != MAGIC:
+    raise ValueError("Not a Solstis telemetry file")
+  rows, chunk_rows, length = struct.unpack_from("<QII",header,_ROWS_OFFSET)
+  description = json.loads(header[24:24+length].decode('utf8'))
+  description["rows"] = rows
+  description["chunk_rows"] = chunk_rows
+  return description
+
+class TelemetryReader:
+  """Memory-mapped reader of a TelemetryRecorder file
+
+  Only rows committed by the writer are visible; call refresh() to pick up
+  rows written since the reader was opened.
+
+  Attributes:
+    path ~ (str) File read from
+    fields ~ Tuple of (name, numpy dtype) of the recorded columns
+    rows ~ (int) Number of committed rows at the last refresh
+  """
+  def __init__(self,path):
+    self.path = path
+    with open(path,'rb') as f:
+      header = _read_header(f)
+    self.fields = tuple((name,dtype) for name, dtype in header["fields"])
+    self.chunk_rows = header["chunk_rows"]
+    self._dtype = _chunk_dtype(self.fields,self.chunk_rows)
+    self._map = None
+    self.rows = 0
+    self.refresh()
+
+  def refresh(self):
+    """Re-reads the committed row count and remaps the file if it grew"""
+    with open(self.path,'rb') as f:
+      f.seek(_ROWS_OFFSET)
+      self.rows = struct.unpack("<Q",f.read(8))[0]
+    chunks = -(-self.rows//self.chunk_rows)
+    if chunks == 0:
+      self._map = None
+    elif self._map is None or len(self._map) < chunks:
+      self._map = np.memmap(self.path,dtype=self._dtype,mode='r',
+                            offset=HEADER_SIZE,shape=(chunks,))
+    return self.rows
+
+  def __len__(self):
+    return self.rows
+
+  def column(self,name):
+    """Returns the committed values of one column as a numpy array"""
+    if self._map is None:
+      return np.zeros(0,dtype=self._dtype.fields[name][0].base)
+    chunks = -(-self.rows//self.chunk_rows)
+    return self._map[name][:chunks].reshape(-1)[:self.rows]
+
+  def states(self,name):
+    """Returns a lock state column decoded to its names"""
+    names = np.array(STATES + ("unknown",),dtype=object)
+    codes = self.column(name).astype(int)
+    return names[np.minimum(codes,len(STATES))]
+
+#Shared memory status layout: magic, length of the JSON field description
+#and the description, then at SNAPSHOT_OFFSET the record: the sequence number
+#of the last complete write (uint64), the fields packed with struct and the
+#sequence number of the last write started (uint64)
+SNAPSHOT_MAGIC = b"SOLSSHM1"
+SNAPSHOT_OFFSET = 4096
+_SEQUENCE = struct.Struct("<Q")
+_STRUCT_CODES = {"<f8": "d", "u1": "B"}
+_MAX_RETRIES = 100000 #Reads of a record being written before giving up
+
+def _snapshot_struct(fields):
+  return struct.Struct("<Q"+"".join(_STRUCT_CODES[dtype]
+                                    for name, dtype in fields)+"Q")
+
+class StatusPublisher:
+  """Publishes the latest get_status sample in a memory-mapped file
+
+  The file holds a single record of the fields, overwritten by every
+  publish(). Writes follow a seqlock protocol: the record is framed by two
+  copies of a sequence number, the trailing one incremented before the
+  fields are written and the leading one after. StatusReader, in any number
+  of processes, unpacks the record front to back in one call without locks
+  and retries when the copies differ, i.e. when it raced with a write. Put
+  the file on a RAM backed file system (e.g. /dev/shm on Linux) so nothing
+  reaches the disk.
+
+  An existing file is reused in place rather than truncated, so readers
+  still mapping it survive a restart of the publisher; with the same fields
+  the sequence numbers carry on from the last publish.
+
+  The "time" field holds the time.time() of the sample and lock states are
+  stored as their index in STATES, as in TelemetryRecorder.
+
+  Attributes:
+    path ~ (str) File published to
+    fields ~ Tuple of (name, numpy dtype) of the published fields
+    sequence ~ (int) Number of publishes
+  """
+  def __init__(self,path,fields=RECORD_FIELDS):
+    self.path = path
+    self.fields = tuple(fields)
+    self.sequence = 0
+    self._struct = _snapshot_struct(self.fields)
+    #The fields alone: pack_into zeroes its whole range before writing, which
+    #over both sequence numbers would briefly show readers a consistent record
+    self._values = struct.Struct("<"+"".join(_STRUCT_CODES[dtype]
+                                             for name, dtype in self.fields))
+    description = json.dumps({"fields": [list(f) for f in self.fields],
+                              "states": STATES}).encode('utf8')
+    if 12 + len(description) > SNAPSHOT_OFFSET:
+      raise ValueError("Too many fields for the snapshot header")
+    size = SNAPSHOT_OFFSET + self._struct.size
+    try:
+      self._file = open(path,'r+b')
+    except FileNotFoundError:
+      self._file = open(path,'w+b')
+    #Only ever grown, shrinking the file under a reader's mapping crashes it
+    if os.fstat(self._file.fileno()).st_size < size:
+      self._file.truncate(size)
+    self._map = mmap.mmap(self._file.fileno(),size)
+    self._end = size - _SEQUENCE.size
+    if (self._map[0:8] == SNAPSHOT_MAGIC and
+        struct.unpack_from("<I",self._map,8)[0] == len(description) and
+        self._map[12:12+len(description)] == description):
+      #Past both copies, in case the last publisher died mid-write
+      self.sequence = max(_SEQUENCE.unpack_from(self._map,SNAPSHOT_OFFSET)[0],
+                          _SEQUENCE.unpack_from(self._map,self._end)[0])
+    self._map[0:8] = SNAPSHOT_MAGIC
+    struct.pack_into("<I",self._map,8,len(description))
+    self._map[12:12+len(description)] = description
+    self._getters = []
+    for name, dtype in self.fields:
+      if dtype == "u1":
+        self._getters.append(lambda status,name=name:
+                             _STATE_CODES.get(status[name],UNKNOWN_STATE))
+      else:
+        self._getters.append(lambda status,name=name: status[name])
+    self._offset = time.time() - time.perf_counter()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def publish(self,status,timestamp=None):
+    """Replaces the published record with a get_status sample
+
+    Parameters:
+      status ~ dict returned by get_status
+      timestamp ~ (float) time.time() of the sample, now if None
+    """
+    if timestamp is None:
+      timestamp = time.time()
+    values = [timestamp if name == "time" else get(status)
+              for (name, dtype), get in zip(self.fields,self._getters)]
+    self.sequence += 1
+    _SEQUENCE.pack_into(self._map,self._end,self.sequence)
+    self._values.pack_into(self._map,SNAPSHOT_OFFSET + _SEQUENCE.size,*values)
+    _SEQUENCE.pack_into(self._map,SNAPSHOT_OFFSET,self.sequence)
+
+  def run(self,poller,duration=None):
+    """Publishes the samples of a poller
+
+    Parameters:
+      poller ~ Iterable of (perf_counter timestamp, status) samples, e.g. an
+               AdaptivePoller
+      duration ~ (float) Seconds to publish for, until stop() if None
+    """
+    end_time = None if duration is None else time.perf_counter() + duration
+    for timestamp, status in poller:
+      self.publish(status,timestamp + self._offset)
+      if self._stop.is_set():
+        break
+      if end_time is not None and time.perf_counter() >= end_time:
+        break
+
+  def start(self,poller):
+    """Runs run(poller) on a background thread
+
+    Returns:
+      The publisher itself
+    """
+    self._stop.clear()
+    self._thread = threading.Thread(target=self.run,args=(poller,),
+                                    daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    """Stops the background thread after its current sample"""
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def close(self):
+    self.stop()
+    if self._map is not None:
+      self._map.close()
+      self._file.close()
+      self._map = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
+
+class StatusReader:
+  """Reader of the status published by a StatusPublisher
+
+  Reads copy the record straight from the shared mapping, with no system
+  call or network traffic.
+
+  Attributes:
+    path ~ (str) File read from
+    fields ~ Tuple of (name, numpy dtype) of the published fields
+  """
+  def __init__(self,path):
+    self.path = path
+    with open(path,'rb') as f:
+      header = f.read(SNAPSHOT_OFFSET)
+      if header[0:8] != SNAPSHOT_MAGIC:
+        raise ValueError("Not a Solstis status snapshot file")
+      length = struct.unpack_from("<I",header,8)[0]
+      description = json.loads(header[12:12+length].decode('utf8'))
+      self.fields = tuple((name,dtype) for name, dtype in
+                          description["fields"])
+      self._struct = _snapshot_struct(self.fields)
+      self._map = mmap.mmap(f.fileno(),SNAPSHOT_OFFSET + self._struct.size,
+                            access=mmap.ACCESS_READ)
+    self._unpack = self._struct.unpack_from
+    self._names = tuple(name for name, dtype in self.fields)
+    self._states = tuple(dtype == "u1" for name, dtype in self.fields)
+
+  def read_raw(self):
+    """Returns a consistent copy of the record
+
+    Returns:
+      Tuple of (sequence number, field values..., sequence number) with lock
+      states as their index in STATES; the sequence number is 0 if nothing
+      was published yet
+    """
+    values = self._unpack(self._map,SNAPSHOT_OFFSET)
+    if values[0] == values[-1]:
+      return values
+    for i in range(_MAX_RETRIES):
+      values = self._unpack(self._map,SNAPSHOT_OFFSET)
+      if values[0] == values[-1]:
+        return values
+    raise TimeoutError("The status snapshot stayed mid-write, "
+                       "did the publisher crash while writing?")
+
+  def read(self):
+    """Returns the latest status as a dict like get_status, with "time" the
+    time.time() of the sample and lock states by name, None if nothing was
+    published yet
+    """
+    values = self.read_raw()
+    if values[0] == 0:
+      return None
+    status = {}
+    for name, is_state, val in zip(self._names,self._states,values[1:-1]):
+      if is_state:
+        val = STATES[val] if val < len(STATES) else "unknown"
+      status[name] = val
+    return status
+
+  def age(self):
+    """Returns the seconds since the published sample, None if there is none
+    """
+    values = self.read_raw()
+    if values[0] == 0 or "time" not in self._names:
+      return None
+    return time.time() - values[self._names.index("time") + 1]
+
+  def close(self):
+    self._map.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
@@ -0,0 +1,169 @@
+# Background capture of TeraScan automatic output
+
+import time
+import threading
+import numpy as np
+
+#Statuses of automatic_output messages, stored as their index
+AUTO_STATUSES = ("start", "repeat", "recover", "scan", "end")
+_STATUS_CODES = {name: code for code, name in enumerate(AUTO_STATUSES)}
+UNKNOWN_STATUS = 255
+
+class TeraScanCapture:
+  """Drains TeraScan automatic_output messages on a background thread
+
+  Every message is stored with the time it was read from the socket into
+  preallocated arrays that double in size when full, so acquisition does no
+  per-message allocation, printing or waiting on user code. If the scan was
+  configured with pause on, terascan_continue is sent from the capture thread
+  after every "start" or "repeat" message. Consumers read the data with
+  snapshot(), read_new() or by iterating over the capture.
+
+  Attributes:
+    client ~ SolstisClient receiving the automatic output
+    pause ~ (Boolean) True to send terascan_continue after "start"/"repeat"
+    continue_delay ~ (float) Seconds to wait before each terascan_continue
+    stop_wavelength ~ (float) Capture ends after an "end" message at or
+                      beyond this wavelength, None to run until stop()
+    error ~ Exception that ended the capture thread, None otherwise
+  """
+  def __init__(self,
+               client,
+               capacity=4096,
+               pause=False,
+               continue_delay=0.,
+               stop_wavelength=None,
+               poll_timeout=0.5):
+    self.client = client
+    self.pause = pause
+    self.continue_delay = continue_delay
+    self.stop_wavelength = stop_wavelength
+    self.poll_timeout = poll_timeout
+    self.error = None
+    self._wavelength = np.empty(capacity,dtype=np.float64)
+    self._status = np.empty(capacity,dtype=np.uint8)
+    self._time = np.empty(capacity,dtype=np.float64)
+    self._count = 0
+    self._read = 0 #Samples already returned by read_new
+    self._cond = threading.Condition()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def start(self):
+    """Starts the capture thread
+
+    Returns:
+      The capture itself
+    """
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run,daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    """Stops the capture thread and waits for it to finish"""
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def __enter__(self):
+    if self._thread is None:
+      self.start()
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.stop()
+
+  @property
+  def running(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  def wait(self,timeout=None):
+    """Waits for the capture to end, returns True if it has"""
+    if self._thread is not None:
+      self._thread.join(timeout)
+    return not self.running
+
+  def _append(self,recv_time,wavelength,status):
+    with self._cond:
+      n = self._count
+      if n == len(self._time):
+        self._wavelength = np.concatenate((self._wavelength,
+                                           np.empty_like(self._wavelength)))
+        self._status = np.concatenate((self._status,
+                                       np.empty_like(self._status)))
+        self._time = np.concatenate((self._time,np.empty_like(self._time)))
+      self._wavelength[n] = wavelength
+      self._status[n] = _STATUS_CODES.get(status,UNKNOWN_STATUS)
+      self._time[n] = recv_time
+      self._count = n + 1
+      self._cond.notify_all()
+
+  def _run(self):
+    try:
+      while not self._stop.is_set():
+        try:
+          recv_time, val = self.client.recv_auto_output(self.poll_timeout,
+                                                        with_time=True)
+        except TimeoutError:
+          continue
+        status = val["status"]
+        self._append(recv_time,val["wavelength"],status)
+        if self.pause and (status == "start" or status == "repeat"):
+          if self.continue_delay > 0:
+            time.sleep(self.continue_delay)
+          self.client.terascan_continue()
+        if (status == "end" and self.stop_wavelength is not None and
+            val["wavelength"] >= self.stop_wavelength):
+          break
+    except Exception as exc:
+      self.error = exc
+    finally:
+      with self._cond:
+        self._cond.notify_all()
+
+  def __len__(self):
+    return self._count
+
+  def snapshot(self):
+    """Returns copies of all samples captured so far
+
+    Returns:
+      Tuple of numpy arrays (time, wavelength, status) where time is the
+      perf_counter receive time and status the index into AUTO_STATUSES
+    """
+    with self._cond:
+      n = self._count
+      return (self._time[:n].copy(),self._wavelength[:n].copy(),
+              self._status[:n].copy())
+
+  def read_new(self):
+    """Returns copies of the samples captured since the previous call
+
+    Returns:
+      Tuple of numpy arrays (time, wavelength, status), see snapshot
+    """
+    with self._cond:
+      first = self._read
+      n = self._count
+      self._read = n
+      return (self._time[first:n].copy(),self._wavelength[first:n].copy(),
+              self._status[first:n].copy())
+
+  def __iter__(self):
+    """Yields (time, wavelength, status name) of every sample as it arrives
+
+    Iteration ends once the capture has stopped and all samples were yielded.
+    """
+    i = 0
+    while True:
+      with self._cond:
+        while i >= self._count and self.running:
+          self._cond.wait(self.poll_timeout)
+        if i >= self._count:
+          return
+        sample = (self._time[i],self._wavelength[i],self._status[i])
+      i += 1
+      status = (AUTO_STATUSES[sample[2]] if sample[2] < len(AUTO_STATUSES)
+                else "unknown")
+      yield float(sample[0]), float(sample[1]), status
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+# Always-on trace of the messages exchanged with a Solstis, kept in a binary
+# ring buffer file, and the offline tool decoding it:
+#   client = SolstisClient(address,port,trace=WireTrace("solstis.trace"))
+#   python3 solstis_trace.py solstis.trace --frames
+
+import os
+import sys
+import time
+import struct
+import argparse
+import threading
+from solstis_replay import SENT, RECEIVED
+
+MAGIC = b"SOLTRACE"
+BLOCK_MAGIC = b"SOLTRCBK"
+_HEADER = struct.Struct("<8sII") #Magic, block size, number of blocks
+#Magic, sequence number, time.time() - perf_counter(), bytes of records
+_BLOCK = struct.Struct("<8sQdI")
+#perf_counter time, direction, length of the op, length of the frame stored
+_RECORD = struct.Struct("<dBBH")
+
+class WireTrace:
+  """Binary ring buffer trace of every frame sent and received
+
+  Records are appended to an in-memory block of block_size bytes which is
+  written to its slot of the file when full, so tracing a message costs a
+  struct pack and a copy rather than a write. The file holds blocks blocks;
+  once they are all used the oldest is overwritten, bounding the file at
+  about blocks*block_size bytes. The partly filled block is also written by
+  flush(), close() and whenever flush_interval seconds passed since the last
+  write, so a crash loses at most that much of the trace.
+
+  Each record holds the perf_counter time, direction (SENT or RECEIVED), op
+  and, if payload is True, the frame itself (truncated to 65535 bytes and to
+  what fits in a block, so block_size must leave room for a record). Each
+  block stores the offset from perf_counter to time.time(), so the decoder
+  gives wall clock times.
+
+  Attributes:
+    path ~ (str) Trace file
+    block_size ~ (int) Bytes per block
+    blocks ~ (int) Number of blocks in the ring
+    payload ~ (Boolean) True to store the frames, False for the ops only
+    flush_interval ~ (float) Longest time in seconds records stay in memory
+  """
+  def __init__(self,
+               path,
+               block_size=65536,
+               blocks=1024,
+               payload=True,
+               flush_interval=1.):
+    if block_size < _BLOCK.size + _RECORD.size + 255:
+      raise ValueError("block_size must be at least "+
+                       str(_BLOCK.size + _RECORD.size + 255)+
+                       " bytes to hold a record")
+    self.path = path
+    self.block_size = block_size
+    self.blocks = blocks
+    self.payload = payload
+    self.flush_interval = flush_interval
+    self._fd = os.open(path,os.O_RDWR | os.O_CREAT | os.O_TRUNC,0o644)
+    os.write(self._fd,_HEADER.pack(MAGIC,block_size,blocks))
+    self._lock = threading.Lock()
+    self._sequence = 0
+    self._block = bytearray()
+    self._offset = time.time() - time.perf_counter()
+    self._written = time.perf_counter()
+    self._ops = {} #op -> encoded op
+
+  def record(self,direction,op,frame,t=None):
+    """Appends one frame to the trace
+
+    Parameters:
+      direction ~ SENT or RECEIVED
+      op ~ (str) op of the message
+      frame ~ bytes of the message
+      t ~ (float) perf_counter time of the transfer, now if None
+    """
+    if t is None:
+      t = time.perf_counter()
+    name = self._ops.get(op)
+    if name is None:
+      name = self._ops[op] = op.encode('utf8')[:255]
+    if self.payload:
+      #A record never spans blocks
+      data = frame[:min(65535,self.block_size - _BLOCK.size - _RECORD.size -
+                        len(name))]
+    else:
+      data = b''
+    size = _RECORD.size + len(name) + len(data)
+    with self._lock:
+      if self._fd is None:
+        return
+      if _BLOCK.size + len(self._block) + size > self.block_size:
+        self._write_block()
+        self._sequence += 1
+        self._block = bytearray()
+        self._offset = time.time() - time.perf_counter()
+      self._block += _RECORD.pack(t,direction,len(name),len(data))
+      self._block += name
+      self._block += data
+      if t - self._written > self.flush_interval:
+        self._write_block()
+
+  def sent(self,op,frame):
+    self.record(SENT,op,frame)
+
+  def received(self,op,frame,recv_time=None):
+    self.record(RECEIVED,op,frame,recv_time)
+
+  def _write_block(self):
+    """Writes the current block to its slot, must hold self._lock"""
+    block = _BLOCK.pack(BLOCK_MAGIC,self._sequence,self._offset,
+                        len(self._block)) + self._block
+    os.pwrite(self._fd,block,
+              _HEADER.size + (self._sequence % self.blocks)*self.block_size)
+    self._written = time.perf_counter()
+
+  def flush(self):
+    """Writes the records held in memory to the file"""
+    with self._lock:
+      if self._fd is not None and len(self._block) > 0:
+        self._write_block()
+
+  def close(self):
+    """Flushes and closes the trace file"""
+    with self._lock:
+      if self._fd is not None:
+        if len(self._block) > 0:
+          self._write_block()
+        os.close(self._fd)
+        self._fd = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,exc_type,exc_value,traceback):
+    self.close()
+
+def read_trace(path):
+  """Decodes a trace file written by WireTrace
+
+  Returns:
+    List of (time.time() of the transfer, perf_counter time, direction, op,
+    frame) tuples in order of time, frame being b'' if payloads were off
+  """
+  with open(path,'rb') as f:
+    data = f.read()
+  magic, block_size, blocks = _HEADER.unpack_from(data,0)
+  if magic != MAGIC:
+    raise ValueError("Not a Solstis trace file")
+  found = []
+  for i in range(blocks):
+    start = _HEADER.size + i*block_size
+    if start + _BLOCK.size > len(data):
+      break
+    magic, sequence, offset, used = _BLOCK.unpack_from(data,start)
+    if magic == BLOCK_MAGIC:
+      found.append((sequence,offset,start + _BLOCK.size,used))
+  records = []
+  for sequence, offset, start, used in sorted(found):
+    pos = start
+    end = min(start + used,len(data))
+    while pos + _RECORD.size <= end:
+      t, direction, op_len, frame_len = _RECORD.unpack_from(data,pos)
+      pos += _RECORD.size
+      op = data[pos:pos+op_len].decode('utf8','replace')
+      pos += op_len
+      frame = data[pos:pos+frame_len]
+      pos += frame_len
+      records.append((t + offset,t,direction,op,frame))
+  return records
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Decodes a Solstis wire trace")
+  parser.add_argument("path")
+  parser.add_argument("--frames",action="store_true",
+                      help="Print the frames as well as the ops")
+  parser.add_argument("--op",action="append",default=None,
+                      help="Only print messages of this op (repeatable)")
+  parser.add_argument("--last",type=int,default=None,
+                      help="Only print the last LAST messages")
+  args = parser.parse_args(argv)
+  records = read_trace(args.path)
+  if args.op is not None:
+    records = [val for val in records if val[3] in args.op]
+  if args.last is not None:
+    records = records[-args.last:]
+  previous = None
+  for wall, t, direction, op, frame in records:
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S",time.localtime(wall))
+    stamp += ("%.6f" % (wall % 1))[1:]
+    delta = 0. if previous is None else (t - previous)*1e3
+    previous = t
+    line = "%s %+10.3f ms %s %s" % (stamp,delta,
+                                    ">" if direction == SENT else "<",op)
+    if args.frames:
+      line += " "+frame.decode('utf8','replace')
+    print(line)
+
+if __name__ == "__main__":
+  try:
+    main()
+  except BrokenPipeError:
+    sys.exit(1)
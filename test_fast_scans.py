@@ -3,14 +3,13 @@
 
 import time
 from solstis_functions import *
-import numpy as np
+from solstis_fastscan import plan_tiles, run_tiles
 import matplotlib.pyplot as plt
 
 #User Parameters
 START_WAVELEN = 775.5
 END_WAVELEN = 780.5
-GHZ_SPACING = 200
-SCAN_SPACING = 200
+SCAN_SPACING = 200 #Width of each fast scan in GHz
 SCAN_TIME = 0.01
 
 #Create Function to convert between nm and GHz
@@ -29,39 +28,24 @@ start_link(sock)
 #Set the tolerance for the Solstis to increase execution speed
 set_wave_tolerance_m(sock,tolerance=0.01)
 
-#Create the list of center points about which to scan
-freqs = np.arange(nm_to_ghz(START_WAVELEN),nm_to_ghz(END_WAVELEN),GHZ_SPACING)
-
-#Create plotting variables
-wavelens = [[0,0]]*len(freqs)
-times = [[0,0]]*len(freqs)
+#Plan the fast scan windows covering the range. Neighbouring windows overlap
+#by at least 10% of the scan width
+plan = plan_tiles(START_WAVELEN,END_WAVELEN,SCAN_SPACING,
+                  scan_type="etalon_continuous",overlap=0.1,
+                  duration=SCAN_TIME)
+print("Scanning",len(plan),"tiles with",plan.overlap,"GHz overlap")
 
 init_time = time.perf_counter()
 
-for i in range(len(freqs)):
-  set_wave_m_f_r(sock,ghz_to_nm(freqs[i]))
-  fast_scan_start(sock,scan_type="etalon_continuous",width=SCAN_SPACING,
-                  time=SCAN_TIME)
-  #Wait to confirm fast scan has started
-  while True:
-    val = fast_scan_poll(sock,scan_type="etalon_continuous")
-    if val[1] == False:
-      break
-
-  wavelens[i][0] = ghz_to_nm(freqs[i]-SCAN_SPACING/2)
-  times[i][0] = time.perf_counter() - init_time
-
-  #Wait for scan to end
-  while True:
-    val = fast_scan_poll(sock,scan_type="etalon_continuous")
-    if val[1] == False:
-      break
-
-  wavelens[i][1] = ghz_to_nm(freqs[i]-SCAN_SPACING/2)
-  times[i][1] = time.perf_counter() - init_time
-
+#Run the tiles. The tune to the next centre is already under way while each
+#finished tile is plotted as the planned window over the time it was scanned
 plt.figure()
-for i in range(len(freqs)):
-  plot( (times[i][0],times[i][1]),(wavelens[i][0],wavelens[i][1]) )
-
+for trace in run_tiles(client_for(sock),plan):
+  plt.plot((trace.t_start - init_time,trace.t_end - init_time),
+           (ghz_to_nm(trace.tile["low_ghz"]),ghz_to_nm(trace.tile["high_ghz"])))
+  print("Tile",trace.index,"dead time",trace.t_start - trace.t_tune,
+        "tuner readings",len(trace.tuner))
+
+plt.xlabel('Time (s)')
+plt.ylabel('Wavelength (nm)')
 plt.show()
@@ -7,8 +7,9 @@ import time
 import numpy as np
 import matplotlib.pyplot as plt
 
-#Initialize socket
+#Initialize socket, timestamping replies with their arrival in the kernel
 sock = init_socket()
+client_for(sock).use_kernel_timestamps()
 
 #Start Link
 start_link(sock)
@@ -30,7 +31,7 @@ while True:
     break
   
   wavelength = np.append(wavelength,val["wavelength"])
-  times = np.append(times,time.perf_counter()-init_time)
+  times = np.append(times,client_for(sock).last_recv_time()-init_time)
 
 fig, ax = plt.subplots()
 ax.plot(times,wavelength,'bo')
@@ -3,6 +3,7 @@
 # pausing
 
 from solstis_functions import *
+from solstis_terascan import TeraScanCapture
 import time
 import numpy as np
 import matplotlib.pyplot as plt
@@ -14,8 +15,10 @@ START = 777.5
 STOP = 779.5
 FILE_SUFFIX = "scan_15"
 
-#Initialize socket
+#Initialize socket, timestamping the automatic output with its arrival in the
+#kernel
 sock = init_socket()
+client_for(sock).use_kernel_timestamps()
 
 #Start Link
 start_link(sock)
@@ -32,27 +35,27 @@ terascan_output(sock,
                 update_step=1,
                 pause=PAUSE)
 
-#Variables for later graphing
-times = np.array([])
-wavelength = np.array([])
+#Capture the automatic output on a background thread, which also sends the
+#terascan_continue commands when pausing
+capture = TeraScanCapture(client_for(sock),
+                          pause=PAUSE,
+                          continue_delay=PAUSE_DELAY,
+                          stop_wavelength=STOP).start()
 init_time = time.perf_counter()
 
 #Start the scan
 scan_stitch_op(sock, TeraScan.SCAN_TYPE_FINE, "start")
 
-while True:
-  try:
-    val = recv_auto_output(sock)
-  except:
-    break
-  print("status: ",val["status"])
-  wavelength = np.append(wavelength,val["wavelength"])
-  times = np.append(times,time.perf_counter()-init_time)
-  if val["status"] == "end" and val["wavelength"] >= STOP:
-    break
-  if PAUSE==True and (val["status"] == "start" or val["status"] == "repeat"):
-    time.sleep(PAUSE_DELAY)
-    terascan_continue(sock,transmission_id=1)
+for t, val, status in capture:
+  print("status: ",status)
+capture.stop()
+
+#A read error ends the capture early, leaving the data truncated
+if capture.error is not None:
+  print("Capture ended early, the data is incomplete:",repr(capture.error))
+
+times, wavelength, status = capture.snapshot()
+times -= init_time
 
 fig, ax = plt.subplots()
 ax.plot(times,wavelength,'bo')
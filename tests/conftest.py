@@ -0,0 +1,20 @@
+# Fixtures running the tests against the local controller simulator
+
+import pytest
+from solstis_sim import SolstisSimulator
+from solstis_functions import SolstisClient
+
+@pytest.fixture
+def sim():
+  """Simulator tuning quickly, so moves finish within a test"""
+  with SolstisSimulator(port=0,tune_rate=1000.,settle_time=0.) as sim:
+    yield sim
+
+@pytest.fixture
+def client(sim):
+  """SolstisClient with its link to sim started"""
+  client = SolstisClient('127.0.0.1',sim.port,'127.0.0.1',timeout=2.)
+  client.connect()
+  client.start_link()
+  yield client
+  client.close()
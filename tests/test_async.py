@@ -0,0 +1,50 @@
+# AsyncSolstisClient against the simulator
+
+import time
+import asyncio
+import pytest
+from solstis_async import AsyncSolstisClient
+
+def _run(coroutine):
+  return asyncio.run(asyncio.wait_for(coroutine,10.))
+
+def test_concurrent_commands(sim):
+  async def main():
+    async with AsyncSolstisClient('127.0.0.1',sim.port,'127.0.0.1',
+                                  timeout=2.) as client:
+      await client.start_link()
+      results = await asyncio.gather(*[client.poll_wave_m()
+                                       for i in range(20)])
+      assert all(val[0] == pytest.approx(780.) for val in results)
+  _run(main())
+
+def test_late_report_of_timed_out_move_is_dropped(sim):
+  sim.tune_rate = 50.
+  async def main():
+    async with AsyncSolstisClient('127.0.0.1',sim.port,'127.0.0.1',
+                                  timeout=0.1) as client:
+      await client.start_link()
+      with pytest.raises(asyncio.TimeoutError):
+        await client.set_wave_m_f_r(800.)
+      client.timeout = 2.
+      #The report of the 800 nm move comes during this move and is dropped
+      assert await client.set_wave_m_f_r(790.) == pytest.approx(790.,abs=1.)
+      await asyncio.sleep(0.5)
+      assert len(client._abandoned) == 0
+  _run(main())
+
+def test_failed_link_wakes_recv_auto_output(sim):
+  async def main():
+    client = AsyncSolstisClient('127.0.0.1',sim.port,'127.0.0.1',timeout=5.)
+    await client.connect()
+    waiters = [asyncio.ensure_future(client.recv_auto_output())
+               for i in range(2)]
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    client._writer.transport.abort()
+    for waiter in waiters:
+      with pytest.raises(ConnectionError):
+        await waiter
+    assert time.perf_counter() - t0 < 1.
+    await client.close()
+  _run(main())
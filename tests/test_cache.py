@@ -0,0 +1,73 @@
+# CachedClient single-flight coalescing against the simulator
+
+import threading
+import pytest
+from solstis_functions import SolstisError
+from solstis_cache import CachedClient
+
+def _count_requests(monkeypatch,sim,op):
+  counts = []
+  handler = getattr(sim,"_op_"+op)
+  def counted(conn,transmission_id,params):
+    counts.append(transmission_id)
+    return handler(conn,transmission_id,params)
+  monkeypatch.setattr(sim,"_op_"+op,counted)
+  return counts
+
+def test_concurrent_callers_share_one_request(monkeypatch,sim,client):
+  sim.latency = 0.05
+  requests = _count_requests(monkeypatch,sim,"get_status")
+  cache = CachedClient(client,ttl=1.)
+  barrier = threading.Barrier(8)
+  results = []
+  def run():
+    barrier.wait()
+    results.append(cache.get_status())
+  threads = [threading.Thread(target=run) for i in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(requests) == 1
+  assert cache.misses == 1
+  assert cache.coalesced + cache.hits == 7
+  assert all(val == results[0] for val in results)
+  #Served from the cache within the TTL
+  value, age = cache.fetch("get_status")
+  assert len(requests) == 1
+  assert 0 <= age < 1.
+
+def test_max_age_and_invalidation(monkeypatch,sim,client):
+  requests = _count_requests(monkeypatch,sim,"poll_wave_m")
+  cache = CachedClient(client,ttl=10.)
+  cache.poll_wave_m()
+  cache.poll_wave_m()
+  assert len(requests) == 1
+  cache.fetch("poll_wave_m",max_age=0)
+  assert len(requests) == 2
+  #Any other command may change the status and clears the cache
+  cache.set_wave_m(781.)
+  assert cache.age("poll_wave_m") is None
+  wavelength, done = cache.poll_wave_m()
+  assert len(requests) == 3
+
+def test_errors_reach_every_waiter(sim,client):
+  sim.latency = 0.05
+  sim.errors["get_status"] = 1
+  cache = CachedClient(client)
+  barrier = threading.Barrier(4)
+  errors = []
+  def run():
+    barrier.wait()
+    try:
+      cache.get_status()
+    except Exception as exc:
+      errors.append(exc)
+  threads = [threading.Thread(target=run) for i in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(errors) == 4
+  assert all(isinstance(exc,SolstisError) for exc in errors)
+  assert cache.age("get_status") is None
@@ -0,0 +1,106 @@
+# Dispatch of replies, final reports and automatic output by SolstisClient
+
+import time
+import socket
+import threading
+import pytest
+from solstis_functions import (SolstisClient, FrameDecoder, TeraScan,
+                               encode_message, decode_message)
+
+def test_concurrent_threads_get_their_own_replies(sim,client):
+  sim.latency_jitter = 0.002
+  errors = []
+  def run(i):
+    try:
+      for j in range(20):
+        if i % 2:
+          assert client.get_status()["wavelength"] == pytest.approx(780.)
+        else:
+          wavelength, done = client.poll_wave_m()
+          assert wavelength == pytest.approx(780.)
+    except Exception as exc:
+      errors.append(exc)
+  threads = [threading.Thread(target=run,args=(i,)) for i in range(6)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert errors == []
+  assert client._replies == {}
+
+def test_commands_during_terascan_output(sim,client):
+  client.scan_stitch_initialize(TeraScan.SCAN_TYPE_FINE,780.,780.02,
+                                TeraScan.SCAN_RATE_FINE_LINE_5_GHZ)
+  client.terascan_output(operation=True,delay=1,update_step=1,pause=False)
+  client.scan_stitch_op(TeraScan.SCAN_TYPE_FINE,"start")
+  try:
+    for i in range(5):
+      assert "status" in client.recv_auto_output(2.)
+      #Automatic output arriving meanwhile is queued, not taken as a reply
+      assert client.get_status()["wavelength"] > 0
+  finally:
+    client.scan_stitch_op(TeraScan.SCAN_TYPE_FINE,"stop")
+
+def test_replies_out_of_order():
+  a, b = socket.socketpair()
+  client = SolstisClient(sock=a,timeout=2.)
+  try:
+    batch = client.batch()
+    for i in range(4):
+      batch.poll_wave_m()
+    def reply():
+      #Answers the four requests in reverse order
+      decoder = FrameDecoder()
+      ids = []
+      while len(ids) < 4:
+        decoder.feed(b.recv(4096))
+        ids.extend(decode_message(frame)["message"]["transmission_id"][0]
+                   for frame in decoder)
+      for n, transmission_id in enumerate(reversed(ids)):
+        b.sendall(encode_message("poll_wave_m_reply",
+                                 {"status": [0],
+                                  "current_wavelength": [780. + n]},
+                                 transmission_id))
+    thread = threading.Thread(target=reply)
+    thread.start()
+    results = batch.execute(raise_errors=True)
+    thread.join()
+    assert [val[0] for val in results] == [783.,782.,781.,780.]
+  finally:
+    client.close()
+    b.close()
+
+def _delay_final_reports(monkeypatch,sim,delay):
+  final_report = sim._final_report
+  def delayed(conn,transmission_id,move_id):
+    time.sleep(delay)
+    final_report(conn,transmission_id,move_id)
+  monkeypatch.setattr(sim,"_final_report",delayed)
+
+def _drain(client,timeout=0.3):
+  #Reads the stream for a while, dispatching any late report
+  with pytest.raises(TimeoutError):
+    client.recv_auto_output(timeout)
+
+def test_late_report_of_polled_move_is_dropped(monkeypatch,sim,client):
+  sim.tune_rate = 50.
+  _delay_final_reports(monkeypatch,sim,0.15)
+  #Resolved by poll before its report arrives
+  assert client.start_set_wave_m(781.,poll_interval=0.005).result() == \
+    pytest.approx(781.,abs=1.)
+  #The late report of the first move must not complete this one
+  assert client.set_wave_m_f_r(800.) == pytest.approx(800.,abs=1.)
+  _drain(client)
+  assert len(client._abandoned) == 0
+  assert len(client.final_reports) == 0
+
+def test_late_report_of_timed_out_move_is_dropped(monkeypatch,sim,client):
+  sim.tune_rate = 50.
+  _delay_final_reports(monkeypatch,sim,0.1)
+  with pytest.raises(TimeoutError):
+    with client.deadline(0.05):
+      client.set_wave_m_f_r(790.)
+  assert client.set_wave_m_f_r(780.) == pytest.approx(780.,abs=1.)
+  _drain(client)
+  assert len(client._abandoned) == 0
+  assert len(client.final_reports) == 0
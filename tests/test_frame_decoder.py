@@ -0,0 +1,47 @@
+# Splitting of the TCP stream into messages by FrameDecoder
+
+import json
+import pytest
+from solstis_functions import FrameDecoder, SolstisError, decode_message
+
+#Strings with braces, escaped quotes and backslashes and multi-byte UTF-8
+TRICKY = ["{", "}", "}{", "\"}", "\\", "\\\"{", "µm {é}", ""]
+
+def _messages():
+  return [json.dumps({"message": {"transmission_id": [i],
+                                  "op": "get_status_reply",
+                                  "parameters": {"note": val,
+                                                 "nested": {"a": [val]}}}},
+                     ensure_ascii=False).encode('utf8')
+          for i, val in enumerate(TRICKY)]
+
+@pytest.mark.parametrize("chunk_size",[1,2,3,7,4096])
+def test_fragmented_stream(chunk_size):
+  messages = _messages()
+  data = b" \r\n".join(messages)
+  decoder = FrameDecoder()
+  frames = []
+  for i in range(0,len(data),chunk_size):
+    decoder.feed(data[i:i+chunk_size])
+    frames.extend(decoder)
+  assert frames == messages
+  assert [decode_message(f)["message"]["parameters"]["note"]
+          for f in frames] == TRICKY
+
+def test_invalid_data_between_messages():
+  decoder = FrameDecoder()
+  decoder.feed(b'{"a": 1} garbage {"b": 2}')
+  assert decoder.next_frame() == b'{"a": 1}'
+  with pytest.raises(SolstisError):
+    decoder.next_frame()
+  assert decoder.next_frame() is None
+
+def test_recv_frame_from_simulator_byte_by_byte(sim,client):
+  sim.fragment_size = 1
+  for i in range(3):
+    status = client.get_status()
+    assert status["wavelength"] == pytest.approx(780.)
+  batch = client.batch()
+  for i in range(5):
+    batch.poll_wave_m()
+  assert len(batch.execute(raise_errors=True)) == 5
@@ -0,0 +1,80 @@
+# SolstisProxy sharing one simulator link between several clients
+
+import time
+import threading
+import pytest
+from solstis_functions import SolstisClient, TeraScan
+from solstis_proxy import SolstisProxy
+
+@pytest.fixture
+def proxy(sim):
+  proxy = SolstisProxy('127.0.0.1',sim.port,listen_port=0,
+                       ip_address='127.0.0.1',timeout=2.,
+                       report_timeout=5.).start()
+  yield proxy
+  proxy.stop()
+
+def _connect(proxy):
+  client = SolstisClient('127.0.0.1',proxy.listen_port,'127.0.0.1',
+                         timeout=2.)
+  client.connect()
+  client.start_link()
+  return client
+
+def test_clients_reusing_transmission_ids(proxy):
+  clients = [_connect(proxy) for i in range(3)]
+  errors = []
+  def run(i,client):
+    try:
+      #Every client uses the same IDs; a reply routed to the wrong client
+      #would fail verify_msg on its op
+      for j in range(30):
+        if i == 0:
+          client.get_status(transmission_id=7)
+        elif i == 1:
+          client.poll_wave_m(transmission_id=7)
+        else:
+          client.scan_stitch_status(TeraScan.SCAN_TYPE_MEDIUM,
+                                    transmission_id=7)
+    except Exception as exc:
+      errors.append(exc)
+  threads = [threading.Thread(target=run,args=(i,client))
+             for i, client in enumerate(clients)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  for client in clients:
+    client.close()
+  assert errors == []
+  assert proxy._pending == {}
+
+def test_report_of_disconnected_client_is_dropped(sim,proxy):
+  sim.tune_rate = 20.
+  a = _connect(proxy)
+  b = _connect(proxy)
+  a.send("set_wave_m",{"wavelength": [790.],"report": "finished"})
+  time.sleep(0.1)
+  a.close()
+  time.sleep(0.1)
+  #The report of a's move arrives during b's and must not complete it
+  assert b.set_wave_m_f_r(800.) == pytest.approx(800.,abs=1.)
+  b.close()
+
+def test_unreceived_report_expires(sim,proxy):
+  sim.tune_rate = 20.
+  proxy.report_timeout = 0.2
+  client = _connect(proxy)
+  client.send("set_wave_m",{"wavelength": [790.],"report": "finished"})
+  time.sleep(0.4)
+  with proxy._cond:
+    assert proxy._reports == {}
+    assert len(proxy._abandoned) == 1
+  time.sleep(0.4)
+  #The late report was dropped rather than passed on
+  with pytest.raises(TimeoutError):
+    client.recv_auto_output(0.1)
+  assert len(client.final_reports) == 0
+  with proxy._cond:
+    assert len(proxy._abandoned) == 0
+  client.close()
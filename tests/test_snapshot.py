@@ -0,0 +1,86 @@
+# Seqlock protected status snapshot shared between processes
+
+import os
+import sys
+import time
+import subprocess
+import pytest
+from solstis_telemetry import (StatusPublisher, StatusReader, RECORD_FIELDS,
+                               AdaptivePoller)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Publishes records whose numeric fields all hold the sequence number, so a
+#torn read shows as fields that differ
+_WRITER = """
+import sys, time
+from solstis_telemetry import StatusPublisher, RECORD_FIELDS
+publisher = StatusPublisher(sys.argv[1])
+status = {name: "on" for name, dtype in RECORD_FIELDS}
+print("ready", flush=True)
+end = time.perf_counter() + float(sys.argv[2])
+n = 0
+while time.perf_counter() < end:
+  n += 1
+  for name, dtype in RECORD_FIELDS:
+    if dtype != "u1":
+      status[name] = float(n)
+  publisher.publish(status,float(n))
+publisher.close()
+"""
+
+def test_reads_are_never_torn(tmp_path):
+  path = str(tmp_path/"status.snap")
+  env = dict(os.environ,PYTHONPATH=ROOT)
+  writer = subprocess.Popen([sys.executable,"-c",_WRITER,path,"1.0"],
+                            stdout=subprocess.PIPE,env=env)
+  try:
+    assert writer.stdout.readline().strip() == b"ready"
+    reader = StatusReader(path)
+    numeric = [i + 1 for i, (name, dtype) in enumerate(reader.fields)
+               if dtype != "u1"]
+    reads = 0
+    last = 0
+    while writer.poll() is None:
+      values = reader.read_raw()
+      assert values[0] == values[-1]
+      assert len(set(values[i] for i in numeric)) == 1
+      assert values[0] >= last #Never goes back in time
+      last = values[0]
+      reads += 1
+    reader.close()
+  finally:
+    writer.wait(5.)
+  assert writer.returncode == 0
+  assert reads > 1000
+  assert last > 0
+
+def test_publishes_simulator_status(tmp_path,client):
+  path = str(tmp_path/"status.snap")
+  with StatusPublisher(path) as publisher:
+    with StatusReader(path) as reader:
+      assert reader.read() is None
+      timestamp, status = AdaptivePoller(client).sample()
+      publisher.publish(status)
+      published = reader.read()
+      assert published["wavelength"] == status["wavelength"]
+      assert published["etalon_lock"] == status["etalon_lock"]
+      assert reader.age() < 1.
+
+def test_restarted_publisher_keeps_readers(tmp_path,client):
+  path = str(tmp_path/"status.snap")
+  status = client.get_status()
+  publisher = StatusPublisher(path)
+  publisher.publish(status)
+  publisher.publish(status)
+  publisher.close()
+  reader = StatusReader(path)
+  #The file is reused in place and the sequence carries on
+  publisher = StatusPublisher(path)
+  assert publisher.sequence == 2
+  assert reader.read_raw()[0] == 2
+  publisher.publish(status)
+  assert reader.read_raw()[0] == 3
+  assert reader.read()["wavelength"] == status["wavelength"]
+  publisher.close()
+  reader.close()
@@ -0,0 +1,49 @@
+# TelemetryRecorder commits and TelemetryReader visibility
+
+import numpy as np
+from solstis_telemetry import (TelemetryRecorder, TelemetryReader,
+                               AdaptivePoller)
+
+def _samples(client,count):
+  poller = AdaptivePoller(client,min_period=0.,max_period=0.)
+  return poller.run(count=count)
+
+def test_only_committed_rows_are_visible(tmp_path,client):
+  path = str(tmp_path/"log.tlm")
+  samples = _samples(client,10)
+  recorder = TelemetryRecorder(path,chunk_rows=4,flush_every=100)
+  reader = TelemetryReader(path)
+  for t, status in samples[:6]:
+    recorder.append(t,status)
+  #A full chunk is flushed, the rest of the rows are still in memory
+  assert reader.refresh() == 4
+  recorder.flush()
+  assert reader.refresh() == 6
+  for t, status in samples[6:]:
+    recorder.append(t,status)
+  recorder.close()
+  assert reader.refresh() == 10
+  assert np.array_equal(reader.column("time"),[t for t, val in samples])
+  assert np.array_equal(reader.column("wavelength"),
+                        [val["wavelength"] for t, val in samples])
+  assert list(reader.states("etalon_lock")) == \
+    [val["etalon_lock"] for t, val in samples]
+
+def test_crash_loses_only_unflushed_rows(tmp_path,client):
+  path = str(tmp_path/"log.tlm")
+  samples = _samples(client,12)
+  recorder = TelemetryRecorder(path,chunk_rows=8,flush_every=3)
+  for t, status in samples[:5]:
+    recorder.append(t,status)
+  #Dies without flushing rows 4 and 5
+  recorder._file.close()
+  recorder._file = None
+  recorder = TelemetryRecorder(path)
+  assert recorder.rows == 3
+  for t, status in samples[5:]:
+    recorder.append(t,status)
+  recorder.close()
+  reader = TelemetryReader(path)
+  assert len(reader) == 10
+  expected = [t for t, val in samples[:3] + samples[5:]]
+  assert np.array_equal(reader.column("time"),expected)
@@ -0,0 +1,42 @@
+# WireTrace ring buffer wrap-around and read_trace decoding
+
+import os
+import pytest
+from solstis_functions import SolstisClient
+from solstis_trace import WireTrace, read_trace, SENT, RECEIVED
+
+def test_ring_keeps_newest_records(tmp_path,sim):
+  path = str(tmp_path/"wire.trace")
+  trace = WireTrace(path,block_size=512,blocks=3,flush_interval=60.)
+  client = SolstisClient('127.0.0.1',sim.port,'127.0.0.1',timeout=2.,
+                         trace=trace)
+  client.connect()
+  client.start_link()
+  for i in range(50):
+    client.poll_wave_m()
+  client.close()
+  trace.close()
+  #The ring wrapped many times but the file stays at its bound
+  assert os.path.getsize(path) <= 16 + 3*512 #Header and three blocks
+  records = read_trace(path)
+  times = [t for wall, t, direction, op, frame in records]
+  assert times == sorted(times)
+  #Only the newest blocks survive, ending with the last exchange
+  assert len(records) < 100
+  assert records[-2][2:4] == (SENT,"poll_wave_m")
+  assert records[-1][2:4] == (RECEIVED,"poll_wave_m_reply")
+  assert records[-1][4].startswith(b"{")
+
+def test_oversized_frame_is_truncated(tmp_path):
+  path = str(tmp_path/"wire.trace")
+  with WireTrace(path,block_size=512,blocks=2) as trace:
+    trace.sent("big",b"x"*2000)
+    trace.sent("small",b"y"*10)
+  records = read_trace(path)
+  assert [op for wall, t, direction, op, frame in records] == ["big","small"]
+  assert 0 < len(records[0][4]) < 512
+  assert records[1][4] == b"y"*10
+
+def test_block_must_hold_a_record(tmp_path):
+  with pytest.raises(ValueError):
+    WireTrace(str(tmp_path/"wire.trace"),block_size=256)